@@ -0,0 +1,4 @@
+# benchmarks/__init__.py
+
+# Офлайн-бенчмарки бота: синтетические данные, поддельный Bot API и сценарии обновлений.
+# Запуск: python -m benchmarks.run --help
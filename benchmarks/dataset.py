@@ -0,0 +1,88 @@
+# benchmarks/dataset.py
+
+import random
+from utils.navigation import ROOT_NODE, new_node
+from utils.storage.base import new_user, empty_document
+
+# id чатов синтетических пользователей начинаются отсюда
+FIRST_USER_ID = 10_000_000
+
+# Типы файлов и их доли в синтетических данных
+FILE_TYPES = (("text", 6), ("document", 2), ("photo", 2), ("video", 1), ("audio", 1))
+
+WORDS = ("папка", "файл", "отчёт", "заметка", "данные", "список", "план", "идея", "фото", "архив")
+
+
+def user_ids(users):
+    """id чатов синтетических пользователей (как числа)."""
+    return [FIRST_USER_ID + number for number in range(users)]
+
+
+def _text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def _record(rng, text_size, short_ids):
+    file_type = rng.choices([name for name, weight in FILE_TYPES], [weight for name, weight in FILE_TYPES])[0]
+    short_id = f"{rng.getrandbits(32):08x}"
+    while short_id in short_ids:
+        short_id = f"{rng.getrandbits(32):08x}"
+    short_ids.add(short_id)
+    if file_type == "text":
+        return {"type": "text", "content": _text(rng, text_size), "short_id": short_id}
+    record = {"type": file_type, "file_id": f"BENCH{rng.getrandbits(64):016x}", "short_id": short_id}
+    if file_type == "document":
+        record["file_name"] = f"{rng.choice(WORDS)}-{short_id}.pdf"
+    return record
+
+
+def generate_user(rng, depth, fanout, files_per_folder, text_size):
+    """Пользователь с деревом папок глубины depth по fanout подпапок и files_per_folder файлами в каждой."""
+    user = new_user()
+    nodes = user["nodes"]
+    short_ids = set()
+    level = [ROOT_NODE]
+    for remaining in range(depth, -1, -1):
+        next_level = []
+        for node_id in level:
+            node = nodes[str(node_id)]
+            for _ in range(files_per_folder):
+                record = _record(rng, text_size, short_ids)
+                node["files"].append(record)
+                if record.get("file_id"):
+                    user["file_mappings"][record["short_id"]] = record["file_id"]
+            if not remaining:
+                continue
+            for number in range(fanout):
+                child_id = user["next_node"]
+                user["next_node"] += 1
+                name = f"{rng.choice(WORDS)} {number + 1}"
+                nodes[str(child_id)] = new_node(child_id, node_id, name)
+                node["folders"][name] = child_id
+                next_level.append(child_id)
+        level = next_level
+    return user
+
+
+def generate_document(users=100, depth=3, fanout=3, files_per_folder=5, text_size=200, shares=10, seed=0):
+    """
+    Документ {"users": ..., "shared_folders": ...} для import_document:
+    users пользователей с одинаковой формой дерева и shares публичных папок у случайных владельцев.
+    """
+    rng = random.Random(seed)
+    document = empty_document()
+    for user_id in user_ids(users):
+        document["users"][str(user_id)] = generate_user(rng, depth, fanout, files_per_folder, text_size)
+    owners = list(document["users"])
+    for _ in range(shares if owners else 0):
+        owner_id = rng.choice(owners)
+        node_id = rng.choice(list(document["users"][owner_id]["nodes"].values()))["id"]
+        key = f"{rng.getrandbits(128):032x}"
+        document["shared_folders"][key] = {"user_id": owner_id, "node": node_id}
+    return document
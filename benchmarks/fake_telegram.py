@@ -0,0 +1,104 @@
+# benchmarks/fake_telegram.py
+
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from telebot import apihelper, types
+
+
+class FakeResponse:
+    """Ответ Bot API в том виде, в каком его читает apihelper._check_result."""
+
+    status_code = 200
+    reason = "OK"
+
+    def __init__(self, result):
+        self._json = {"ok": True, "result": result}
+        self.text = json.dumps(self._json)
+
+    def json(self):
+        return self._json
+
+
+class FakeTelegram:
+    """
+    Подмена HTTP-запросов TeleBot (apihelper.CUSTOM_REQUEST_SENDER): запрос не уходит в сеть,
+    а записывается и получает правдоподобный ответ через latency секунд.
+    Считает вызовы по методам Bot API и байты отправленных параметров.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.request_bytes = 0
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def __call__(self, method, url, params=None, files=None, **kwargs):
+        name = url.rsplit("/", 1)[1]
+        size = sum(len(str(value)) for value in (params or {}).values())
+        with self._lock:
+            self.calls[name] += 1
+            self.request_bytes += size
+            message_id = next(self._message_ids)
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(self._result(name, params or {}, message_id))
+
+    def _result(self, name, params, message_id):
+        if name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if name.startswith(("send", "edit", "copy", "forward")):
+            message = {"message_id": message_id, "date": 0,
+                       "chat": {"id": int(params.get("chat_id", 0)), "type": "private"}}
+            if name == "sendMediaGroup":
+                return [message]
+            return message
+        return True
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def install(self):
+        self._previous = apihelper.CUSTOM_REQUEST_SENDER
+        apihelper.CUSTOM_REQUEST_SENDER = self
+
+    def uninstall(self):
+        apihelper.CUSTOM_REQUEST_SENDER = self._previous
+
+
+class UpdateFactory:
+    """Синтетические обновления Telegram: сообщения, команды и нажатия кнопок."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _message(self, chat_id, **fields):
+        message = {"message_id": next(self._ids), "date": 0,
+                   "chat": {"id": chat_id, "type": "private"},
+                   "from": {"id": chat_id, "is_bot": False, "first_name": "bench"}}
+        message.update(fields)
+        return message
+
+    def _update(self, **fields):
+        return types.Update.de_json({"update_id": next(self._ids), **fields})
+
+    def text(self, chat_id, text):
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._update(message=self._message(chat_id, **fields))
+
+    def document(self, chat_id, file_id, file_name):
+        document = {"file_id": file_id, "file_unique_id": file_id[-16:], "file_name": file_name}
+        return self._update(message=self._message(chat_id, document=document))
+
+    def callback(self, chat_id, data):
+        query = {"id": str(next(self._ids)), "chat_instance": "bench", "data": data,
+                 "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+                 "message": self._message(chat_id)}
+        return self._update(callback_query=query)
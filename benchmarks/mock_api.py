@@ -0,0 +1,306 @@
+# benchmarks/mock_api.py
+
+import email
+import email.policy
+import hashlib
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from utils.sender import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые пишут в чат: на них действуют лимиты отправки, и они считаются ответом бота
+SEND_PREFIXES = ("send", "copy", "forward", "edit")
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "mock", "username": "mock_bot"}
+# Файлы отдаются кусками такого размера
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _param_int(params, name, default=0):
+    try:
+        return int(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class MockBotApi:
+    """
+    Локальный Bot API для нагрузочных прогонов: бот подключается к нему через
+    apihelper.API_URL (см. api_url) и получает обновления из push() методом getUpdates.
+    Методы отправки, answerCallbackQuery и editMessageReplyMarkup отвечают правдоподобными
+    объектами. Лимиты Telegram (global_rate сообщений в секунду на бота, chat_rate в личный
+    чат и group_rate в группу) проверяются ведрами токенов; превышение — ответ 429 с
+    retry_after, до истечения которого чат остаётся заблокированным. error_rate — доля
+    случайных 429 на любые методы, кроме getUpdates.
+    Для каждого обновления запоминается время до первого ответа бота: answerCallbackQuery
+    для нажатия кнопки, первое сообщение в чат для остальных.
+    getFile отвечает для любого file_id, а сам файл (file_size байт, или размер из file_sizes)
+    отдаётся по file_url потоком псевдослучайных байтов. Загруженные ботом файлы
+    запоминаются в uploads как (метод, имя, байты).
+    """
+
+    def __init__(self, host="127.0.0.1", port=8081, latency=0.0, global_rate=30, chat_rate=1.0,
+                 chat_burst=3, group_rate=20 / 60, group_burst=3, error_rate=0.0, seed=0,
+                 file_size=64 * 1024, file_sizes=None):
+        self.host = host
+        self.file_size = file_size
+        self.file_sizes = dict(file_sizes or {})
+        self.uploads = []
+        self.downloaded = 0
+        self.latency = latency
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.response_times = []
+        self._random = random.Random(seed)
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates = deque()
+        # Выданные боту обновления, ждущие ответа: по чатам и по id нажатий кнопок
+        self._waiting_chats = {}
+        self._waiting_queries = {}
+        self.delivered = 0
+        self.last_call = time.monotonic()
+        self._condition = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def api_url(self):
+        """Значение для apihelper.API_URL (и TELEGRAM_API_URL в config.py)."""
+        return f"http://{self.host}:{self.port}/bot{{0}}/{{1}}"
+
+    @property
+    def file_url(self):
+        """Значение для apihelper.FILE_URL (и TELEGRAM_FILE_URL в config.py)."""
+        return f"http://{self.host}:{self.port}/file/bot{{0}}/{{1}}"
+
+    def file_content(self, file_id):
+        """Байты файла file_id кусками: одинаковые при каждом скачивании."""
+        size = self.file_sizes.get(file_id, self.file_size)
+        block = hashlib.sha256(file_id.encode("utf-8")).digest() * (DOWNLOAD_CHUNK_SIZE // 32)
+        for offset in range(0, size, DOWNLOAD_CHUNK_SIZE):
+            yield block[:min(DOWNLOAD_CHUNK_SIZE, size - offset)]
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _download(self, file_path):
+                file_id = file_path.rpartition("/")[2]
+                size = api.file_sizes.get(file_id, api.file_size)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                for chunk in api.file_content(file_id):
+                    self.wfile.write(chunk)
+                with api._condition:
+                    api.calls["download"] += 1
+                    api.downloaded += size
+
+            def _respond(self):
+                url = urlsplit(self.path)
+                if url.path.startswith("/file/bot"):
+                    self._download(url.path.split("/", 3)[3])
+                    return
+                prefix, _, method = url.path.rpartition("/")
+                if not prefix.startswith("/bot"):
+                    self.send_error(404)
+                    return
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    params.update(api.parse_body(self.headers.get("Content-Type", ""), self.rfile.read(length), method))
+                status, body = api.call(method, params)
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, format, *args):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def parse_body(self, content_type, body, method=None):
+        """Параметры запроса из тела: JSON, форма или multipart (файлы складываются в uploads)."""
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        if content_type.startswith("multipart/form-data"):
+            message = email.message_from_bytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body,
+                                               policy=email.policy.HTTP)
+            params = {}
+            for part in message.get_payload():
+                if part.get_filename() is None:
+                    params[part.get_param("name", header="content-disposition")] = part.get_payload(decode=True).decode("utf-8")
+                else:
+                    with self._condition:
+                        self.uploads.append((method, part.get_filename(), part.get_payload(decode=True)))
+            return params
+        return dict(parse_qsl(body.decode("utf-8")))
+
+    # Очередь обновлений
+
+    def push(self, update):
+        """Ставит обновление в очередь getUpdates (update_id назначается заново)."""
+        update = dict(update, update_id=next(self._update_ids))
+        with self._condition:
+            self._updates.append(update)
+            self._condition.notify_all()
+
+    def pending(self):
+        """Сколько обновлений ещё не подтверждено ботом (offset в getUpdates)."""
+        with self._condition:
+            return len(self._updates)
+
+    def unanswered(self):
+        with self._condition:
+            return len(self._waiting_queries) + sum(len(waiting) for waiting in self._waiting_chats.values())
+
+    def _get_updates(self, params):
+        offset = _param_int(params, "offset")
+        limit = _param_int(params, "limit", 100) or 100
+        deadline = time.monotonic() + float(params.get("timeout", 0) or 0)
+        with self._condition:
+            # Обновления до offset бот уже получил
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    break
+            batch = list(itertools.islice(self._updates, limit))
+            now = time.monotonic()
+            for update in batch:
+                if update.get("_delivered"):
+                    continue
+                update["_delivered"] = now
+                self.delivered += 1
+                query = update.get("callback_query")
+                if query is not None:
+                    self._waiting_queries[query["id"]] = now
+                else:
+                    message = update.get("message") or update.get("edited_message")
+                    if message is not None:
+                        self._waiting_chats.setdefault(message["chat"]["id"], deque()).append(now)
+        return [{key: value for key, value in update.items() if key != "_delivered"} for update in batch]
+
+    # Ответы бота
+
+    def _answered(self, method, params, now):
+        with self._condition:
+            if method == "answerCallbackQuery":
+                delivered = self._waiting_queries.pop(params.get("callback_query_id"), None)
+            elif method.startswith(SEND_PREFIXES):
+                waiting = self._waiting_chats.get(_param_int(params, "chat_id"))
+                delivered = waiting.popleft() if waiting else None
+            else:
+                delivered = None
+            if delivered is not None:
+                self.response_times.append(now - delivered)
+
+    def _throttle(self, method, params, now):
+        """retry_after в секундах, если запрос нужно отклонить с 429, иначе 0."""
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 1
+        if not method.startswith(SEND_PREFIXES):
+            return 0
+        chat_id = _param_int(params, "chat_id")
+        with self._condition:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = (TokenBucket(self.group_rate, self.group_burst) if chat_id < 0
+                          else TokenBucket(self.chat_rate, self.chat_burst))
+                self._chats[chat_id] = bucket
+            wait = max(bucket.delay(now), self._global.delay(now))
+            if wait > 0:
+                retry_after = int(wait) + 1
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+                return retry_after
+            bucket.take()
+            self._global.take()
+        return 0
+
+    def _message(self, params):
+        chat_id = _param_int(params, "chat_id")
+        return {"message_id": next(self._message_ids), "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}
+
+    def call(self, method, params):
+        """Выполняет метод Bot API; возвращает (HTTP-статус, тело ответа)."""
+        if method == "getUpdates":
+            with self._condition:
+                self.calls[method] += 1
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        now = time.monotonic()
+        with self._condition:
+            self.calls[method] += 1
+            self.last_call = now
+        if self.latency:
+            time.sleep(self.latency)
+        retry_after = self._throttle(method, params, now)
+        if retry_after:
+            with self._condition:
+                self.throttled[method] += 1
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {retry_after}",
+                         "parameters": {"retry_after": retry_after}}
+        self._answered(method, params, time.monotonic())
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "sendMediaGroup":
+            result = [self._message(params) for _ in json.loads(params.get("media", "[]"))]
+        elif method == "getFile":
+            file_id = params.get("file_id", "")
+            result = {"file_id": file_id, "file_unique_id": file_id[-16:],
+                      "file_size": self.file_sizes.get(file_id, self.file_size), "file_path": f"files/{file_id}"}
+        elif method.startswith("edit") and "inline_message_id" in params:
+            result = True
+        elif method.startswith(SEND_PREFIXES):
+            result = self._message(params)
+        else:
+            # answerCallbackQuery, deleteMessage, deleteWebhook, setMyCommands, ...
+            result = True
+        return 200, {"ok": True, "result": result}
+
+    def idle_for(self):
+        """Сколько секунд не было запросов, кроме getUpdates."""
+        with self._condition:
+            return time.monotonic() - self.last_call
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-bot-api", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        # Отпускаем висящие long polling запросы
+        with self._condition:
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,140 @@
+# benchmarks/replay.py
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from telebot import apihelper
+from benchmarks.mock_api import MockBotApi
+from benchmarks.run import create_storage_in, percentile
+from utils import data_manager
+from utils.capture import read_capture
+from utils.keyboards import clear_markup_cache
+from utils.sessions import clear_sessions
+from utils.storage.text_store import TextStore
+
+logger = logging.getLogger(__name__)
+
+
+def feed(api, capture, speed, limit=None):
+    """Отдаёт записанные обновления в getUpdates с исходными интервалами, ускоренными в speed раз."""
+    started = time.monotonic()
+    count = 0
+    for offset, update in read_capture(capture):
+        if limit is not None and count >= limit:
+            break
+        if speed > 0:
+            delay = started + offset / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        api.push(update)
+        count += 1
+    return count
+
+
+def wait_drained(api, quiet):
+    """Ждёт, пока бот заберёт все обновления и quiet секунд не будет запросов к API."""
+    while api.pending() or api.idle_for() < quiet:
+        time.sleep(0.1)
+
+
+def start_bot_in_process(api, backend, directory):
+    """Бот из bot.py на временном хранилище, опрашивающий api; возвращает функцию остановки."""
+    # bot.py читает config при импорте — импортируем, только когда бот нужен в этом процессе
+    from bot import create_bot, shutdown
+
+    apihelper.API_URL = api.api_url
+    apihelper.FILE_URL = api.file_url
+    data_manager.set_storage(create_storage_in(backend, directory))
+    data_manager.set_text_store(TextStore(os.path.join(directory, "texts")))
+    clear_markup_cache()
+    clear_sessions()
+    bot, dispatcher, jobs = create_bot(jobs_dir=os.path.join(directory, "jobs"))
+    polling = threading.Thread(target=bot.infinity_polling, name="replay-polling",
+                               kwargs={"timeout": 10, "long_polling_timeout": 1})
+    polling.start()
+
+    def stop():
+        bot.stop_polling()
+        polling.join()
+        shutdown(dispatcher, jobs=jobs)
+
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений (CAPTURE_FILE) "
+                                                 "через локальный Bot API")
+    parser.add_argument("capture", help="Файл записи (gzip, одна строка JSON на обновление)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Ускорение относительно записи (1–100; 0 — без пауз)")
+    parser.add_argument("--limit", type=int, help="Воспроизвести не больше стольких обновлений")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес локального Bot API")
+    parser.add_argument("--port", type=int, default=8081, help="Порт локального Bot API (0 — любой свободный)")
+    parser.add_argument("--external", action="store_true",
+                        help="Не запускать бота в этом процессе: он подключается сам через TELEGRAM_API_URL")
+    parser.add_argument("--backend", default="json",
+                        help="Хранилище бота в этом процессе (временное): json, journal, sharded, sqlite")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа Bot API, мс")
+    parser.add_argument("--global-rate", type=float, default=30, help="Лимит сообщений в секунду на бота")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="Лимит сообщений в секунду в личный чат")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля случайных ответов 429")
+    parser.add_argument("--quiet", type=float, default=2.0,
+                        help="Прогон закончен, когда столько секунд нет запросов к API")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+    if args.speed < 0:
+        parser.error("--speed не может быть отрицательным")
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    api = MockBotApi(host=args.host, port=args.port, latency=args.latency / 1000,
+                     global_rate=args.global_rate, chat_rate=args.chat_rate, error_rate=args.error_rate)
+    api.start()
+    stop_bot = None
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if args.external:
+                print(f"Локальный Bot API: TELEGRAM_API_URL = \"{api.api_url}\", "
+                      f"TELEGRAM_FILE_URL = \"{api.file_url}\"")
+            else:
+                stop_bot = start_bot_in_process(api, args.backend, directory)
+            started = time.monotonic()
+            count = feed(api, args.capture, args.speed, args.limit)
+            wait_drained(api, args.quiet)
+            # Время тишины в конце не входит в длительность прогона
+            elapsed = max(time.monotonic() - started - args.quiet, 1e-9)
+        finally:
+            if stop_bot is not None:
+                stop_bot()
+            api.shutdown()
+
+    times = sorted(api.response_times)
+    result = {
+        "updates": count,
+        "seconds": elapsed,
+        "throughput": count / elapsed,
+        "answered": len(times),
+        "unanswered": api.unanswered(),
+        "p50_ms": percentile(times, 0.5) * 1000,
+        "p99_ms": percentile(times, 0.99) * 1000,
+        "max_ms": (times[-1] if times else 0.0) * 1000,
+        "calls": dict(api.calls),
+        "throttled": dict(api.throttled),
+    }
+    print(f"Обновлений: {count} за {elapsed:.2f} с ({result['throughput']:.1f}/с), "
+          f"с ответом: {result['answered']}, без ответа: {result['unanswered']}")
+    print(f"Время до первого ответа, мс: p50 {result['p50_ms']:.1f}, p99 {result['p99_ms']:.1f}, "
+          f"макс {result['max_ms']:.1f}")
+    for method, calls in sorted(api.calls.items(), key=lambda item: -item[1]):
+        print(f"  {method:<24} {calls:>8}  429: {api.throttled.get(method, 0)}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# benchmarks/run.py
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import telebot
+import config
+from benchmarks.dataset import generate_document, user_ids
+from benchmarks.fake_telegram import FakeTelegram, UpdateFactory
+from benchmarks.scenarios import SCENARIOS, take_inventory
+from handlers.command_handlers import register_command_handlers
+from handlers.callback_handlers import register_callback_handlers
+from handlers.message_handlers import register_message_handlers
+from utils import data_manager
+from utils.dispatch import ChatDispatcher
+from utils.keyboards import clear_markup_cache
+from utils.sessions import clear_sessions
+from utils.storage import create_storage
+from utils.storage.text_store import TextStore
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def create_storage_in(backend, directory):
+    """Хранилище backend в каталоге directory с теми же параметрами, что и у бота."""
+    if backend == "sqlite":
+        return create_storage(backend, os.path.join(directory, "data.sqlite3"))
+    if backend == "journal":
+        return create_storage(backend, os.path.join(directory, "data.json"),
+                              fsync=data_manager.JOURNAL_FSYNC,
+                              format=data_manager.SNAPSHOT_FORMAT,
+                              compression=data_manager.SNAPSHOT_COMPRESSION,
+                              flush_interval=data_manager.COMPACT_INTERVAL,
+                              flush_max_mutations=data_manager.COMPACT_MAX_MUTATIONS)
+    if backend == "sharded":
+        return create_storage(backend, os.path.join(directory, "shards"),
+                              cache_size=data_manager.SHARD_CACHE_SIZE,
+                              flush_interval=data_manager.FLUSH_INTERVAL,
+                              flush_max_mutations=data_manager.FLUSH_MAX_MUTATIONS)
+    return create_storage(backend, os.path.join(directory, "data.json"),
+                          format=data_manager.SNAPSHOT_FORMAT,
+                          compression=data_manager.SNAPSHOT_COMPRESSION,
+                          flush_interval=data_manager.FLUSH_INTERVAL,
+                          flush_max_mutations=data_manager.FLUSH_MAX_MUTATIONS)
+
+
+def bytes_written():
+    """Байты, записанные процессом (Linux, /proc/self/io); None, если узнать нельзя."""
+    try:
+        with open("/proc/self/io", 'r') as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def peak_rss():
+    """Пиковый объём резидентной памяти процесса в байтах; None, если узнать нельзя."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def run_scenario(name, args):
+    """Прогоняет сценарий на свежем наборе данных и возвращает словарь с результатами."""
+    rng = random.Random(args.seed)
+    fake = FakeTelegram(args.latency / 1000)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = create_storage_in(args.backend, directory)
+        data_manager.set_storage(storage)
+        data_manager.set_text_store(TextStore(os.path.join(directory, "texts")))
+        clear_markup_cache()
+        clear_sessions()
+        try:
+            document = generate_document(users=args.users, depth=args.depth, fanout=args.fanout,
+                                         files_per_folder=args.files, text_size=args.text_size,
+                                         shares=args.shares, seed=args.seed)
+            storage.import_document(document)
+            # Импорт не должен попасть в замер записи
+            data_manager.flush_storage()
+            inventory = take_inventory(user_ids(args.users), list(document["shared_folders"]))
+            updates = SCENARIOS[name](inventory, args.updates, UpdateFactory(), rng)
+
+            fake.install()
+            bot = telebot.TeleBot(config.BOT_TOKEN, threaded=False)
+            register_command_handlers(bot)
+            register_callback_handlers(bot)
+            register_message_handlers(bot)
+
+            latencies = []
+            latencies_lock = threading.Lock()
+            process = bot.process_new_updates
+
+            def timed_process(batch):
+                started = time.perf_counter()
+                process(batch)
+                elapsed = time.perf_counter() - started
+                with latencies_lock:
+                    latencies.append(elapsed)
+
+            bot.process_new_updates = timed_process
+            written = bytes_written()
+            started = time.perf_counter()
+            if args.workers > 0:
+                dispatcher = ChatDispatcher(bot, args.workers)
+                bot.process_new_updates(updates)
+                dispatcher.close()
+            else:
+                for update in updates:
+                    timed_process([update])
+            elapsed = time.perf_counter() - started
+        finally:
+            # Сброс отложенной записи входит в «записано байт»
+            data_manager.close_storage()
+            fake.uninstall()
+        if written is not None:
+            written = bytes_written() - written
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "backend": args.backend,
+        "updates": len(updates),
+        "seconds": elapsed,
+        "throughput": len(updates) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "api_calls": fake.total_calls(),
+        "bytes_written": written,
+        "peak_rss": peak_rss(),
+    }
+
+
+def format_size(size):
+    if size is None:
+        return "—"
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк обработчиков бота на синтетических данных")
+    parser.add_argument("scenarios", nargs="*", default=["mixed"],
+                        help=f"Сценарии: {', '.join(SCENARIOS)} (по умолчанию mixed)")
+    parser.add_argument("--backend", default="json", help="Тип хранилища: json, journal, sharded, sqlite")
+    parser.add_argument("--users", type=int, default=200, help="Число пользователей")
+    parser.add_argument("--depth", type=int, default=3, help="Глубина дерева папок")
+    parser.add_argument("--fanout", type=int, default=3, help="Подпапок в каждой папке")
+    parser.add_argument("--files", type=int, default=5, help="Файлов в каждой папке")
+    parser.add_argument("--text-size", type=int, default=200, help="Длина текстовых записей")
+    parser.add_argument("--shares", type=int, default=20, help="Число публичных папок")
+    parser.add_argument("--updates", type=int, default=5000, help="Обновлений в сценарии")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа Bot API, мс")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Потоков обработки (ChatDispatcher); 0 — последовательно в одном потоке")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора данных")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    results = []
+    print(f"{'сценарий':<10} {'обновл.':>8} {'обн./с':>9} {'p50, мс':>9} {'p99, мс':>9} {'макс, мс':>9} "
+          f"{'запросов':>9} {'записано':>10} {'пик RSS':>9}")
+    for name in args.scenarios:
+        result = run_scenario(name, args)
+        results.append(result)
+        print(f"{name:<10} {result['updates']:>8} {result['throughput']:>9.0f} {result['p50_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['max_ms']:>9.2f} {result['api_calls']:>9} "
+              f"{format_size(result['bytes_written']):>10} {format_size(result['peak_rss']):>9}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/scenarios.py
+
+from utils.data_manager import get_current_node, get_node, get_share
+from utils import callback_codec as codec
+
+# Сценарий — функция (inventory, count, factory, rng) -> список обновлений.
+# inventory описывает данные, уже загруженные в хранилище (id узлов берутся из него,
+# потому что SQLite назначает свои id при импорте).
+
+
+def take_inventory(user_ids, share_keys):
+    """Корневые папки пользователей и публичные папки: id узлов, подпапок и short_id файлов."""
+    users = []
+    for chat_id in user_ids:
+        user_id = str(chat_id)
+        root = get_node(user_id, get_current_node(user_id))
+        users.append({"chat_id": chat_id, "root": root["id"],
+                      "children": list(root["folders"].values()),
+                      "files": [record["short_id"] for record in root["files"]]})
+    shares = []
+    for key in share_keys:
+        shared = get_share(key)
+        node = get_node(shared["user_id"], shared["node"])
+        shares.append({"key": key, "node": node["id"],
+                       "children": list(node["folders"].values()),
+                       "files": [record["short_id"] for record in node["files"]]})
+    return {"users": users, "shares": shares}
+
+
+def save(inventory, count, factory, rng):
+    """Сохранение текстов и документов в текущую папку."""
+    updates = []
+    for number in range(count):
+        user = rng.choice(inventory["users"])
+        if number % 4:
+            updates.append(factory.text(user["chat_id"], f"заметка {number} " + "x" * rng.randint(10, 300)))
+        else:
+            updates.append(factory.document(user["chat_id"], f"BENCHDOC{number:012d}", f"файл-{number}.pdf"))
+    return updates
+
+
+def mkdir(inventory, count, factory, rng):
+    """Создание папок командой /mkdir."""
+    return [factory.text(rng.choice(inventory["users"])["chat_id"], f"/mkdir новая {number}")
+            for number in range(count)]
+
+
+def browse(inventory, count, factory, rng):
+    """Навигация по личным папкам: /getmydata, вход в подпапку, листание, выход наверх."""
+    steps = {}
+    updates = []
+    users = [user for user in inventory["users"] if user["children"]]
+    while users and len(updates) < count:
+        user = rng.choice(users)
+        step = steps.get(user["chat_id"], 0)
+        steps[user["chat_id"]] = (step + 1) % 4
+        chat_id = user["chat_id"]
+        if step == 0:
+            updates.append(factory.text(chat_id, "/getmydata"))
+        elif step == 1:
+            user["current"] = rng.choice(user["children"])
+            updates.append(factory.callback(chat_id, codec.encode(codec.FOLDER, user["current"])))
+        elif step == 2:
+            updates.append(factory.callback(chat_id, codec.encode(codec.PAGE, user["current"], 0)))
+        else:
+            updates.append(factory.callback(chat_id, codec.encode(codec.UP)))
+    return updates
+
+
+def files(inventory, count, factory, rng):
+    """Отправка отдельных файлов кнопками."""
+    users = [user for user in inventory["users"] if user["files"]]
+    updates = []
+    for _ in range(count if users else 0):
+        user = rng.choice(users)
+        updates.append(factory.callback(user["chat_id"], codec.encode(codec.FILE, rng.choice(user["files"]))))
+    return updates
+
+
+def retrieve(inventory, count, factory, rng):
+    """Выгрузка всех файлов текущей папки."""
+    return [factory.callback(rng.choice(inventory["users"])["chat_id"], codec.encode(codec.RETRIEVE_ALL))
+            for _ in range(count)]
+
+
+def shared(inventory, count, factory, rng):
+    """Просмотр публичных папок другими пользователями: /access, подпапки, страницы, файлы, подъём."""
+    updates = []
+    for _ in range(count if inventory["shares"] else 0):
+        share = rng.choice(inventory["shares"])
+        handle = codec.share_handle(share["key"])
+        chat_id = rng.choice(inventory["users"])["chat_id"]
+        action = rng.randrange(5)
+        if action == 1 and share["children"]:
+            data = codec.encode(codec.SHARED_FOLDER, handle, rng.choice(share["children"]))
+        elif action == 2:
+            data = codec.encode(codec.SHARED_PAGE, handle, share["node"], 0)
+        elif action == 3 and share["files"]:
+            data = codec.encode(codec.SHARED_FILE, handle, rng.choice(share["files"]))
+        elif action == 4:
+            data = codec.encode(codec.SHARED_UP, handle, rng.choice(share["children"] or [share["node"]]))
+        else:
+            updates.append(factory.text(chat_id, f"/access {share['key']}"))
+            continue
+        updates.append(factory.callback(chat_id, data))
+    return updates
+
+
+# Доли сценариев в смешанной нагрузке
+MIX = (("browse", 5), ("save", 3), ("files", 2), ("shared", 2), ("mkdir", 1), ("retrieve", 1))
+
+
+def mixed(inventory, count, factory, rng):
+    """Смесь сценариев в долях MIX; порядок обновлений внутри каждого сценария сохраняется."""
+    total = sum(weight for name, weight in MIX)
+    queues = [SCENARIOS[name](inventory, count * weight // total, factory, rng) for name, weight in MIX]
+    queues = [list(reversed(queue)) for queue in queues if queue]
+    updates = []
+    while queues:
+        queue = rng.choice(queues)
+        updates.append(queue.pop())
+        if not queue:
+            queues.remove(queue)
+    return updates
+
+
+SCENARIOS = {
+    "save": save,
+    "mkdir": mkdir,
+    "browse": browse,
+    "files": files,
+    "retrieve": retrieve,
+    "shared": shared,
+    "mixed": mixed,
+}
@@ -0,0 +1,71 @@
+# benchmarks/snapshot.py
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from benchmarks.dataset import generate_document
+from benchmarks.run import format_size
+from utils.storage.json_storage import read_document, write_document
+from utils.storage.snapshot import FORMATS, COMPRESSIONS, check_format
+
+
+def variants():
+    """Все сочетания формата и сжатия, для которых установлены нужные модули."""
+    for format in FORMATS:
+        for compression in COMPRESSIONS:
+            try:
+                check_format(format, compression)
+            except ValueError:
+                continue
+            yield format, compression
+
+
+def measure(document, path, format, compression, repeat):
+    """Лучшее из repeat время записи и чтения файла снимка и его размер."""
+    save = load = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        write_document(path, document, format, compression)
+        save = min(save, time.perf_counter() - started)
+        started = time.perf_counter()
+        read_document(path)
+        load = min(load, time.perf_counter() - started)
+    return {"format": format, "compression": compression, "bytes": os.path.getsize(path),
+            "save_ms": save * 1000, "load_ms": load * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение форматов снимка данных на синтетическом дереве")
+    parser.add_argument("--users", type=int, default=500, help="Число пользователей")
+    parser.add_argument("--depth", type=int, default=3, help="Глубина дерева папок")
+    parser.add_argument("--fanout", type=int, default=3, help="Подпапок в каждой папке")
+    parser.add_argument("--files", type=int, default=5, help="Файлов в каждой папке")
+    parser.add_argument("--text-size", type=int, default=200, help="Длина текстовых записей")
+    parser.add_argument("--shares", type=int, default=200, help="Число публичных папок")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов каждого замера (берётся лучший)")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора данных")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    document = generate_document(users=args.users, depth=args.depth, fanout=args.fanout,
+                                 files_per_folder=args.files, text_size=args.text_size,
+                                 shares=args.shares, seed=args.seed)
+    results = []
+    print(f"{'формат':<12} {'сжатие':<7} {'размер':>10} {'запись, мс':>11} {'чтение, мс':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.snapshot")
+        for format, compression in variants():
+            result = measure(document, path, format, compression, args.repeat)
+            results.append(result)
+            print(f"{format:<12} {compression or '—':<7} {format_size(result['bytes']):>10} "
+                  f"{result['save_ms']:>11.1f} {result['load_ms']:>11.1f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,260 @@
 # bot.py
 
 import telebot
+from telebot import apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
 import config
-from utils.data_manager import load_data, save_data
+from utils.data_manager import close_storage, storage_size
+from utils.metrics import MetricsServer, STORAGE_BYTES, QUEUE_DEPTH
+from utils.log_setup import setup_logging
+from utils.sender import SendScheduler, RateLimitedBot
+from utils.async_bridge import AsyncBridge
+from utils.capture import UpdateRecorder
+from utils.dispatch import ChatDispatcher
+from utils.webhook import WebhookServer
+from utils.jobs import JobRunner
 from handlers.command_handlers import register_command_handlers
 from handlers.callback_handlers import register_callback_handlers
 from handlers.message_handlers import register_message_handlers
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import secrets
+import signal
+import threading
 import time
 import requests
 import logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,  # Установите уровень на DEBUG для подробного логирования
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
-def start_bot():
-    bot = telebot.TeleBot(config.BOT_TOKEN)
+# Лимиты исходящих сообщений Telegram: всего в секунду, в личный чат в секунду, в группу в секунду
+GLOBAL_RATE_LIMIT = getattr(config, "GLOBAL_RATE_LIMIT", 30)
+CHAT_RATE_LIMIT = getattr(config, "CHAT_RATE_LIMIT", 1.0)
+GROUP_RATE_LIMIT = getattr(config, "GROUP_RATE_LIMIT", 20 / 60)
+# Сколько раз повторять запрос после ответа 429
+SEND_MAX_RETRIES = getattr(config, "SEND_MAX_RETRIES", 5)
+# Режим работы: "sync" (TeleBot, long polling), "webhook" (TeleBot, обновления по HTTP)
+# или "async" (AsyncTeleBot, чаты обрабатываются параллельно)
+BOT_ENGINE = getattr(config, "BOT_ENGINE", "sync")
+# Обычный режим: число потоков-обработчиков; обновления одного чата всегда идут в один поток
+# (0 — встроенный пул TeleBot без упорядочивания по чатам)
+DISPATCH_WORKERS = getattr(config, "DISPATCH_WORKERS", 8)
+# Асинхронный режим: сколько обработчиков может выполняться одновременно
+ASYNC_WORKERS = getattr(config, "ASYNC_WORKERS", 32)
+# Webhook: публичный адрес (если задан, регистрируется в Telegram при старте), адрес и путь
+# встроенного сервера, секретный токен (у всех процессов за балансировщиком должен быть один),
+# размер очереди и необязательный сертификат, если TLS не завершается на прокси
+WEBHOOK_URL = getattr(config, "WEBHOOK_URL", None)
+WEBHOOK_HOST = getattr(config, "WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = getattr(config, "WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = getattr(config, "WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = getattr(config, "WEBHOOK_SECRET", None)
+WEBHOOK_QUEUE_SIZE = getattr(config, "WEBHOOK_QUEUE_SIZE", 1000)
+WEBHOOK_SSL_CERT = getattr(config, "WEBHOOK_SSL_CERT", None)
+WEBHOOK_SSL_KEY = getattr(config, "WEBHOOK_SSL_KEY", None)
+# Метрики в формате Prometheus: порт HTTP-сервера (None — не запускать) и адрес
+METRICS_PORT = getattr(config, "METRICS_PORT", None)
+METRICS_HOST = getattr(config, "METRICS_HOST", "127.0.0.1")
+# Запись входящих обновлений (обезличенных) для воспроизведения: путь к файлу или None
+CAPTURE_FILE = getattr(config, "CAPTURE_FILE", None)
+# Фоновые задачи массовой отправки: каталог с их состоянием, число потоков и как часто
+# (в секундах) обновлять сообщение о ходе выполнения; JOB_WORKERS = 0 — отправка в обработчике
+JOBS_DIR = getattr(config, "JOBS_DIR", "jobs")
+JOB_WORKERS = getattr(config, "JOB_WORKERS", 2)
+JOB_PROGRESS_INTERVAL = getattr(config, "JOB_PROGRESS_INTERVAL", 5.0)
+# Адрес Bot API в формате apihelper.API_URL, например локальный сервер из benchmarks/replay.py
+TELEGRAM_API_URL = getattr(config, "TELEGRAM_API_URL", None)
+# Адрес скачивания файлов в формате apihelper.FILE_URL (для /export через локальный Bot API)
+TELEGRAM_FILE_URL = getattr(config, "TELEGRAM_FILE_URL", None)
+
+def configure_api():
+    if TELEGRAM_API_URL:
+        apihelper.API_URL = TELEGRAM_API_URL
+        asyncio_helper.API_URL = TELEGRAM_API_URL
+        logger.warning(f"Запросы к Bot API идут на {TELEGRAM_API_URL}")
+    if TELEGRAM_FILE_URL:
+        apihelper.FILE_URL = TELEGRAM_FILE_URL
+        asyncio_helper.FILE_URL = TELEGRAM_FILE_URL
+        logger.warning(f"Файлы скачиваются с {TELEGRAM_FILE_URL}")
+
+def create_recorder():
+    if not CAPTURE_FILE:
+        return None
+    logger.info(f"Входящие обновления записываются в {CAPTURE_FILE}")
+    return UpdateRecorder(CAPTURE_FILE)
+
+def create_scheduler():
+    return SendScheduler(global_rate=GLOBAL_RATE_LIMIT,
+                         chat_rate=CHAT_RATE_LIMIT,
+                         group_rate=GROUP_RATE_LIMIT,
+                         max_retries=SEND_MAX_RETRIES)
+
+def create_jobs(bot, directory=JOBS_DIR):
+    if JOB_WORKERS <= 0:
+        return None
+    return JobRunner(bot, directory, workers=JOB_WORKERS, progress_interval=JOB_PROGRESS_INTERVAL)
+
+def create_bot(recorder=None, jobs_dir=JOBS_DIR):
+    """
+    TeleBot с зарегистрированными обработчиками; возвращает (бот, раздатчик по чатам или None,
+    фоновые задачи или None). Задачи, оставшиеся с прошлого запуска, сразу продолжаются.
+    """
+    telebot_instance = telebot.TeleBot(config.BOT_TOKEN, threaded=DISPATCH_WORKERS <= 0)
+    dispatcher = ChatDispatcher(telebot_instance, DISPATCH_WORKERS) if DISPATCH_WORKERS > 0 else None
+    if recorder is not None:
+        # Записываем в порядке поступления, до раздачи по потокам
+        telebot_instance.process_new_updates = recorder.wrap(telebot_instance.process_new_updates)
+    # Все отправки обработчиков проходят через общий планировщик лимитов
+    bot = RateLimitedBot(telebot_instance, create_scheduler())
+    jobs = create_jobs(bot, jobs_dir)
 
     # Регистрация обработчиков
     register_command_handlers(bot)
-    register_callback_handlers(bot)
+    register_callback_handlers(bot, jobs)
     register_message_handlers(bot)
+    if jobs is not None:
+        jobs.start()
+    return bot, dispatcher, jobs
+
+def start_metrics(**queues):
+    """Запускает сервер метрик; queues — имя очереди -> функция, возвращающая её длину."""
+    if METRICS_PORT is None:
+        return None
+    STORAGE_BYTES.set_function(storage_size)
+    for name, depth in queues.items():
+        QUEUE_DEPTH.set_function(depth, name)
+    server = MetricsServer(host=METRICS_HOST, port=METRICS_PORT)
+    server.start()
+    logger.info(f"Метрики доступны на http://{METRICS_HOST}:{server.port}/metrics")
+    return server
+
+def shutdown(dispatcher, recorder=None, jobs=None):
+    # Дожидаемся уже полученных обновлений и сбрасываем на диск отложенные изменения
+    if dispatcher is not None:
+        dispatcher.close()
+    # Задачи останавливаются после текущего шага и продолжатся при следующем запуске
+    if jobs is not None:
+        jobs.close()
+    if recorder is not None:
+        recorder.close()
+    close_storage()
+    logger.info("Бот остановлен, данные сохранены.")
+
+def start_bot():
+    recorder = create_recorder()
+    bot, dispatcher, jobs = create_bot(recorder)
+    queues = {}
+    if dispatcher is not None:
+        queues["dispatcher"] = dispatcher.depth
+    if jobs is not None:
+        queues["jobs"] = jobs.pending
+    start_metrics(**queues)
+
+    # При SIGTERM штатно останавливаем polling, чтобы успеть сохранить данные
+    signal.signal(signal.SIGTERM, lambda signum, frame: bot.stop_polling())
 
     # Запуск бота с увеличенным timeout и обработкой исключений
-    while True:
-        try:
-            logger.info("Бот запущен и ожидает обновлений...")
-            bot.infinity_polling(timeout=60, long_polling_timeout=60)
-        except requests.exceptions.ReadTimeout:
-            logger.warning("ReadTimeoutError: Превышено время ожидания. Попытка перезапуска polling...")
-            time.sleep(5)  # Пауза перед повторной попыткой
-        except Exception as e:
-            logger.error(f"Неизвестная ошибка: {e}")
-            time.sleep(5)
+    try:
+        while True:
+            try:
+                logger.info("Бот запущен и ожидает обновлений...")
+                bot.infinity_polling(timeout=60, long_polling_timeout=60)
+                break  # polling остановлен (Ctrl+C или stop_polling)
+            except requests.exceptions.ReadTimeout:
+                logger.warning("ReadTimeoutError: Превышено время ожидания. Попытка перезапуска polling...")
+                time.sleep(5)  # Пауза перед повторной попыткой
+            except Exception as e:
+                logger.error(f"Неизвестная ошибка: {e}")
+                time.sleep(5)
+    finally:
+        shutdown(dispatcher, recorder, jobs)
+
+def start_webhook_bot():
+    recorder = create_recorder()
+    bot, dispatcher, jobs = create_bot(recorder)
+    secret = WEBHOOK_SECRET
+    if not secret:
+        secret = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET не задан, сгенерирован временный токен")
+    server = WebhookServer(bot.process_new_updates, secret,
+                           host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                           queue_size=WEBHOOK_QUEUE_SIZE,
+                           certificate=WEBHOOK_SSL_CERT, private_key=WEBHOOK_SSL_KEY)
+    queues = {"webhook": server.depth}
+    if dispatcher is not None:
+        queues["dispatcher"] = dispatcher.depth
+    if jobs is not None:
+        queues["jobs"] = jobs.pending
+    start_metrics(**queues)
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=secret)
+
+    # shutdown() сервера нельзя вызывать из потока, где работает serve_forever
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    logger.info(f"Webhook-сервер слушает {WEBHOOK_HOST}:{server.port}{WEBHOOK_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown(dispatcher, recorder, jobs)
+
+async def run_async_bot(recorder=None):
+    async_bot = AsyncTeleBot(config.BOT_TOKEN)
+    if recorder is not None:
+        async_bot.process_new_updates = recorder.wrap_async(async_bot.process_new_updates)
+    loop = asyncio.get_running_loop()
+    # Обработчики выполняются в этом пуле, цикл событий занят только сетью
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_WORKERS))
+    bridge = AsyncBridge(async_bot, loop)
+    bot = RateLimitedBot(bridge, create_scheduler())
+    jobs = create_jobs(bot)
+    start_metrics(handlers=bridge.chat_locks.pending, **({"jobs": jobs.pending} if jobs is not None else {}))
+
+    # Обработчики те же, что и в обычном режиме: мост регистрирует их в AsyncTeleBot
+    # и выполняет в пуле потоков
+    register_command_handlers(bot)
+    register_callback_handlers(bot, jobs)
+    register_message_handlers(bot)
+    if jobs is not None:
+        jobs.start()
+
+    polling = asyncio.create_task(async_bot.infinity_polling(timeout=60, request_timeout=90))
+    loop.add_signal_handler(signal.SIGTERM, polling.cancel)
+    logger.info("Бот запущен в асинхронном режиме и ожидает обновлений...")
+    try:
+        await polling
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if jobs is not None:
+            # Потоки задач обращаются к боту через цикл событий, поэтому ждём их не в нём
+            await asyncio.to_thread(jobs.close)
+        await async_bot.close_session()
+
+def start_async_bot():
+    recorder = create_recorder()
+    try:
+        asyncio.run(run_async_bot(recorder))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # asyncio.run дожидается пула потоков, так что начатые обработчики уже завершились
+        if recorder is not None:
+            recorder.close()
+        close_storage()
+        logger.info("Бот остановлен, данные сохранены.")
 
 if __name__ == "__main__":
-    start_bot()
+    # Настройка логирования (уровни, файл и ротация — в config.py, см. utils/log_setup.py)
+    log_listener = setup_logging()
+    configure_api()
+    try:
+        if BOT_ENGINE == "async":
+            start_async_bot()
+        elif BOT_ENGINE == "webhook":
+            start_webhook_bot()
+        else:
+            start_bot()
+    finally:
+        log_listener.stop()
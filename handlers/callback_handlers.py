@@ -1,506 +1,324 @@
 # handlers/callback_handlers.py
 
 from telebot.types import CallbackQuery
-from utils.data_manager import load_data, save_data, init_user
-from utils.navigation import navigate_to_path
-from utils.keyboards import generate_markup
+from utils.data_manager import transaction, ensure_user, get_current_node, set_current_node, get_node, find_file, is_within, get_share, find_share, search_files, find_results
+from utils.keyboards import generate_markup, generate_search_markup, search_page_count, SEARCH_PAGE_SIZE
+from utils.search import tokenize
+from utils.sessions import get_session, open_session
+from utils.jobs import folder_tree
+from utils.delivery import send_file, deliver_files
+from utils.routing import CallbackRouter
+from utils.metrics import timed_handler
+from utils import callback_codec as codec
 import telebot
 import logging
 
 logger = logging.getLogger(__name__)
 
-def register_callback_handlers(bot: telebot.TeleBot):
-    @bot.callback_query_handler(func=lambda call: True)
-    def handle_callback(call: CallbackQuery):
-        user_id = str(call.message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
 
-        if call.data.startswith("shared_"):
-            handle_shared_callback(call, data)
-            return
-
-        # Оригинальная обработка для личных папок
-        current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-
-        if call.data == "up":
-            if data["users"][user_id]["current_path"]:
-                popped = data["users"][user_id]["current_path"].pop()
-                bot.answer_callback_query(call.id, f"Вернулись из папки '{popped}'.")
-            else:
-                bot.answer_callback_query(call.id, "Вы уже в корневой папке.")
-        elif call.data.startswith("folder:"):
-            folder_name = call.data.split(":", 1)[1]
-            if folder_name in current["folders"]:
-                data["users"][user_id]["current_path"].append(folder_name)
-                bot.answer_callback_query(call.id, f"Перешли в папку '{folder_name}'.")
-            else:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-        elif call.data.startswith("file:"):
-            short_id = call.data.split(":", 1)[1]
-            file_id = data["users"][user_id]["file_mappings"].get(short_id)
-            if not file_id:
-                bot.answer_callback_query(call.id, "Файл не найден.")
-                return
-            # Найдём файл по short_id в текущей папке
-            file = next((f for f in current["files"] if f.get("short_id") == short_id), None)
-            if file:
-                try:
-                    if file["type"] == "text":
-                        bot.send_message(call.message.chat.id, f"Текст: {file['content']}")
-                    elif file["type"] == "document":
-                        bot.send_document(chat_id=call.message.chat.id, document=file["file_id"])
-                    elif file["type"] == "photo":
-                        bot.send_photo(chat_id=call.message.chat.id, photo=file["file_id"])
-                    elif file["type"] == "video":
-                        bot.send_video(chat_id=call.message.chat.id, video=file["file_id"])
-                    elif file["type"] == "audio":
-                        bot.send_audio(chat_id=call.message.chat.id, audio=file["file_id"])
-                    else:
-                        bot.send_message(call.message.chat.id, "Неизвестный тип файла.")
-                    bot.answer_callback_query(call.id, "Файл отправлен.")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке файла: {e}")
-                    bot.answer_callback_query(call.id, f"Ошибка при отправке файла: {str(e)}")
-            else:
-                bot.answer_callback_query(call.id, "Файл не найден.")
-        elif call.data.startswith("retrieve_all"):
-            # Обработка возврата всех сообщений и файлов в текущей папке
-            try:
-                for file in current["files"]:
-                    if file["type"] == "text":
-                        bot.send_message(call.message.chat.id, f"Текст: {file['content']}")
-                    elif file["type"] == "document":
-                        bot.send_document(chat_id=call.message.chat.id, document=file["file_id"])
-                    elif file["type"] == "photo":
-                        bot.send_photo(chat_id=call.message.chat.id, photo=file["file_id"])
-                    elif file["type"] == "video":
-                        bot.send_video(chat_id=call.message.chat.id, video=file["file_id"])
-                    elif file["type"] == "audio":
-                        bot.send_audio(chat_id=call.message.chat.id, audio=file["file_id"])
-                    else:
-                        bot.send_message(call.message.chat.id, "Неизвестный тип файла.")
-                bot.answer_callback_query(call.id, "Все файлы отправлены.")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке файлов: {e}")
-                bot.answer_callback_query(call.id, f"Ошибка при отправке файлов: {str(e)}")
+class CallbackError(Exception):
+    """Действие невозможно; текст исключения показывается пользователю в ответ на нажатие."""
+
+
+class PrivateScope:
+    """Личные папки: навигация идёт от текущей папки пользователя, которая хранится в данных."""
+
+    opened_text = "Перешли в папку '{}'."
+    # Переход меняет текущую папку в хранилище
+    writes = True
+
+    def __init__(self, user_id):
+        self.owner_id = user_id
+        self.shared_key = None
+        self.root_id = None
+        # Пользователь создаётся до читающих транзакций обработчика (см. get_current_node)
+        ensure_user(user_id)
+
+    def folder(self, node_id=None):
+        """Папка, от которой действует кнопка: у личных кнопок её нет в callback_data, это текущая."""
+        return get_node(self.owner_id, get_current_node(self.owner_id))
+
+    def can_open(self, node):
+        # Переходить можно только в подпапку текущей
+        return node["parent"] == get_current_node(self.owner_id)
+
+    def can_page(self, node):
+        # Листать можно только текущую папку
+        return node["id"] == get_current_node(self.owner_id)
+
+    def contains(self, node_id):
+        return True
+
+    def legacy_parent(self):
+        """Папка, среди подпапок которой ищется имя из callback_data старого формата."""
+        return get_current_node(self.owner_id)
+
+    def enter(self, node):
+        set_current_node(self.owner_id, node["id"])
+
+    def up(self, node_id=None):
+        """Переходит в родительскую папку; возвращает (покинутая папка, родительская)."""
+        current = self.folder(node_id)
+        if current["parent"] is None:
+            raise CallbackError("Вы уже в корневой папке.")
+        parent = get_node(self.owner_id, current["parent"])
+        self.enter(parent)
+        return current, parent
+
+
+class SharedScope:
+    """
+    Публичная папка: доступны она сама и всё, что в ней лежит. Текущая папка зрителя хранится
+    в его сессии (utils/sessions.py) вместе с владельцем и папкой, найденными по ключу,
+    поэтому ключ разбирается только при первом нажатии, а не при каждом.
+    """
+
+    opened_text = "Перешли в публичную папку '{}'."
+    # Текущая папка зрителя хранится в сессии, хранилище только читается
+    writes = False
+
+    def __init__(self, session):
+        self.session = session
+        self.owner_id = session["owner_id"]
+        self.shared_key = session["key"]
+        self.root_id = session["root_id"]
+
+    @classmethod
+    def resolve(cls, reference, viewer_id):
+        """
+        Сессия зрителя viewer_id в публичной папке по ссылке из callback_data: bytes — начало
+        ключа, str — полный ключ из callback_data старого формата. Без сессии открывается новая.
+        """
+        key = reference.hex() if isinstance(reference, bytes) else reference
+        session = get_session(viewer_id, key)
+        # Полный ключ старого формата должен совпасть целиком, а не только началом
+        if session is not None and (isinstance(reference, bytes) or session["key"] == reference):
+            return cls(session)
+        if isinstance(reference, bytes):
+            shared = find_share(key)
         else:
-            bot.answer_callback_query(call.id, "Неизвестная команда.")
-
-        # Обновляем папочную структуру после действия, если это необходимо
-        if call.data.startswith("folder:") or call.data == "up":
-            current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-            markup = generate_markup(current, data["users"][user_id]["current_path"])
-            try:
-                bot.edit_message_reply_markup(chat_id=call.message.chat.id,
-                                              message_id=call.message.message_id,
-                                              reply_markup=markup)
-            except telebot.apihelper.ApiTelegramException as e:
-                if "message is not modified" in str(e):
-                    # Игнорируем ошибку, если сообщение не изменилось
-                    pass
-                else:
-                    logger.error(f"Ошибка обновления клавиатуры: {e}")
-                    bot.send_message(call.message.chat.id, f"Ошибка обновления клавиатуры: {str(e)}")
-
-        save_data(data)
-
-    def handle_shared_callback(call: CallbackQuery, data: dict):
-        user_id = str(call.message.chat.id)
-
-        # Разбор callback_data
-        parts = call.data.split(":")
-        if len(parts) < 2:
-            bot.answer_callback_query(call.id, "Неверный формат команды.")
-            return
-
-        command = parts[0]
-
-        if command == "shared_up":
-            shared_key = parts[1]
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            # В текущей реализации навигация по публичным папкам ограничена
-            bot.answer_callback_query(call.id, "Навигация по публичным папкам пока не поддерживается.")
-
-        elif command == "shared_folder":
-            if len(parts) < 3:
-                bot.answer_callback_query(call.id, "Неверный формат команды для папки.")
-                return
-            shared_key = parts[1]
-            folder_name = parts[2]
-
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            owner_id = shared["user_id"]
-            base_path = shared["path"]
-
-            owner_structure = data["users"].get(owner_id, {}).get("structure")
-            if not owner_structure:
-                bot.answer_callback_query(call.id, "Структура папки не найдена.")
-                return
-
-            try:
-                shared_folder = navigate_to_path(owner_structure, base_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            if folder_name not in shared_folder["folders"]:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            # Обновляем путь для навигации внутри публичной папки
-            new_shared_path = base_path + [folder_name]
-            try:
-                current = navigate_to_path(owner_structure, new_shared_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            # Генерация клавиатуры для новой папки
-            markup = generate_markup(current, new_shared_path, shared_key=shared_key)
-
-            # Редактирование сообщения с новой клавиатурой
-            try:
-                bot.edit_message_reply_markup(chat_id=call.message.chat.id,
-                                              message_id=call.message.message_id,
-                                              reply_markup=markup)
-                bot.answer_callback_query(call.id, f"Перешли в публичную папку '{folder_name}'.")
-            except telebot.apihelper.ApiTelegramException as e:
-                if "message is not modified" in str(e):
-                    # Игнорируем ошибку, если сообщение не изменилось
-                    pass
-                else:
-                    logger.error(f"Ошибка обновления клавиатуры: {e}")
-                    bot.answer_callback_query(call.id, f"Ошибка обновления клавиатуры: {str(e)}")
-
-        elif command == "shared_file":
-            if len(parts) < 3:
-                bot.answer_callback_query(call.id, "Неверный формат команды для файла.")
-                return
-            shared_key = parts[1]
-            short_id = parts[2]
-
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            owner_id = shared["user_id"]
-            base_path = shared["path"]
-
-            owner_structure = data["users"].get(owner_id, {}).get("structure")
-            if not owner_structure:
-                bot.answer_callback_query(call.id, "Структура папки не найдена.")
-                return
-
-            try:
-                shared_folder = navigate_to_path(owner_structure, base_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            # Найдём файл по short_id в текущей папке
-            file = next((f for f in shared_folder["files"] if f.get("short_id") == short_id), None)
-            if file:
-                file_id = data["users"][owner_id]["file_mappings"].get(short_id)
-                if not file_id:
-                    bot.answer_callback_query(call.id, "Файл не найден.")
-                    return
-                try:
-                    if file["type"] == "text":
-                        bot.send_message(call.message.chat.id, f"Текст: {file['content']}")
-                    elif file["type"] == "document":
-                        bot.send_document(chat_id=call.message.chat.id, document=file_id)
-                    elif file["type"] == "photo":
-                        bot.send_photo(chat_id=call.message.chat.id, photo=file_id)
-                    elif file["type"] == "video":
-                        bot.send_video(chat_id=call.message.chat.id, video=file_id)
-                    elif file["type"] == "audio":
-                        bot.send_audio(chat_id=call.message.chat.id, audio=file_id)
-                    else:
-                        bot.send_message(call.message.chat.id, "Неизвестный тип файла.")
-                    bot.answer_callback_query(call.id, "Файл отправлен.")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке файла: {e}")
-                    bot.answer_callback_query(call.id, f"Ошибка при отправке файла: {str(e)}")
-            else:
-                bot.answer_callback_query(call.id, "Файл не найден.")
-
-        elif command == "shared_retrieve_all":
-            if len(parts) < 2:
-                bot.answer_callback_query(call.id, "Неверный формат команды для получения всех файлов.")
-                return
-            shared_key = parts[1]
-
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            owner_id = shared["user_id"]
-            base_path = shared["path"]
-
-            owner_structure = data["users"].get(owner_id, {}).get("structure")
-            if not owner_structure:
-                bot.answer_callback_query(call.id, "Структура папки не найдена.")
-                return
-
-            try:
-                shared_folder = navigate_to_path(owner_structure, base_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
+            shared = get_share(reference)
+            shared = dict(shared, key=reference) if shared else None
+        if not shared:
+            raise CallbackError("Неверный ключ доступа.")
+        return cls(open_session(viewer_id, shared, fresh=True))
+
+    def _node(self, node_id):
+        try:
+            return get_node(self.owner_id, node_id)
+        except KeyError:
+            raise CallbackError("Папка не найдена.")
+
+    def folder(self, node_id=None):
+        """
+        Папка из callback_data кнопки, если она лежит в публичной; поэтому кнопки работают и после
+        истечения сессии. У кнопок старого формата папки нет — они действуют от корня публичной.
+        """
+        if node_id is None:
+            node_id = self.root_id
+        if not self.contains(node_id):
+            raise CallbackError("Папка не найдена.")
+        return self._node(node_id)
+
+    def can_open(self, node):
+        # Подпапка текущей папки сессии проверяется без обхода предков
+        return node["parent"] == self.session["node_id"] or self.contains(node["id"])
+
+    def can_page(self, node):
+        return self.contains(node["id"])
+
+    def contains(self, node_id):
+        # Папка должна лежать внутри публичной; текущая папка сессии лежит в ней по построению
+        return node_id == self.session["node_id"] or is_within(self.owner_id, node_id, self.root_id)
+
+    def legacy_parent(self):
+        # Старые кнопки вели из корня публичной папки, а после перезапуска бота
+        # текущая папка зрителя неизвестна
+        return self.root_id if self.session["fresh"] else self.session["node_id"]
+
+    def enter(self, node):
+        self.session["node_id"] = node["id"]
+        self.session["fresh"] = False
+
+    def up(self, node_id=None):
+        """Переходит в родительскую папку, но не выше публичной; возвращает (покинутая, родительская)."""
+        current = self.folder(node_id)
+        if current["id"] == self.root_id:
+            raise CallbackError("Вы уже в корне публичной папки.")
+        parent = self._node(current["parent"])
+        self.enter(parent)
+        return current, parent
+
+
+# Общий конвейер для личных и публичных папок: найти папку, найти файл, отправить
+
+def resolve_folder(scope, node_id, allowed):
+    """Папка node_id, если allowed(папка) разрешает к ней доступ."""
+    try:
+        node = get_node(scope.owner_id, node_id)
+    except KeyError:
+        raise CallbackError("Папка не найдена.")
+    if not allowed(node):
+        raise CallbackError("Папка не найдена.")
+    return node
+
+
+def legacy_folder_id(scope, name):
+    """
+    id подпапки по имени из callback_data старого формата (см. codec.legacy_name); имя должно
+    указывать ровно на одну подпапку, иначе (например, кириллические имена) папка не найдена.
+    """
+    try:
+        folders = get_node(scope.owner_id, scope.legacy_parent())["folders"]
+    except KeyError:
+        raise CallbackError("Папка не найдена.")
+    matches = [node_id for folder, node_id in folders.items() if codec.legacy_name(folder) == name]
+    if len(matches) != 1:
+        raise CallbackError("Папка не найдена.")
+    return matches[0]
+
+
+def resolve_file(scope, short_id):
+    """Запись файла по short_id; файл ищется по индексу, без обхода дерева папок."""
+    found = find_file(scope.owner_id, short_id)
+    if not found or not scope.contains(found["node"]):
+        raise CallbackError("Файл не найден.")
+    return found["record"]
+
+
+def render(scope, node, page=0):
+    return generate_markup(node, shared_key=scope.shared_key, page=page, owner_id=scope.owner_id,
+                           root_id=scope.root_id)
+
+
+def register_callback_handlers(bot: telebot.TeleBot, jobs=None):
+    """jobs — JobRunner для массовой отправки в фоне; без него папки отправляются прямо в обработчике."""
+    router = CallbackRouter()
+
+    def route(private_op, shared_op):
+        """Регистрирует обработчик(call, scope, *аргументы) для личного и публичного варианта операции."""
+        def decorator(handler):
+            def private(call, *args):
+                handler(call, PrivateScope(str(call.message.chat.id)), *args)
+
+            def shared(call, reference, *args):
+                handler(call, SharedScope.resolve(reference, str(call.message.chat.id)), *args)
+
+            router.add(private_op, codec.OP_NAMES[private_op], private)
+            router.add(shared_op, codec.OP_NAMES[shared_op], shared)
+            return handler
+        return decorator
+
+    def show(call, markup, answer):
+        # Редактирование сообщения с новой клавиатурой
+        try:
+            bot.edit_message_reply_markup(chat_id=call.message.chat.id,
+                                          message_id=call.message.message_id,
+                                          reply_markup=markup)
+        except telebot.apihelper.ApiTelegramException as e:
+            # Ошибку "message is not modified" игнорируем: сообщение не изменилось
+            if "message is not modified" not in str(e):
+                logger.error(f"Ошибка обновления клавиатуры: {e}")
+                answer = f"Ошибка обновления клавиатуры: {str(e)}"
+        bot.answer_callback_query(call.id, answer)
+
+    @route(codec.UP, codec.SHARED_UP)
+    def on_up(call, scope, node_id=None):
+        with transaction(write=scope.writes):
+            left, parent = scope.up(node_id)
+            markup = render(scope, parent)
+        show(call, markup, f"Вернулись из папки '{left['name']}'.")
+
+    @route(codec.FOLDER, codec.SHARED_FOLDER)
+    def on_folder(call, scope, node_id):
+        with transaction(write=scope.writes):
+            if isinstance(node_id, str):
+                node_id = legacy_folder_id(scope, node_id)
+            node = resolve_folder(scope, node_id, scope.can_open)
+            scope.enter(node)
+            markup = render(scope, node)
+        show(call, markup, scope.opened_text.format(node["name"]))
+
+    @route(codec.PAGE, codec.SHARED_PAGE)
+    def on_page(call, scope, node_id, page):
+        with transaction():
+            node = resolve_folder(scope, node_id, scope.can_page)
+            markup = render(scope, node, page)
+        show(call, markup, f"Страница {page + 1}.")
+
+    @route(codec.FILE, codec.SHARED_FILE)
+    def on_file(call, scope, short_id):
+        with transaction():
+            file = resolve_file(scope, short_id)
+        try:
+            send_file(bot, call.message.chat.id, file)
+            bot.answer_callback_query(call.id, "Файл отправлен.")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке файла: {e}")
+            bot.answer_callback_query(call.id, f"Ошибка при отправке файла: {str(e)}")
+
+    def deliver(call, scope, nodes):
+        """Отправляет файлы папок nodes: фоновой задачей или, без JobRunner, сразу."""
+        try:
+            if jobs is not None:
+                jobs.submit(call.message.chat.id, scope.owner_id, nodes)
+                bot.answer_callback_query(call.id, "Отправка файлов началась.")
                 return
-
-            # Отправка всех файлов в текущей папке
-            try:
-                for file in shared_folder["files"]:
-                    short_id = file.get("short_id")
-                    if not short_id:
-                        continue  # Или обработать ошибку
-                    file_id = data["users"][owner_id]["file_mappings"].get(short_id)
-                    if not file_id:
-                        continue  # Или обработать ошибку
-                    if file["type"] == "text":
-                        bot.send_message(call.message.chat.id, f"Текст: {file['content']}")
-                    elif file["type"] == "document":
-                        bot.send_document(chat_id=call.message.chat.id, document=file_id)
-                    elif file["type"] == "photo":
-                        bot.send_photo(chat_id=call.message.chat.id, photo=file_id)
-                    elif file["type"] == "video":
-                        bot.send_video(chat_id=call.message.chat.id, video=file_id)
-                    elif file["type"] == "audio":
-                        bot.send_audio(chat_id=call.message.chat.id, audio=file_id)
-                    else:
-                        bot.send_message(call.message.chat.id, "Неизвестный тип файла.")
-                bot.answer_callback_query(call.id, "Все файлы отправлены.")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке файлов: {e}")
-                bot.answer_callback_query(call.id, f"Ошибка при отправке файлов: {str(e)}")
-        else:
-            bot.answer_callback_query(call.id, "Неизвестная команда для публичных папок.")
-
-        # Обновляем папочную структуру после действия, если это необходимо
-        if call.data.startswith("folder:") or call.data == "up":
-            current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-            markup = generate_markup(current, data["users"][user_id]["current_path"])
-            try:
-                bot.edit_message_reply_markup(chat_id=call.message.chat.id,
-                                              message_id=call.message.message_id,
-                                              reply_markup=markup)
-            except telebot.apihelper.ApiTelegramException as e:
-                if "message is not modified" in str(e):
-                    # Игнорируем ошибку, если сообщение не изменилось
-                    pass
-                else:
-                    logger.error(f"Ошибка обновления клавиатуры: {e}")
-                    bot.send_message(call.message.chat.id, f"Ошибка обновления клавиатуры: {str(e)}")
-
-        save_data(data)
-
-    def handle_shared_callback(call: CallbackQuery, data: dict):
+            for node_id in nodes:
+                with transaction():
+                    files = get_node(scope.owner_id, node_id)["files"]
+                # Медиа уходят альбомами, тексты склеиваются, чтобы не упираться в лимиты
+                deliver_files(bot, call.message.chat.id, files)
+            bot.answer_callback_query(call.id, "Все файлы отправлены.")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке файлов: {e}")
+            bot.answer_callback_query(call.id, f"Ошибка при отправке файлов: {str(e)}")
+
+    @route(codec.RETRIEVE_ALL, codec.SHARED_RETRIEVE_ALL)
+    def on_retrieve_all(call, scope, node_id=None):
+        # Отправка всех файлов в папке кнопки
+        with transaction():
+            node_id = scope.folder(node_id)["id"]
+        deliver(call, scope, [node_id])
+
+    @route(codec.RETRIEVE_TREE, codec.SHARED_RETRIEVE_TREE)
+    def on_retrieve_tree(call, scope, node_id=None):
+        # Папка кнопки и все вложенные, по порядку обхода
+        with transaction():
+            nodes = folder_tree(scope.owner_id, scope.folder(node_id)["id"])
+        deliver(call, scope, nodes)
+
+    def on_job_cancel(call, job_id):
+        if jobs is None or not jobs.cancel(job_id, call.message.chat.id):
+            raise CallbackError("Задача уже завершена.")
+        bot.answer_callback_query(call.id, "Отправка будет остановлена.")
+
+    router.add(codec.JOB_CANCEL, codec.OP_NAMES[codec.JOB_CANCEL], on_job_cancel)
+
+    def on_search_page(call, page, query):
+        # Запрос приходит в callback_data, поэтому результаты всегда актуальны
+        terms = tokenize(query)
         user_id = str(call.message.chat.id)
+        hits = search_files(user_id, terms)
+        if not hits:
+            raise CallbackError("Ничего не найдено.")
+        pages = search_page_count(hits)
+        page = min(page, pages - 1)
+        results = find_results(user_id, hits[page * SEARCH_PAGE_SIZE:(page + 1) * SEARCH_PAGE_SIZE])
+        show(call, generate_search_markup(results, " ".join(terms), page, pages), f"Страница {page + 1}.")
 
-        # Разбор callback_data
-        parts = call.data.split(":")
-        if len(parts) < 2:
-            bot.answer_callback_query(call.id, "Неверный формат команды.")
-            return
-
-        command = parts[0]
-
-        if command == "shared_up":
-            shared_key = parts[1]
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            # В текущей реализации навигация по публичным папкам ограничена
-            bot.answer_callback_query(call.id, "Навигация по публичным папкам пока не поддерживается.")
-
-        elif command == "shared_folder":
-            if len(parts) < 3:
-                bot.answer_callback_query(call.id, "Неверный формат команды для папки.")
-                return
-            shared_key = parts[1]
-            folder_name = parts[2]
-
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            owner_id = shared["user_id"]
-            base_path = shared["path"]
-
-            owner_structure = data["users"].get(owner_id, {}).get("structure")
-            if not owner_structure:
-                bot.answer_callback_query(call.id, "Структура папки не найдена.")
-                return
-
-            try:
-                shared_folder = navigate_to_path(owner_structure, base_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            if folder_name not in shared_folder["folders"]:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            # Обновляем путь для навигации внутри публичной папки
-            new_shared_path = base_path + [folder_name]
-            try:
-                current = navigate_to_path(owner_structure, new_shared_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            # Генерация клавиатуры для новой папки
-            markup = generate_markup(current, new_shared_path, shared_key=shared_key)
-
-            # Редактирование сообщения с новой клавиатурой
-            try:
-                bot.edit_message_reply_markup(chat_id=call.message.chat.id,
-                                              message_id=call.message.message_id,
-                                              reply_markup=markup)
-                bot.answer_callback_query(call.id, f"Перешли в публичную папку '{folder_name}'.")
-            except telebot.apihelper.ApiTelegramException as e:
-                if "message is not modified" in str(e):
-                    # Игнорируем ошибку, если сообщение не изменилось
-                    pass
-                else:
-                    logger.error(f"Ошибка обновления клавиатуры: {e}")
-                    bot.answer_callback_query(call.id, f"Ошибка обновления клавиатуры: {str(e)}")
-
-        elif command == "shared_file":
-            if len(parts) < 3:
-                bot.answer_callback_query(call.id, "Неверный формат команды для файла.")
-                return
-            shared_key = parts[1]
-            short_id = parts[2]
-
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            owner_id = shared["user_id"]
-            base_path = shared["path"]
-
-            owner_structure = data["users"].get(owner_id, {}).get("structure")
-            if not owner_structure:
-                bot.answer_callback_query(call.id, "Структура папки не найдена.")
-                return
-
-            try:
-                shared_folder = navigate_to_path(owner_structure, base_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
-
-            # Найдём файл по short_id в текущей папке
-            file = next((f for f in shared_folder["files"] if f.get("short_id") == short_id), None)
-            if file:
-                file_id = data["users"][owner_id]["file_mappings"].get(short_id)
-                if not file_id:
-                    bot.answer_callback_query(call.id, "Файл не найден.")
-                    return
-                try:
-                    if file["type"] == "text":
-                        bot.send_message(call.message.chat.id, f"Текст: {file['content']}")
-                    elif file["type"] == "document":
-                        bot.send_document(chat_id=call.message.chat.id, document=file_id)
-                    elif file["type"] == "photo":
-                        bot.send_photo(chat_id=call.message.chat.id, photo=file_id)
-                    elif file["type"] == "video":
-                        bot.send_video(chat_id=call.message.chat.id, video=file_id)
-                    elif file["type"] == "audio":
-                        bot.send_audio(chat_id=call.message.chat.id, audio=file_id)
-                    else:
-                        bot.send_message(call.message.chat.id, "Неизвестный тип файла.")
-                    bot.answer_callback_query(call.id, "Файл отправлен.")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке файла: {e}")
-                    bot.answer_callback_query(call.id, f"Ошибка при отправке файла: {str(e)}")
-            else:
-                bot.answer_callback_query(call.id, "Файл не найден.")
-
-        elif command == "shared_retrieve_all":
-            if len(parts) < 2:
-                bot.answer_callback_query(call.id, "Неверный формат команды для получения всех файлов.")
-                return
-            shared_key = parts[1]
-
-            shared = data.get("shared_folders", {}).get(shared_key)
-            if not shared:
-                bot.answer_callback_query(call.id, "Неверный ключ доступа.")
-                return
-
-            owner_id = shared["user_id"]
-            base_path = shared["path"]
-
-            owner_structure = data["users"].get(owner_id, {}).get("structure")
-            if not owner_structure:
-                bot.answer_callback_query(call.id, "Структура папки не найдена.")
-                return
-
-            try:
-                shared_folder = navigate_to_path(owner_structure, base_path)
-            except KeyError:
-                bot.answer_callback_query(call.id, "Папка не найдена.")
-                return
+    router.add(codec.SEARCH_PAGE, codec.OP_NAMES[codec.SEARCH_PAGE], on_search_page)
 
-            # Отправка всех файлов в текущей папке
-            try:
-                for file in shared_folder["files"]:
-                    short_id = file.get("short_id")
-                    if not short_id:
-                        continue  # Или обработать ошибку
-                    file_id = data["users"][owner_id]["file_mappings"].get(short_id)
-                    if not file_id:
-                        continue  # Или обработать ошибку
-                    if file["type"] == "text":
-                        bot.send_message(call.message.chat.id, f"Текст: {file['content']}")
-                    elif file["type"] == "document":
-                        bot.send_document(chat_id=call.message.chat.id, document=file_id)
-                    elif file["type"] == "photo":
-                        bot.send_photo(chat_id=call.message.chat.id, photo=file_id)
-                    elif file["type"] == "video":
-                        bot.send_video(chat_id=call.message.chat.id, video=file_id)
-                    elif file["type"] == "audio":
-                        bot.send_audio(chat_id=call.message.chat.id, audio=file_id)
-                    else:
-                        bot.send_message(call.message.chat.id, "Неизвестный тип файла.")
-                bot.answer_callback_query(call.id, "Все файлы отправлены.")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке файлов: {e}")
-                bot.answer_callback_query(call.id, f"Ошибка при отправке файлов: {str(e)}")
-        else:
-            bot.answer_callback_query(call.id, "Неизвестная команда для публичных папок.")
-
-        # Обновляем папочную структуру после действия, если это необходимо
-        if call.data.startswith("folder:") or call.data == "up":
-            current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-            markup = generate_markup(current, data["users"][user_id]["current_path"])
-            try:
-                bot.edit_message_reply_markup(chat_id=call.message.chat.id,
-                                              message_id=call.message.message_id,
-                                              reply_markup=markup)
-            except telebot.apihelper.ApiTelegramException as e:
-                if "message is not modified" in str(e):
-                    # Игнорируем ошибку, если сообщение не изменилось
-                    pass
-                else:
-                    logger.error(f"Ошибка обновления клавиатуры: {e}")
-                    bot.send_message(call.message.chat.id, f"Ошибка обновления клавиатуры: {str(e)}")
-
-        save_data(data)
+    @bot.callback_query_handler(func=lambda call: True)
+    @timed_handler
+    def handle_callback(call: CallbackQuery):
+        try:
+            op, args = codec.decode(call.data)
+        except ValueError as e:
+            logger.warning(f"Не удалось разобрать callback_data: {e}")
+            bot.answer_callback_query(call.id, "Неизвестная команда.")
+            return
+        try:
+            router.dispatch(op, call, *args)
+        except CallbackError as e:
+            bot.answer_callback_query(call.id, str(e))
@@ -1,32 +1,39 @@
 # handlers/command_handlers.py
 from telebot import types
 from telebot.types import Message
-from utils.data_manager import load_data, save_data, init_user
-from utils.navigation import navigate_to_path
-from utils.keyboards import generate_markup
+from utils.data_manager import transaction, ensure_user, user_exists, get_current_node, set_current_node, get_node, create_folder, get_share, create_share, search_files, find_results
+from utils.keyboards import generate_markup, generate_search_markup, search_page_count, SEARCH_PAGE_SIZE
+from utils.search import tokenize
+from utils.sessions import open_session
+from utils.metrics import timed_handler
+from utils.export import export_folder
+from utils.sender import priority, BULK
 import uuid
 import telebot
+import logging
+
+logger = logging.getLogger(__name__)
 
 def register_command_handlers(bot: telebot.TeleBot):
     @bot.message_handler(commands=['start'])
+    @timed_handler
     def handle_start(message: Message):
         user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
-        save_data(data)
+        ensure_user(user_id)
         bot.send_message(message.chat.id, "Добро пожаловать! Используйте команды для управления вашими данными.\n\n"
                                           "/mkdir <имя_папки> - Создать новую папку\n"
                                           "/cd <имя_папки> - Перейти в папку\n"
                                           "/up - Вернуться на уровень выше\n"
                                           "/getmydata - Показать текущую папку и все файлы\n"
+                                          "/find <слова> - Найти заметки и документы по словам\n"
+                                          "/export - Скачать текущую папку со всеми вложенными архивом ZIP\n"
                                           "/share - Сделать текущую папку публичной\n"
                                           "/access <ключ> - Доступ к публичной папке по ключу")
 
     @bot.message_handler(commands=['mkdir'])
+    @timed_handler
     def handle_mkdir(message: Message):
         user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
 
         try:
             _, folder_name = message.text.split(maxsplit=1)
@@ -34,19 +41,17 @@ def register_command_handlers(bot: telebot.TeleBot):
             bot.reply_to(message, "Пожалуйста, укажите имя папки. Пример: /mkdir МояПапка")
             return
 
-        current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-        if folder_name in current["folders"]:
-            bot.reply_to(message, "Папка с таким именем уже существует.")
-        else:
-            current["folders"][folder_name] = {"folders": {}, "files": []}
-            save_data(data)
+        with transaction(write=True):
+            created = create_folder(user_id, get_current_node(user_id), folder_name)
+        if created is not None:
             bot.reply_to(message, f"Папка '{folder_name}' создана.")
+        else:
+            bot.reply_to(message, "Папка с таким именем уже существует.")
 
     @bot.message_handler(commands=['cd'])
+    @timed_handler
     def handle_cd(message: Message):
         user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
 
         try:
             _, folder_name = message.text.split(maxsplit=1)
@@ -54,36 +59,41 @@ def register_command_handlers(bot: telebot.TeleBot):
             bot.reply_to(message, "Пожалуйста, укажите имя папки. Пример: /cd МояПапка")
             return
 
-        current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-        if folder_name in current["folders"]:
-            data["users"][user_id]["current_path"].append(folder_name)
-            save_data(data)
+        with transaction(write=True):
+            node_id = get_node(user_id, get_current_node(user_id))["folders"].get(folder_name)
+            if node_id is not None:
+                set_current_node(user_id, node_id)
+        if node_id is not None:
             bot.reply_to(message, f"Перешли в папку '{folder_name}'.")
         else:
             bot.reply_to(message, "Папка не найдена.")
 
     @bot.message_handler(commands=['up'])
+    @timed_handler
     def handle_up(message: Message):
         user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
 
-        if data["users"][user_id]["current_path"]:
-            popped = data["users"][user_id]["current_path"].pop()
-            save_data(data)
+        popped = None
+        with transaction(write=True):
+            current = get_node(user_id, get_current_node(user_id))
+            if current["parent"] is not None:
+                popped = current["name"]
+                set_current_node(user_id, current["parent"])
+        if popped is not None:
             bot.reply_to(message, f"Вернулись из папки '{popped}'.")
         else:
             bot.reply_to(message, "Вы уже в корневой папке.")
 
     @bot.message_handler(commands=['getmydata'])
+    @timed_handler
     def handle_getmydata(message: Message):
         user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
 
-        current = navigate_to_path(data["users"][user_id]["structure"], data["users"][user_id]["current_path"])
-
-        markup = generate_markup(current, data["users"][user_id]["current_path"])
+        # Новый пользователь создаётся до читающей транзакции
+        ensure_user(user_id)
+        with transaction():
+            current = get_node(user_id, get_current_node(user_id))
+            markup = generate_markup(current, owner_id=user_id)
 
         try:
             bot.send_message(message.chat.id, "Ваша папочная структура:", reply_markup=markup)
@@ -91,71 +101,116 @@ def register_command_handlers(bot: telebot.TeleBot):
             bot.send_message(message.chat.id, f"Ошибка при отправке клавиатуры: {str(e)}")
 
     @bot.message_handler(commands=['share'])
+    @timed_handler
     def handle_share(message: Message):
         user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
-
-        current_path = data["users"][user_id]["current_path"]
-        structure = data["users"][user_id]["structure"]
-
-        # Навигация до текущей папки
-        try:
-            current = navigate_to_path(structure, current_path)
-        except KeyError:
-            bot.reply_to(message, "Текущая папка не существует.")
-            return
 
         # Генерация уникального ключа
         unique_key = uuid.uuid4().hex  # Генерирует 32-символьный уникальный ключ
 
-        # Сохранение связи ключа с пользователем и путем
-        data["shared_folders"][unique_key] = {
-            "user_id": user_id,
-            "path": current_path.copy()
-        }
+        with transaction(write=True):
+            current_node = get_current_node(user_id)
 
-        save_data(data)
+            # Проверка, что текущая папка существует
+            try:
+                get_node(user_id, current_node)
+            except KeyError:
+                current_node = None
+            else:
+                # Ключ указывает прямо на узел папки
+                create_share(unique_key, user_id, current_node)
+
+        if current_node is None:
+            bot.reply_to(message, "Текущая папка не существует.")
+            return
 
         # Отправка ключа пользователю
         bot.reply_to(message, f"Папка успешно сделана публичной.\nВаш ключ для доступа: `{unique_key}`\nИспользуйте команду /access <ключ> чтобы получить доступ.", parse_mode="Markdown")
 
     @bot.message_handler(commands=['access'])
+    @timed_handler
     def handle_access(message: Message):
-        user_id = str(message.chat.id)
-        data = load_data()
-        init_user(data, user_id)
-
         try:
             _, access_key = message.text.split(maxsplit=1)
         except ValueError:
             bot.reply_to(message, "Пожалуйста, укажите ключ доступа. Пример: /access <ключ>")
             return
 
-        shared = data.get("shared_folders", {}).get(access_key)
-        if not shared:
-            bot.reply_to(message, "Неверный или несуществующий ключ доступа.")
+        # Ответ отправляется после транзакции, чтобы не держать блокировки во время запроса к Telegram
+        error = None
+        with transaction():
+            shared = get_share(access_key)
+            if not shared:
+                error = "Неверный или несуществующий ключ доступа."
+            # Проверка, существует ли пользователь и папка
+            elif not user_exists(shared["user_id"]):
+                error = "Владелец папки не существует."
+            else:
+                owner_id = shared["user_id"]
+                try:
+                    shared_folder = get_node(owner_id, shared["node"])
+                except KeyError:
+                    error = "Папка не найдена."
+                else:
+                    # Генерация клавиатуры для публичной папки
+                    markup = generate_markup(shared_folder, shared_key=access_key, owner_id=owner_id,
+                                             root_id=shared_folder["id"])
+        if error:
+            bot.reply_to(message, error)
             return
 
-        owner_id = shared["user_id"]
-        path = shared["path"]
-
-        # Проверка, существует ли пользователь и папка
-        if owner_id not in data["users"]:
-            bot.reply_to(message, "Владелец папки не существует.")
-            return
+        # Навигация по кнопкам начинается с корня публичной папки
+        open_session(str(message.chat.id), dict(shared, key=access_key))
 
-        owner_structure = data["users"][owner_id]["structure"]
         try:
-            shared_folder = navigate_to_path(owner_structure, path)
-        except KeyError:
-            bot.reply_to(message, "Папка не найдена.")
+            bot.send_message(message.chat.id, "Содержимое публичной папки:", reply_markup=markup)
+        except telebot.apihelper.ApiTelegramException as e:
+            bot.send_message(message.chat.id, f"Ошибка при отправке клавиатуры: {str(e)}")
+
+    @bot.message_handler(commands=['find'])
+    @timed_handler
+    def handle_find(message: Message):
+        user_id = str(message.chat.id)
+
+        terms = tokenize(message.text.partition(" ")[2])
+        if not terms:
+            bot.reply_to(message, "Пожалуйста, укажите слова для поиска. Пример: /find отчёт 2023")
             return
 
-        # Генерация клавиатуры для публичной папки
-        markup = generate_markup(shared_folder, path, shared_key=access_key)
+        # Поиск идёт по индексу слов, без обхода папок; вне транзакции, чтобы первое
+        # построение индекса не держало блокировку пользователя
+        hits = search_files(user_id, terms)
+        if not hits:
+            bot.reply_to(message, "Ничего не найдено.")
+            return
+        results = find_results(user_id, hits[:SEARCH_PAGE_SIZE])
 
+        markup = generate_search_markup(results, " ".join(terms), 0, search_page_count(hits))
         try:
-            bot.send_message(message.chat.id, "Содержимое публичной папки:", reply_markup=markup)
+            bot.send_message(message.chat.id, f"Найдено: {len(hits)}.", reply_markup=markup)
         except telebot.apihelper.ApiTelegramException as e:
             bot.send_message(message.chat.id, f"Ошибка при отправке клавиатуры: {str(e)}")
+
+    @bot.message_handler(commands=['export'])
+    @timed_handler
+    def handle_export(message: Message):
+        user_id = str(message.chat.id)
+        node_id = get_current_node(user_id)
+
+        bot.reply_to(message, "Собираю архив текущей папки, это может занять некоторое время...")
+        try:
+            # Тома архива уходят с приоритетом массовой выгрузки
+            with priority(BULK):
+                result = export_folder(bot, message.chat.id, user_id, node_id)
+        except Exception as e:
+            logger.error(f"Ошибка при экспорте папки {node_id} пользователя {user_id}: {e}")
+            bot.send_message(message.chat.id, f"Ошибка при экспорте: {str(e)}")
+            return
+
+        if not result["volumes"]:
+            bot.send_message(message.chat.id, "В папке нет файлов.")
+            return
+        text = f"Архив отправлен: файлов {result['files']}, частей {result['volumes']}."
+        if result["failed"]:
+            text += f"\nНе удалось выгрузить файлов: {result['failed']} (список в «Ошибки.txt»)."
+        bot.send_message(message.chat.id, text)
@@ -0,0 +1,51 @@
+# migrate.py
+
+import argparse
+import logging
+import config
+from utils.data_manager import load_data, externalize_text, DATABASE_FILE, TEXT_STORE_DIR
+from utils.storage import create_storage
+from utils.storage.base import upgrade_document
+from utils.search import build_index, user_records
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def externalize_texts(document):
+    """Переносит длинные заметки документа в хранилище текстов; возвращает их число."""
+    moved = 0
+    for user in upgrade_document(document)["users"].values():
+        # Индекс поиска строится до переноса, пока полный текст заметок ещё в записях
+        if "search" not in user:
+            user["search"] = build_index(user_records(user))
+        for node in user["nodes"].values():
+            records = [externalize_text(record) for record in node["files"]]
+            moved += sum(new is not old for new, old in zip(records, node["files"]))
+            node["files"] = records
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт JSON-файлов данных бота в другое хранилище")
+    parser.add_argument("files", nargs="*", default=[config.DATA_FILE], help="JSON-файлы для импорта")
+    parser.add_argument("--backend", default="sqlite", help="Тип хранилища назначения")
+    parser.add_argument("--target", default=DATABASE_FILE, help="Путь к хранилищу назначения")
+    parser.add_argument("--externalize-texts", action="store_true",
+                        help=f"Перенести длинные заметки в хранилище текстов ({TEXT_STORE_DIR})")
+    args = parser.parse_args()
+
+    storage = create_storage(args.backend, args.target)
+    try:
+        for path in args.files:
+            document = load_data(path)
+            if args.externalize_texts:
+                logger.info(f"{path}: длинных заметок перенесено: {externalize_texts(document)}")
+            imported = storage.import_document(document)
+            logger.info(f"{path}: импортировано пользователей: {imported}")
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
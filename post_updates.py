@@ -0,0 +1,59 @@
+# post_updates.py
+
+import argparse
+import json
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def read_updates(path):
+    """Обновления из JSON-массива (как в ответе getUpdates) или из файла «одно обновление на строку»."""
+    with open(path, 'r', encoding='utf-8') as file:
+        content = file.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    lines = [json.loads(line) for line in content.splitlines() if line.strip()]
+    if len(lines) == 1 and "result" in lines[0]:
+        # Сохранённый ответ getUpdates целиком
+        return lines[0]["result"]
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений на webhook бота")
+    parser.add_argument("files", nargs="+", help="Файлы с обновлениями в формате JSON")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/webhook", help="Адрес webhook")
+    parser.add_argument("--secret", required=True, help="Секретный токен (WEBHOOK_SECRET)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Число одновременных запросов")
+    parser.add_argument("--repeat", type=int, default=1, help="Сколько раз отправить набор обновлений")
+    args = parser.parse_args()
+
+    updates = []
+    for path in args.files:
+        updates.extend(read_updates(path))
+    updates = updates * args.repeat
+
+    session = requests.Session()
+    headers = {SECRET_HEADER: args.secret}
+
+    def post(update):
+        return session.post(args.url, json=update, headers=headers, timeout=30).status_code
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        statuses = Counter(pool.map(post, updates))
+    elapsed = time.monotonic() - started
+    logger.info(f"Отправлено обновлений: {len(updates)} за {elapsed:.2f} с "
+                f"({len(updates) / elapsed:.0f}/с), ответы: {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    main()
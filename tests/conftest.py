@@ -0,0 +1,52 @@
+# tests/conftest.py
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Модули бота читают config.py при импорте; для тестов достаточно минимальных настроек,
+# если рядом нет настоящего config.py
+try:
+    import config  # noqa: F401
+except ImportError:
+    config = types.ModuleType("config")
+    config.BOT_TOKEN = "123:TEST"
+    # Каталог нужен уже при импорте модулей, до фикстур, поэтому удаляется при выходе
+    _config_directory = tempfile.mkdtemp(prefix="bot-tests-")
+    atexit.register(shutil.rmtree, _config_directory, ignore_errors=True)
+    config.DATA_FILE = os.path.join(_config_directory, "data.json")
+    sys.modules["config"] = config
+
+
+import pytest  # noqa: E402
+from utils.storage import create_storage  # noqa: E402
+
+BACKENDS = ("json", "journal", "sharded", "sqlite")
+
+
+def open_storage(backend, directory):
+    """Хранилище backend в каталоге directory; документные пишут на диск после каждой транзакции."""
+    if backend == "sqlite":
+        return create_storage(backend, os.path.join(directory, "data.sqlite3"))
+    if backend == "sharded":
+        return create_storage(backend, os.path.join(directory, "shards"), flush_interval=0)
+    return create_storage(backend, os.path.join(directory, "data.json"), flush_interval=0)
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def storage(backend, tmp_path):
+    storage = open_storage(backend, str(tmp_path))
+    yield storage
+    storage.close()
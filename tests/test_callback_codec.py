@@ -0,0 +1,96 @@
+# tests/test_callback_codec.py
+
+import uuid
+import pytest
+from utils import callback_codec as codec
+from utils import data_manager
+from utils.sessions import clear_sessions
+from handlers.callback_handlers import PrivateScope, SharedScope, CallbackError, legacy_folder_id
+
+KEY = uuid.uuid4().hex
+
+
+@pytest.mark.parametrize("op, args", [
+    (codec.UP, ()),
+    (codec.FOLDER, (300,)),
+    (codec.FILE, ("0a1b2c3d",)),
+    (codec.FILE, ("не-hex",)),
+    (codec.PAGE, (7, 2)),
+    (codec.SHARED_FOLDER, (codec.share_handle(KEY), 5)),
+    (codec.SHARED_FILE, (codec.share_handle(KEY), "abc")),
+    (codec.SEARCH_PAGE, (1, "отчёт 2023")),
+    (codec.JOB_CANCEL, ("ff00",)),
+])
+def test_round_trip(op, args):
+    callback = codec.encode(op, *args)
+    assert len(callback) <= codec.MAX_CALLBACK_DATA
+    assert codec.decode(callback) == (op, args)
+
+
+def test_rejects_broken_data():
+    callback = codec.encode(codec.PAGE, 7, 2)
+    for broken in (callback[:-2], callback + "AA", "AAAA", "!!"):
+        with pytest.raises(ValueError):
+            codec.decode(broken)
+
+
+@pytest.mark.parametrize("callback, expected", [
+    ("up", (codec.UP, ())),
+    ("retrieve_all", (codec.RETRIEVE_ALL, ())),
+    ("folder:Sub_1", (codec.FOLDER, ("Sub_1",))),
+    ("folder:", (codec.FOLDER, ("",))),
+    ("file:0a1b2c3d", (codec.FILE, ("0a1b2c3d",))),
+    (f"shared_up:{KEY}", (codec.SHARED_UP, (KEY, None))),
+    (f"shared_folder:{KEY}:Sub", (codec.SHARED_FOLDER, (KEY, "Sub"))),
+    (f"shared_file:{KEY}:0a1b2c3d", (codec.SHARED_FILE, (KEY, "0a1b2c3d"))),
+    (f"shared_retrieve_all:{KEY}", (codec.SHARED_RETRIEVE_ALL, (KEY, None))),
+])
+def test_legacy_decode(callback, expected):
+    assert codec.decode(callback) == expected
+
+
+@pytest.mark.parametrize("callback", ["folder", "folder:a:b", "page:1:2", "unknown:1"])
+def test_legacy_decode_rejects_unknown(callback):
+    with pytest.raises(ValueError):
+        codec.decode(callback)
+
+
+def test_legacy_name():
+    assert codec.legacy_name("Отчёты 2023 (new)") == "2023new"
+    assert codec.legacy_name("Папка") == ""
+
+
+@pytest.fixture
+def tree(storage, monkeypatch):
+    """Пользователь 1: корень -> Sub -> Inner, корень -> Отчёты; корень открыт по ключу KEY."""
+    monkeypatch.setattr(data_manager, "_storage", storage)
+    clear_sessions()
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    sub = storage.create_folder("1", root, "Sub")
+    inner = storage.create_folder("1", sub, "Inner")
+    reports = storage.create_folder("1", root, "Отчёты")
+    storage.create_share(KEY, "1", root)
+    yield {"root": root, "sub": sub, "inner": inner, "reports": reports}
+    clear_sessions()
+
+
+def test_legacy_folder_is_resolved_in_current_folder(tree):
+    scope = PrivateScope("1")
+    assert legacy_folder_id(scope, "Sub") == tree["sub"]
+    # Кириллическое имя в старом формате пустое: единственная такая папка находится
+    assert legacy_folder_id(scope, "") == tree["reports"]
+    with pytest.raises(CallbackError):
+        legacy_folder_id(scope, "Inner")
+    data_manager.set_current_node("1", tree["sub"])
+    assert legacy_folder_id(scope, "Inner") == tree["inner"]
+
+
+def test_legacy_shared_folder_is_resolved_in_session_folder(tree):
+    scope = SharedScope.resolve(KEY, "2")
+    # Новая сессия: имя ищется в корне публичной папки
+    assert legacy_folder_id(scope, "Sub") == tree["sub"]
+    scope.enter(data_manager.get_node("1", tree["sub"]))
+    assert legacy_folder_id(scope, "Inner") == tree["inner"]
+    with pytest.raises(CallbackError):
+        legacy_folder_id(scope, "Sub")
@@ -0,0 +1,82 @@
+# tests/test_callback_handlers.py
+
+import uuid
+from types import SimpleNamespace
+import pytest
+from utils import callback_codec as codec
+from utils import data_manager
+from utils.sessions import clear_sessions
+from handlers import callback_handlers
+from handlers.callback_handlers import register_callback_handlers
+
+KEY = uuid.uuid4().hex
+VIEWER = 2
+
+
+class StubBot:
+    """Запоминает обработчик нажатий и ответы бота вместо запросов к Telegram."""
+
+    def __init__(self):
+        self.handler = None
+        self.answers = []
+        self.calls = []
+
+    def callback_query_handler(self, func):
+        def decorator(handler):
+            self.handler = handler
+            return handler
+        return decorator
+
+    def answer_callback_query(self, query_id, text=None):
+        self.answers.append(text)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append(name)
+
+    def press(self, data):
+        message = SimpleNamespace(chat=SimpleNamespace(id=VIEWER), message_id=1)
+        self.handler(SimpleNamespace(id="1", data=data, message=message))
+        return self.answers[-1]
+
+
+@pytest.fixture
+def shared(storage, monkeypatch):
+    """Папка пользователя 1 «Общая» -> «Вложенная» открыта по ключу KEY."""
+    monkeypatch.setattr(data_manager, "_storage", storage)
+    clear_sessions()
+    storage.ensure_user("1")
+    root = storage.create_folder("1", storage.get_current_node("1"), "Общая")
+    inner = storage.create_folder("1", root, "Вложенная")
+    storage.add_file("1", inner, {"type": "text", "content": "заметка", "short_id": "aa01"})
+    storage.create_share(KEY, "1", root)
+    bot = StubBot()
+    register_callback_handlers(bot)
+    yield SimpleNamespace(bot=bot, root=root, inner=inner, handle=codec.share_handle(KEY))
+    clear_sessions()
+
+
+def test_shared_buttons_work_without_session(shared):
+    bot, handle, inner = shared.bot, shared.handle, shared.inner
+    # Сессий нет: сообщение с клавиатурой пережило перезапуск бота или истечение сессии
+    assert bot.press(codec.encode(codec.SHARED_RETRIEVE_ALL, handle, inner)) == "Все файлы отправлены."
+    assert bot.calls == ["send_message"]
+    clear_sessions()
+    assert bot.press(codec.encode(codec.SHARED_RETRIEVE_TREE, handle, shared.root)) == "Все файлы отправлены."
+    clear_sessions()
+    assert bot.press(codec.encode(codec.SHARED_UP, handle, inner)) == "Вернулись из папки 'Вложенная'."
+    clear_sessions()
+    assert bot.press(codec.encode(codec.SHARED_UP, handle, shared.root)) == "Вы уже в корне публичной папки."
+    clear_sessions()
+    assert bot.press(f"shared_retrieve_all:{KEY}") == "Все файлы отправлены."
+
+
+def test_shared_buttons_stay_inside_share(shared, storage):
+    outside = storage.get_current_node("1")
+    for op in (codec.SHARED_UP, codec.SHARED_RETRIEVE_ALL, codec.SHARED_RETRIEVE_TREE):
+        assert shared.bot.press(codec.encode(op, shared.handle, outside)) == "Папка не найдена."
+    assert shared.bot.calls == []
+
+
+def test_search_page_without_hits_skips_results(shared, monkeypatch):
+    monkeypatch.setattr(callback_handlers, "find_results", lambda *args: pytest.fail("find_results без результатов"))
+    assert shared.bot.press(codec.encode(codec.SEARCH_PAGE, 3, "несуществующее")) == "Ничего не найдено."
@@ -0,0 +1,41 @@
+# tests/test_capture.py
+
+import uuid
+from utils import callback_codec as codec
+from utils.capture import Anonymizer
+
+KEY = uuid.uuid4().hex
+
+
+def test_search_page_query_is_anonymized_and_decodable():
+    anonymizer = Anonymizer()
+    data = anonymizer.callback_data(codec.encode(codec.SEARCH_PAGE, 1, "зарплата иванов"))
+    assert "зарплата" not in data and "иванов" not in data
+    op, (page, query) = codec.decode(data)
+    assert (op, page) == (codec.SEARCH_PAGE, 1)
+    assert "зарплата" not in query and "иванов" not in query
+    assert len(query) == len("зарплата иванов")
+
+
+def test_job_cancel_survives_anonymization():
+    data = Anonymizer().callback_data(codec.encode(codec.JOB_CANCEL, "0a1b2c3d"))
+    assert codec.decode(data) == (codec.JOB_CANCEL, ("0a1b2c3d",))
+
+
+def test_share_handle_is_replaced_consistently():
+    anonymizer = Anonymizer()
+    handle = codec.share_handle(KEY)
+    first = codec.decode(anonymizer.callback_data(codec.encode(codec.SHARED_FOLDER, handle, 5)))
+    second = codec.decode(anonymizer.callback_data(codec.encode(codec.SHARED_PAGE, handle, 5, 1)))
+    assert first[0] == codec.SHARED_FOLDER and first[1][1] == 5
+    assert first[1][0] == second[1][0] != handle
+    # Ссылка совпадает с началом ключа из обезличенной команды /access
+    assert anonymizer.text(f"/access {KEY}").split()[1].startswith(first[1][0].hex())
+
+
+def test_legacy_callback_stays_legacy():
+    anonymizer = Anonymizer()
+    data = anonymizer.callback_data(f"shared_folder:{KEY}:Secret")
+    assert KEY not in data and "Secret" not in data
+    assert codec.decode(data) == (codec.SHARED_FOLDER, (anonymizer.share_key(KEY), "xxxxxx"))
+    assert anonymizer.callback_data("file:0a1b2c3d") == "file:0a1b2c3d"
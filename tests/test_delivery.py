@@ -0,0 +1,69 @@
+# tests/test_delivery.py
+
+from utils.delivery import plan_delivery, deliver_files, MAX_ALBUM_SIZE, MAX_MESSAGE_LENGTH
+
+
+def media(kind, number):
+    return {"type": kind, "file_id": f"{kind}{number}", "short_id": f"{number:08x}"}
+
+
+def note(content):
+    return {"type": "text", "content": content}
+
+
+def kinds(steps):
+    return [(kind, len(payload) if kind == "album" else None, done) for kind, payload, done in steps]
+
+
+def test_media_are_grouped_into_albums_in_order():
+    files = ([media("photo", 1), media("video", 2), media("document", 3), media("document", 4),
+              media("audio", 5), media("photo", 6)])
+    steps = plan_delivery(files)
+    assert kinds(steps) == [("album", 2, 2), ("album", 2, 2), ("file", None, 1), ("file", None, 1)]
+    assert [file["file_id"] for _, payload, _ in steps[:2] for file in payload] == ["photo1", "video2", "document3", "document4"]
+    assert steps[2][1]["file_id"] == "audio5"
+
+
+def test_album_is_split_at_limit():
+    steps = plan_delivery([media("photo", number) for number in range(MAX_ALBUM_SIZE * 2 + 1)])
+    assert kinds(steps) == [("album", MAX_ALBUM_SIZE, MAX_ALBUM_SIZE), ("album", MAX_ALBUM_SIZE, MAX_ALBUM_SIZE),
+                            ("file", None, 1)]
+
+
+def test_texts_are_packed_between_media():
+    steps = plan_delivery([note("a"), note("b"), media("photo", 1), note("c"), {"type": "sticker"}])
+    assert steps[0] == ("text", "Текст: a\n\nТекст: b", 2)
+    assert steps[1][0] == "file" and steps[2] == ("text", "Текст: c", 1)
+    assert steps[3] == ("file", {"type": "sticker"}, 1)
+
+
+def test_long_text_is_split_and_counted_once():
+    # С префиксом «Текст: » заметка занимает три сообщения
+    long = "x" * (MAX_MESSAGE_LENGTH * 2)
+    files = [note("a"), note(long), note("b")]
+    steps = plan_delivery(files)
+    assert all(len(payload) <= MAX_MESSAGE_LENGTH for _, payload, _ in steps)
+    # Заметка считается отправленной только с последней своей частью
+    assert [done for _, _, done in steps] == [1, 0, 0, 2]
+    assert sum(done for _, _, done in steps) == len(files)
+
+
+def test_done_counts_cover_every_record():
+    files = ([note("t") for _ in range(3)] + [media("photo", number) for number in range(12)]
+             + [media("audio", 1), note("x" * 5000), {"type": "unknown"}])
+    assert sum(done for _, _, done in plan_delivery(files)) == len(files)
+
+
+class RecordingBot:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append(name)
+
+
+def test_deliver_files_sends_one_request_per_step():
+    bot = RecordingBot()
+    files = [note("a"), note("b"), media("photo", 1), media("photo", 2), media("document", 3)]
+    assert deliver_files(bot, 1, files) == 3
+    assert bot.calls == ["send_message", "send_media_group", "send_document"]
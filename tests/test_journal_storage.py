@@ -0,0 +1,72 @@
+# tests/test_journal_storage.py
+
+import os
+from utils.storage.journal_storage import JournalStorage
+
+
+def open_journal(tmp_path):
+    # Сворачивание только явным flush(): остальное время изменения живут в журнале
+    return JournalStorage(str(tmp_path / "data.json"), flush_interval=3600, flush_max_mutations=10 ** 6)
+
+
+def make_folders(storage, names):
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    for name in names:
+        storage.create_folder("1", root, name)
+    return root
+
+
+def folder_names(storage):
+    return sorted(storage.get_node("1", storage.get_current_node("1"))["folders"])
+
+
+def test_journal_is_replayed_without_snapshot(tmp_path):
+    storage = open_journal(tmp_path)
+    make_folders(storage, ["A", "B"])
+    assert not os.path.exists(tmp_path / "data.json")
+    # Процесс «упал»: снимка нет, изменения восстанавливаются из журнала
+    restored = open_journal(tmp_path)
+    assert folder_names(restored) == ["A", "B"]
+    restored.close()
+
+
+def test_compaction_moves_journal_into_snapshot(tmp_path):
+    storage = open_journal(tmp_path)
+    make_folders(storage, ["A"])
+    storage.flush()
+    assert os.path.getsize(tmp_path / "data.json.journal") == 0
+    assert not os.path.exists(tmp_path / "data.json.journal.old")
+    root = storage.get_current_node("1")
+    storage.create_folder("1", root, "B")
+    restored = open_journal(tmp_path)
+    assert folder_names(restored) == ["A", "B"]
+    restored.close()
+    storage.close()
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    storage = open_journal(tmp_path)
+    make_folders(storage, ["A"])
+    with open(tmp_path / "data.json.journal", "a", encoding="utf-8") as journal:
+        journal.write('{"seq": 99, "op": "mkd')
+    restored = open_journal(tmp_path)
+    assert folder_names(restored) == ["A"]
+    # Новая запись не склеивается с оборванной строкой
+    restored.create_folder("1", restored.get_current_node("1"), "B")
+    again = open_journal(tmp_path)
+    assert folder_names(again) == ["A", "B"]
+    again.close()
+
+
+def test_interrupted_compaction_keeps_old_journal(tmp_path):
+    storage = open_journal(tmp_path)
+    make_folders(storage, ["A"])
+    # Журнал переименован в .old, но снимок так и не записан
+    with storage._lock.write():
+        storage._serialize(storage._document, {"1"})
+    assert os.path.exists(tmp_path / "data.json.journal.old")
+    storage.create_folder("1", storage.get_current_node("1"), "B")
+    restored = open_journal(tmp_path)
+    assert folder_names(restored) == ["A", "B"]
+    restored.close()
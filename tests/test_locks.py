@@ -0,0 +1,106 @@
+# tests/test_locks.py
+
+import threading
+import time
+from conftest import open_storage
+from utils.storage import create_storage
+from utils.storage.base import SHARED_KEY
+from utils.storage.locks import KeyLocks, ReadWriteLock
+
+
+def run(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def test_same_key_is_exclusive_and_other_keys_are_not():
+    locks = KeyLocks()
+    locks.acquire("1")
+    acquired = threading.Event()
+    waiter = run(lambda: (locks.acquire("1"), acquired.set()))
+    other = run(lambda: (locks.acquire("2"), locks.release("2")))
+    other.join(5)
+    assert not other.is_alive()
+    assert not acquired.wait(0.1)
+    locks.release("1")
+    assert acquired.wait(5)
+    waiter.join()
+    locks.release("1")
+    assert not locks.is_locked("1") and not locks._locks
+
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    order = []
+
+    def writer():
+        with lock.write():
+            order.append("writer")
+
+    def reader():
+        lock.acquire_read()
+        order.append("reader")
+        lock.release_read()
+
+    writing = run(writer)
+    while not lock._writers_waiting:
+        time.sleep(0.001)
+    reading = run(reader)
+    time.sleep(0.05)
+    assert order == []
+    lock.release_read()
+    writing.join(5)
+    reading.join(5)
+    assert order == ["writer", "reader"]
+
+
+def test_transaction_holds_keys_until_end_and_takes_shared_key_last(tmp_path):
+    storage = open_storage("json", str(tmp_path))
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    with storage.transaction():
+        storage.create_folder("1", root, "a")
+        assert storage.is_locked("1") and not storage.is_locked(SHARED_KEY)
+        storage.create_share("k" * 32, "1", root)
+        assert storage._local.keys == ["1", SHARED_KEY]
+    assert not storage.is_locked("1") and not storage.is_locked(SHARED_KEY)
+    storage.close()
+
+
+def test_transactions_of_one_user_are_serialized(tmp_path):
+    # Сброс в фоне: при синхронном сбросе запись ждала бы все открытые транзакции
+    storage = create_storage("journal", str(tmp_path / "data.json"))
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    inside = threading.Event()
+    release = threading.Event()
+    created = []
+
+    def holder():
+        with storage.transaction():
+            storage.create_folder("1", root, "a")
+            inside.set()
+            release.wait(5)
+
+    def other_user():
+        storage.ensure_user("2")
+        created.append("2")
+
+    def same_user():
+        created.append(storage.create_folder("1", root, "b"))
+
+    holding = run(holder)
+    assert inside.wait(5)
+    second = run(other_user)
+    second.join(5)
+    assert created == ["2"]
+    third = run(same_user)
+    time.sleep(0.05)
+    assert created == ["2"]
+    release.set()
+    holding.join(5)
+    third.join(5)
+    assert len(created) == 2 and created[1] is not None
+    storage.close()
@@ -0,0 +1,134 @@
+# tests/test_search.py
+
+import json
+import os
+import pytest
+from conftest import open_storage
+from utils.search import tokenize, lookup, build_index, index_record
+
+BASELINE = {
+    "users": {
+        "1": {
+            "current_path": [],
+            "structure": {"folders": {}, "files": [{"type": "text", "content": "hello world"}]},
+            "file_mappings": {},
+        },
+    },
+    "shared_folders": {},
+}
+
+
+def note(short_id, content):
+    return {"type": "text", "content": content, "short_id": short_id}
+
+
+def test_tokenize_normalizes_words():
+    assert tokenize("Ёжик, ежик и ЁЖИК_2023!") == ["ежик", "2023"]
+
+
+def test_lookup_intersects_and_returns_newest_first():
+    index = build_index([note("a", "отчёт за май"), note("b", "отчёт за июнь"), note("c", "май отчёт")])
+    assert lookup(index, tokenize("отчёт май")) == ["c", "a"]
+    assert lookup(index, tokenize("отчёт август")) == []
+    index_record(index, "d", tokenize("август"))
+    assert lookup(index, ["август"]) == ["d"]
+
+
+def test_imported_baseline_note_is_found(storage):
+    storage.import_document(json.loads(json.dumps(BASELINE)))
+    [short_id] = storage.search("1", ["hello"])
+    assert storage.find_file("1", short_id)["record"]["content"] == "hello world"
+
+
+def test_new_records_are_indexed(storage):
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    storage.add_file("1", root, note("aa01", "первая заметка"))
+    assert storage.search("1", ["заметка"]) == ["aa01"]
+    storage.add_file("1", root, note("aa02", "вторая заметка"))
+    storage.add_file("1", root, {"type": "text", "preview": "длинная", "text_key": "k", "short_id": "aa03"},
+                     terms=["длинная", "заметка", "целиком"])
+    assert storage.search("1", ["заметка"]) == ["aa03", "aa02", "aa01"]
+    assert storage.search("1", ["целиком"]) == ["aa03"]
+
+
+def test_long_note_added_before_index_is_found_by_full_text(storage):
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    record = {"type": "text", "preview": "длинная", "text_key": "k", "short_id": "aa01"}
+    storage.add_file("1", root, record, terms=["длинная", "секрет"])
+    texts = {"k": "длинная заметка: секрет"}
+    assert storage.search("1", ["секрет"], lambda record: texts[record["text_key"]]) == ["aa01"]
+
+
+def test_rolled_back_record_leaves_index(storage):
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    storage.add_file("1", root, note("aa01", "заметка"))
+    assert storage.search("1", ["заметка"]) == ["aa01"]
+    with pytest.raises(RuntimeError):
+        with storage.transaction(write=True):
+            storage.add_file("1", root, note("aa02", "заметка откат"))
+            raise RuntimeError()
+    assert storage.search("1", ["заметка"]) == ["aa01"]
+    assert storage.search("1", ["откат"]) == []
+
+
+@pytest.mark.parametrize("backend", ["json", "journal", "sharded"])
+def test_index_is_kept_outside_user_data(backend, tmp_path):
+    storage = open_storage(backend, str(tmp_path))
+    storage.ensure_user("1")
+    storage.add_file("1", storage.get_current_node("1"), note("aa01", "заметка"))
+    storage.search("1", ["заметка"])
+    storage.close()
+
+    if backend == "sharded":
+        with open(tmp_path / "shards" / "users" / "1.json", encoding="utf-8") as file:
+            user = json.load(file)
+        assert os.path.exists(tmp_path / "shards" / "search" / "1.json")
+    else:
+        with open(tmp_path / "data.json", encoding="utf-8") as file:
+            user = json.load(file)["users"]["1"]
+        assert os.path.exists(tmp_path / "data.json.search" / "1.json")
+    assert "search" not in user
+
+    reopened = open_storage(backend, str(tmp_path))
+    try:
+        # Индекс читается с диска, а не строится заново
+        assert reopened._search.exists("1")
+        assert reopened.search("1", ["заметка"]) == ["aa01"]
+    finally:
+        reopened.close()
+
+
+def test_journal_tail_is_replayed_into_index(tmp_path):
+    from utils.storage.journal_storage import JournalStorage
+    path = str(tmp_path / "data.json")
+    storage = JournalStorage(path, flush_interval=3600, flush_max_mutations=10 ** 6)
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    storage.add_file("1", root, note("aa01", "заметка"))
+    storage.search("1", ["заметка"])
+    storage.flush()
+    # Запись только в журнале: индекс на диске её ещё не содержит
+    storage.add_file("1", root, note("aa02", "заметка из журнала"))
+    restored = JournalStorage(path, flush_interval=3600, flush_max_mutations=10 ** 6)
+    assert restored.search("1", ["заметка"]) == ["aa02", "aa01"]
+    assert restored.search("1", ["журнала"]) == ["aa02"]
+
+
+def test_embedded_index_is_moved_out(tmp_path):
+    # Индекс старого формата внутри пользователя (его же оставляет migrate.py --externalize-texts)
+    document = json.loads(json.dumps(BASELINE))
+    document["users"]["1"] = {
+        "current": 0, "next_node": 1, "file_mappings": {},
+        "nodes": {"0": {"id": 0, "parent": None, "name": "", "folders": {}, "version": 0,
+                        "files": [{"type": "text", "preview": "начало", "text_key": "k", "short_id": "bb01"}]}},
+        "search": {"начало": ["bb01"], "продолжение": ["bb01"]},
+    }
+    (tmp_path / "data.json").write_text(json.dumps(document, ensure_ascii=False), encoding="utf-8")
+    storage = open_storage("json", str(tmp_path))
+    assert storage.search("1", ["продолжение"]) == ["bb01"]
+    storage.close()
+    with open(tmp_path / "data.json", encoding="utf-8") as file:
+        assert "search" not in json.load(file)["users"]["1"]
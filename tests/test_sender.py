@@ -0,0 +1,31 @@
+# tests/test_sender.py
+
+import time
+from utils.sender import SendScheduler, RateLimitedBot
+
+
+class EchoBot:
+    def send_message(self, chat_id, text):
+        return chat_id, text
+
+
+def test_channel_usernames_are_accepted():
+    bot = RateLimitedBot(EchoBot(), SendScheduler())
+    assert bot.send_message("@channel", "привет") == ("@channel", "привет")
+    assert bot.send_message(chat_id="@channel", text="ещё") == ("@channel", "ещё")
+
+
+def test_numeric_strings_share_bucket_with_ids():
+    scheduler = SendScheduler()
+    scheduler.acquire("42")
+    scheduler.acquire(42)
+    assert list(scheduler._chats) == [42]
+
+
+def test_block_applies_to_channel_only():
+    scheduler = SendScheduler()
+    scheduler.block("@channel", 60)
+    assert scheduler._chats["@channel"].blocked_until > time.monotonic() + 30
+    started = time.monotonic()
+    scheduler.acquire(1)
+    assert time.monotonic() - started < 1
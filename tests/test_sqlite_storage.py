@@ -0,0 +1,73 @@
+# tests/test_sqlite_storage.py
+
+import sqlite3
+import threading
+import pytest
+from utils.storage.sqlite_storage import SqliteStorage
+
+
+def test_close_closes_connections_of_all_threads(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "data.sqlite3"))
+    threads = [threading.Thread(target=storage.ensure_user, args=(str(number),)) for number in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    connections = list(storage._connections)
+    assert len(connections) == 4
+
+    storage.close()
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
+
+
+def test_reads_do_not_wait_for_write_transaction(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "data.sqlite3"))
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    writing = threading.Event()
+    done = threading.Event()
+
+    def writer():
+        with storage.transaction(write=True):
+            storage.create_folder("1", root, "Новая")
+            writing.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        assert writing.wait(5)
+        # Читатель видит данные до незавершённой записи и не ждёт её блокировку
+        assert storage.get_node("1", root)["folders"] == {}
+        assert storage.get_current_node("1") == root
+    finally:
+        done.set()
+        thread.join()
+    assert list(storage.get_node("1", root)["folders"]) == ["Новая"]
+    storage.close()
+
+
+def test_write_inside_read_transaction_fails_fast(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "data.sqlite3"))
+    storage.ensure_user("1")
+    other = threading.Thread(target=storage.ensure_user, args=("2",))
+    with storage.transaction():
+        assert storage.user_exists("1")
+        # Другое соединение записывает после того, как читающая транзакция получила снимок
+        other.start()
+        other.join()
+        with pytest.raises(RuntimeError):
+            storage.get_current_node("3")
+        with pytest.raises(RuntimeError):
+            storage.create_folder("1", storage.get_current_node("1"), "a")
+    # Созданный заранее пользователь читается в той же ситуации без записи
+    storage.ensure_user("3")
+    other = threading.Thread(target=storage.ensure_user, args=("4",))
+    with storage.transaction():
+        assert storage.user_exists("1")
+        other.start()
+        other.join()
+        assert storage.get_node("3", storage.get_current_node("3"))["parent"] is None
+    storage.close()
@@ -0,0 +1,64 @@
+# tests/test_storage.py
+
+import pytest
+from conftest import open_storage
+
+
+class Failure(Exception):
+    pass
+
+
+def test_failed_transaction_is_rolled_back(storage, backend, tmp_path):
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    with pytest.raises(Failure):
+        with storage.transaction(write=True):
+            node_id = storage.create_folder("1", root, "Новая")
+            storage.set_current_node("1", node_id)
+            storage.add_file("1", node_id, {"type": "text", "content": "заметка", "short_id": "aa11"})
+            storage.add_media("1", root, {"type": "photo", "file_id": "F1", "short_id": "bb22"}, "U1")
+            storage.create_share("0123456789abcdef0123456789abcdef", "1", node_id)
+            raise Failure()
+
+    def check(storage):
+        node = storage.get_node("1", root)
+        assert node["folders"] == {}
+        assert node["files"] == []
+        assert storage.get_current_node("1") == root
+        assert storage.find_file("1", "aa11") is None
+        assert storage.find_file("1", "bb22") is None
+        assert storage.get_share("0123456789abcdef0123456789abcdef") is None
+
+    check(storage)
+    # Откат не должен оставить изменений и на диске
+    storage.close()
+    reopened = open_storage(backend, str(tmp_path))
+    try:
+        check(reopened)
+        # После отката хранилище продолжает работать как обычно
+        assert reopened.create_folder("1", root, "Новая") is not None
+    finally:
+        reopened.close()
+
+
+def test_rolled_back_user_is_not_created(storage):
+    with pytest.raises(Failure):
+        with storage.transaction(write=True):
+            storage.ensure_user("2")
+            raise Failure()
+    assert not storage.user_exists("2")
+
+
+def test_rollback_keeps_earlier_transactions(storage):
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    kept = storage.create_folder("1", root, "Старая")
+    with pytest.raises(Failure):
+        with storage.transaction(write=True):
+            storage.add_media("1", root, {"type": "photo", "file_id": "F1", "short_id": "cc33"}, "U1")
+            storage.create_folder("1", kept, "Вложенная")
+            raise Failure()
+    assert storage.get_node("1", root)["folders"] == {"Старая": kept}
+    assert storage.get_node("1", kept)["folders"] == {}
+    # Медиа, добавленное после отката, снова считается новым
+    assert storage.add_media("1", root, {"type": "photo", "file_id": "F1", "short_id": "cc33"}, "U1") == "added"
@@ -0,0 +1,86 @@
+# tests/test_upgrade.py
+
+import json
+from conftest import open_storage
+from utils.keyboards import generate_markup
+from utils.storage.sqlite_storage import SqliteStorage
+
+# Данные в формате до перехода на узлы: у заметок нет short_id
+BASELINE = {
+    "users": {
+        "1": {
+            "current_path": ["Работа"],
+            "structure": {
+                "folders": {
+                    "Работа": {"folders": {}, "files": [{"type": "text", "content": "hello world"}]},
+                },
+                "files": [
+                    {"type": "text", "content": "первая заметка"},
+                    {"type": "document", "file_id": "DOC", "file_name": "a.pdf", "short_id": "0a0b0c0d"},
+                ],
+            },
+            "file_mappings": {"0a0b0c0d": "DOC"},
+        },
+    },
+    "shared_folders": {},
+}
+
+
+def all_records(storage, user_id):
+    records = []
+    with storage.transaction():
+        root = storage.get_node(user_id, storage.get_current_node(user_id))
+        while root["parent"] is not None:
+            root = storage.get_node(user_id, root["parent"])
+        stack = [root["id"]]
+        while stack:
+            node = storage.get_node(user_id, stack.pop())
+            records.extend(node["files"])
+            stack.extend(node["folders"].values())
+    return records
+
+
+def test_imported_notes_get_short_ids(storage):
+    storage.import_document(json.loads(json.dumps(BASELINE)))
+    records = all_records(storage, "1")
+    assert len(records) == 3
+    assert all(record.get("short_id") for record in records)
+    assert len({record["short_id"] for record in records}) == 3
+    # Записи с short_id остаются прежними
+    assert storage.find_file("1", "0a0b0c0d")["record"]["file_id"] == "DOC"
+    for record in records:
+        assert storage.find_file("1", record["short_id"])["record"] == record
+
+
+def test_note_buttons_are_rendered(storage):
+    storage.import_document(json.loads(json.dumps(BASELINE)))
+    node = storage.get_node("1", storage.get_current_node("1"))
+    buttons = [button.text for row in generate_markup(node).markup.keyboard for button in row]
+    assert "📝 Текст 1" in buttons
+
+
+def test_short_ids_are_stable_across_loads(tmp_path):
+    # Файл старого формата читается без пересохранения: short_id не должен меняться
+    (tmp_path / "data.json").write_text(json.dumps(BASELINE, ensure_ascii=False), encoding="utf-8")
+    first = open_storage("json", str(tmp_path))
+    ids = [record["short_id"] for record in all_records(first, "1")]
+    first.close()
+    second = open_storage("json", str(tmp_path))
+    assert [record["short_id"] for record in all_records(second, "1")] == ids
+    second.close()
+
+
+def test_sqlite_rows_without_short_id_are_filled(tmp_path):
+    path = str(tmp_path / "data.sqlite3")
+    storage = SqliteStorage(path)
+    storage.ensure_user("1")
+    root = storage.get_current_node("1")
+    with storage.transaction() as connection:
+        connection.execute("INSERT INTO files (folder_id, type, content) VALUES (?, 'text', 'hello sqlite')", (root,))
+    storage.close()
+
+    reopened = SqliteStorage(path)
+    [record] = reopened.get_node("1", root)["files"]
+    assert record.get("short_id")
+    assert reopened.search("1", ["sqlite"]) == [record["short_id"]]
+    reopened.close()
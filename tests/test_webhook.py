@@ -0,0 +1,60 @@
+# tests/test_webhook.py
+
+import http.client
+import json
+import threading
+import pytest
+from utils.webhook import WebhookServer, SECRET_HEADER
+
+SECRET = "s3cret"
+UPDATE = json.dumps({"update_id": 1}).encode()
+
+
+@pytest.fixture
+def server():
+    received = []
+    server = WebhookServer(received.extend, SECRET, host="127.0.0.1", port=0)
+    server.received = received
+    yield server
+    server._server.server_close()
+
+
+def test_valid_update_is_queued(server):
+    assert server.accept("/webhook", {SECRET_HEADER: SECRET}, UPDATE) == 200
+    assert server.depth() == 1
+
+
+@pytest.mark.parametrize("path, token, status", [
+    ("/other", SECRET, 404),
+    ("/webhook", "wrong", 403),
+    ("/webhook", "", 403),
+    ("/webhook", "sécret", 403),
+    ("/webhook", "секрет", 403),
+])
+def test_path_and_secret_are_checked(server, path, token, status):
+    assert server.accept(path, {SECRET_HEADER: token}, UPDATE) == status
+    assert server.depth() == 0
+
+
+@pytest.mark.parametrize("body", [b"", b"\xff", b"not json", b"[]", b"1", b"null", b"{}", b'{"message": {}}'])
+def test_malformed_update_is_rejected(server, body):
+    assert server.accept("/webhook", {SECRET_HEADER: SECRET}, body) == 400
+    assert server.depth() == 0
+
+
+@pytest.mark.parametrize("length, status", [(str(len(UPDATE)), 200), ("abc", 400), ("-1", 400)])
+def test_content_length_over_http(server, length, status):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        connection.putrequest("POST", "/webhook")
+        connection.putheader(SECRET_HEADER, SECRET)
+        connection.putheader("Content-Length", length)
+        connection.endheaders(UPDATE)
+        assert connection.getresponse().status == status
+        connection.close()
+    finally:
+        server.shutdown()
+        thread.join()
+    assert len(server.received) == (status == 200)
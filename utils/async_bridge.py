@@ -0,0 +1,102 @@
+# utils/async_bridge.py
+
+import asyncio
+import functools
+import logging
+from inspect import iscoroutinefunction
+from telebot import apihelper, asyncio_helper
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update):
+    """Чат, к которому относится сообщение или нажатие кнопки."""
+    if hasattr(update, "chat"):
+        return update.chat.id
+    if getattr(update, "message", None) is not None:
+        return update.message.chat.id
+    return update.from_user.id
+
+
+class ChatLocks:
+    """asyncio.Lock на каждый чат; замок удаляется, когда его никто не ждёт."""
+
+    def __init__(self):
+        self._locks = {}
+
+    def pending(self):
+        """Сколько обработчиков выполняется или ждёт своей очереди в чате."""
+        # Копия значений: метрики читаются из другого потока
+        return sum(users for lock, users in list(self._locks.values()))
+
+    async def run(self, chat_id, func, *args):
+        lock, users = self._locks.get(chat_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock:
+                return await func(*args)
+        finally:
+            lock, users = self._locks[chat_id]
+            if users == 1:
+                del self._locks[chat_id]
+            else:
+                self._locks[chat_id] = (lock, users - 1)
+
+
+class AsyncBridge:
+    """
+    Синхронный интерфейс TeleBot поверх AsyncTeleBot, чтобы существующие обработчики
+    работали в асинхронном режиме без переписывания.
+    Обработчики выполняются в пуле потоков (хранилище и ожидание лимитов не блокируют цикл
+    событий), обновления разных чатов обрабатываются параллельно, одного чата — по порядку.
+    Вызовы методов бота из обработчиков передаются в цикл событий и ждут результата.
+    """
+
+    def __init__(self, bot, loop):
+        self.bot = bot
+        self.loop = loop
+        self.chat_locks = ChatLocks()
+
+    def _handler(self, register, **kwargs):
+        def decorator(handler):
+            async def run(update):
+                await self.chat_locks.run(update_chat_id(update), asyncio.to_thread, handler, update)
+
+            register(**kwargs)(run)
+            return handler
+
+        return decorator
+
+    def message_handler(self, **kwargs):
+        return self._handler(self.bot.message_handler, **kwargs)
+
+    def callback_query_handler(self, func, **kwargs):
+        return self._handler(self.bot.callback_query_handler, func=func, **kwargs)
+
+    def call(self, coroutine):
+        """Выполняет корутину в цикле событий бота и ждёт результата из рабочего потока."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coroutine.close()
+            raise RuntimeError("Синхронный вызов бота из цикла событий привёл бы к взаимоблокировке")
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        except asyncio_helper.ApiTelegramException as e:
+            # Обработчики и планировщик отправки ждут исключение синхронного API
+            raise apihelper.ApiTelegramException(e.function_name, e.result, e.result_json) from e
+
+    def __getattr__(self, name):
+        attr = getattr(self.bot, name)
+        if not iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def method(*args, **kwargs):
+            return self.call(attr(*args, **kwargs))
+
+        return method
@@ -0,0 +1,218 @@
+# utils/callback_codec.py
+
+import base64
+import binascii
+from utils.storage.base import SHARE_PREFIX_LENGTH
+
+# callback_data — base64url без "=" от байтов [версия, код операции, аргументы...].
+# Размер не зависит от имён папок: id узлов и номера страниц — varint, публичная папка —
+# первые байты её ключа, short_id — упакованный hex.
+VERSION = 1
+MAX_CALLBACK_DATA = 64
+
+# Коды операций
+UP = 1
+FOLDER = 2
+FILE = 3
+RETRIEVE_ALL = 4
+PAGE = 5
+SHARED_UP = 6
+SHARED_FOLDER = 7
+SHARED_FILE = 8
+SHARED_RETRIEVE_ALL = 9
+SHARED_PAGE = 10
+SEARCH_PAGE = 11
+RETRIEVE_TREE = 12
+SHARED_RETRIEVE_TREE = 13
+JOB_CANCEL = 14
+
+# Аргументы операций: "n" — целое >= 0, "s" — публичная папка, "h" — short_id,
+# "t" — строка в UTF-8 (запрос /find); id фоновой задачи упаковывается как short_id
+SCHEMAS = {
+    UP: "",
+    FOLDER: "n",
+    FILE: "h",
+    RETRIEVE_ALL: "",
+    PAGE: "nn",
+    SHARED_UP: "sn",
+    SHARED_FOLDER: "sn",
+    SHARED_FILE: "sh",
+    SHARED_RETRIEVE_ALL: "sn",
+    SHARED_PAGE: "snn",
+    SEARCH_PAGE: "nt",
+    RETRIEVE_TREE: "",
+    SHARED_RETRIEVE_TREE: "sn",
+    JOB_CANCEL: "h",
+}
+
+# Ключ публичной папки в callback_data заменяется его началом: 8 байт (64 бита) ключа
+# не угадать перебором, в отличие от порядкового номера
+SHARE_HANDLE_SIZE = SHARE_PREFIX_LENGTH // 2
+
+# Старый текстовый формат ("folder:<имя>", "shared_file:<ключ>:<short_id>", ...), который
+# остаётся на клавиатурах уже отправленных сообщений. Папка в нём указана именем, из которого
+# удалены все символы, кроме LEGACY_NAME_CHARS (кириллическое имя становится пустым)
+LEGACY_COMMANDS = {
+    "up": UP,
+    "folder": FOLDER,
+    "file": FILE,
+    "retrieve_all": RETRIEVE_ALL,
+    "shared_up": SHARED_UP,
+    "shared_folder": SHARED_FOLDER,
+    "shared_file": SHARED_FILE,
+    "shared_retrieve_all": SHARED_RETRIEVE_ALL,
+}
+# Кнопки "shared_up" и "shared_retrieve_all" старого формата не указывали папку: вместо неё None
+LEGACY_SCHEMAS = {**SCHEMAS, SHARED_UP: "s", SHARED_RETRIEVE_ALL: "s"}
+LEGACY_NAME_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-")
+
+# Имя операции (для логов и статистики маршрутов)
+OP_NAMES = {op: name for name, op in LEGACY_COMMANDS.items()}
+OP_NAMES.update({PAGE: "page", SHARED_PAGE: "shared_page", SEARCH_PAGE: "search_page",
+                 RETRIEVE_TREE: "retrieve_tree", SHARED_RETRIEVE_TREE: "shared_retrieve_tree",
+                 JOB_CANCEL: "job_cancel"})
+
+
+def share_handle(key):
+    """Короткая ссылка на публичную папку для callback_data."""
+    return bytes.fromhex(key[:SHARE_PREFIX_LENGTH])
+
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError(f"Отрицательное число в callback_data: {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("Оборванное число в callback_data")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def _write_short_id(out, short_id):
+    # Младший бит длины: 0 — hex, упакованный по два символа в байт, 1 — строка в UTF-8
+    try:
+        if len(short_id) % 2:
+            raise ValueError
+        raw = bytes.fromhex(short_id)
+        _write_varint(out, len(raw) << 1)
+    except ValueError:
+        raw = short_id.encode("utf-8")
+        _write_varint(out, len(raw) << 1 | 1)
+    out += raw
+
+
+def _read_short_id(data, position):
+    header, position = _read_varint(data, position)
+    end = position + (header >> 1)
+    if end > len(data):
+        raise ValueError("Оборванная строка в callback_data")
+    raw = data[position:end]
+    return (raw.decode("utf-8") if header & 1 else raw.hex()), end
+
+
+def _write_text(out, text):
+    raw = text.encode("utf-8")
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _read_text(data, position):
+    length, position = _read_varint(data, position)
+    end = position + length
+    if end > len(data):
+        raise ValueError("Оборванная строка в callback_data")
+    return data[position:end].decode("utf-8"), end
+
+
+def encode(op, *args):
+    """Упаковывает операцию и её аргументы в callback_data."""
+    schema = SCHEMAS[op]
+    if len(args) != len(schema):
+        raise ValueError(f"Операции {op} нужно аргументов: {len(schema)}")
+    out = bytearray((VERSION, op))
+    for kind, value in zip(schema, args):
+        if kind == "n":
+            _write_varint(out, value)
+        elif kind == "s":
+            out += value
+        elif kind == "t":
+            _write_text(out, value)
+        else:
+            _write_short_id(out, value)
+    callback = base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode("ascii")
+    if len(callback) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиной {len(callback)} байт превышает {MAX_CALLBACK_DATA} байта.")
+    return callback
+
+
+def legacy_name(name):
+    """Имя папки в том виде, в каком оно попадало в callback_data старого формата."""
+    return "".join(char for char in name if char in LEGACY_NAME_CHARS)
+
+
+def is_legacy(callback):
+    """callback_data старого текстового формата."""
+    return ":" in callback or callback in LEGACY_COMMANDS
+
+
+def _decode_legacy(callback):
+    command, *args = callback.split(":")
+    op = LEGACY_COMMANDS.get(command)
+    schema = LEGACY_SCHEMAS.get(op)
+    if schema is None or len(args) != len(schema):
+        raise ValueError(f"Неизвестная команда: {callback}")
+    # Все аргументы остаются строками: вместо ссылки на публичную папку здесь её полный ключ,
+    # вместо id папки — её имя (см. legacy_name)
+    return op, tuple(args) + (None,) * (len(SCHEMAS[op]) - len(schema))
+
+
+def decode(callback):
+    """
+    Возвращает (код операции, аргументы). Публичная папка передаётся как bytes
+    (начало ключа) или, для старого формата, как str (полный ключ); папка для старого формата —
+    как str (имя, см. legacy_name) вместо id. ValueError, если не разобрать.
+    """
+    if is_legacy(callback):
+        return _decode_legacy(callback)
+    try:
+        data = base64.urlsafe_b64decode(callback + "=" * (-len(callback) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError(f"Неверный callback_data: {callback}")
+    if len(data) < 2 or data[0] != VERSION or data[1] not in SCHEMAS:
+        raise ValueError(f"Неизвестная версия или операция callback_data: {callback}")
+    op = data[1]
+    position = 2
+    values = []
+    for kind in SCHEMAS[op]:
+        if kind == "n":
+            value, position = _read_varint(data, position)
+        elif kind == "s":
+            value = data[position:position + SHARE_HANDLE_SIZE]
+            if len(value) != SHARE_HANDLE_SIZE:
+                raise ValueError("Оборванная ссылка на папку в callback_data")
+            position += SHARE_HANDLE_SIZE
+        elif kind == "t":
+            value, position = _read_text(data, position)
+        else:
+            value, position = _read_short_id(data, position)
+        values.append(value)
+    if position != len(data):
+        raise ValueError(f"Лишние байты в callback_data: {callback}")
+    return op, tuple(values)
@@ -0,0 +1,241 @@
+# utils/capture.py
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from utils import callback_codec as codec
+from utils.storage.base import SHARE_PREFIX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Части обновления, которые попадают в запись; остальные (опросы, участники групп, ...) боту не нужны
+UPDATE_FIELDS = ("message", "edited_message", "callback_query")
+# Поля сообщения, которые переносятся как есть
+MESSAGE_FIELDS = ("message_id", "date", "media_group_id", "forward_date")
+MEDIA_FIELDS = ("document", "photo", "video", "audio", "voice", "video_note", "animation", "sticker")
+# Поля файла, которые переносятся как есть (file_id и имя файла подменяются)
+FILE_FIELDS = ("mime_type", "file_size", "width", "height", "duration")
+# Команды, аргумент которых — ключ публичной папки (подменяется так же, как в callback_data)
+SHARE_KEY_COMMANDS = ("/access",)
+# Как часто сбрасывать сжатый поток на диск, секунды
+FLUSH_INTERVAL = 5.0
+
+
+class Anonymizer:
+    """
+    Обезличивание обновлений для записи: id чатов и пользователей заменяются порядковыми
+    псевдонимами, имена удаляются, текст — строкой "x" той же длины (у команд остаётся
+    сама команда), file_id и ключи публичных папок — ключевым хэшем со случайной солью.
+    В пределах одной записи замены согласованы, поэтому порядок по чатам, повторные
+    нажатия и ссылки на одни и те же файлы сохраняются.
+    """
+
+    def __init__(self, salt=None):
+        self._salt = salt or secrets.token_bytes(16)
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def _hash(self, value, length):
+        digest = hashlib.blake2b(value.encode("utf-8"), key=self._salt, digest_size=32).hexdigest()
+        return (digest * (length // len(digest) + 1))[:length]
+
+    def chat_id(self, value):
+        # Знак сохраняется: отрицательные id — группы и каналы
+        with self._lock:
+            pseudonym = self._ids.setdefault(abs(value), len(self._ids) + 1)
+        return pseudonym if value > 0 else -pseudonym
+
+    def user(self, user):
+        return {"id": self.chat_id(user["id"]), "is_bot": user.get("is_bot", False), "first_name": "user"}
+
+    def chat(self, chat):
+        return {"id": self.chat_id(chat["id"]), "type": chat.get("type", "private")}
+
+    def share_key(self, key):
+        # Начало ключа обезличивается отдельно, чтобы совпадало со ссылкой из callback_data
+        head = key[:SHARE_PREFIX_LENGTH]
+        return self._hash("share:" + head, len(head)) + self._hash("share:" + key, len(key) - len(head))
+
+    def text(self, text):
+        if not text.startswith("/"):
+            return "x" * len(text)
+        command, separator, rest = text.partition(" ")
+        if command.split("@")[0] in SHARE_KEY_COMMANDS and rest:
+            return command + separator + self.share_key(rest)
+        return command + separator + "x" * len(rest)
+
+    def file(self, media):
+        result = {key: media[key] for key in FILE_FIELDS if key in media}
+        for key in ("file_id", "file_unique_id"):
+            if key in media:
+                result[key] = self._hash("file:" + media[key], len(media[key]))
+        if "file_name" in media:
+            result["file_name"] = "file" + os.path.splitext(media["file_name"])[1]
+        return result
+
+    def message(self, message):
+        result = {key: message[key] for key in MESSAGE_FIELDS if key in message}
+        result["chat"] = self.chat(message["chat"])
+        if "from" in message:
+            result["from"] = self.user(message["from"])
+        if "forward_from" in message:
+            result["forward_from"] = self.user(message["forward_from"])
+        if "forward_from_chat" in message:
+            result["forward_from_chat"] = self.chat(message["forward_from_chat"])
+        for key, entities in (("text", "entities"), ("caption", "caption_entities")):
+            if key in message:
+                result[key] = self.text(message[key])
+                # Длина текста не меняется, поэтому смещения команд остаются верными
+                commands = [entity for entity in message.get(entities, ()) if entity["type"] == "bot_command"]
+                if commands:
+                    result[entities] = commands
+        for key in MEDIA_FIELDS:
+            if key in message:
+                media = message[key]
+                result[key] = [self.file(size) for size in media] if isinstance(media, list) else self.file(media)
+        return result
+
+    def callback_data(self, data):
+        try:
+            op, args = codec.decode(data)
+        except ValueError:
+            return "x" * len(data)
+        if codec.is_legacy(data):
+            return self._legacy_callback_data(data, op, args)
+        values = []
+        for kind, arg in zip(codec.SCHEMAS[op], args):
+            if kind == "s":
+                values.append(bytes.fromhex(self.share_key(arg.hex())))
+            elif kind == "t":
+                # Запрос /find заменяется так же, как текст сообщений
+                values.append("x" * len(arg))
+            else:
+                values.append(arg)
+        return codec.encode(op, *values)
+
+    def _legacy_callback_data(self, data, op, args):
+        # Старый текстовый формат остаётся текстовым: вместо ключа — его хэш, вместо имени
+        # папки — "x" той же длины (как в обезличенной команде /mkdir)
+        values = []
+        for kind, arg in zip(codec.LEGACY_SCHEMAS[op], args):
+            if kind == "s":
+                values.append(self.share_key(arg))
+            elif kind == "n":
+                values.append("x" * len(arg))
+            else:
+                values.append(arg)
+        return ":".join([data.split(":")[0]] + values)
+
+    def callback_query(self, query):
+        result = {"id": self._hash("query:" + query["id"], len(query["id"])),
+                  "from": self.user(query["from"]),
+                  "chat_instance": "0"}
+        if "data" in query:
+            result["data"] = self.callback_data(query["data"])
+        if "message" in query:
+            result["message"] = self.message(query["message"])
+        return result
+
+    def update(self, update_id, parts):
+        """parts — имя части обновления -> её исходный JSON (как пришёл от Telegram)."""
+        result = {"update_id": update_id}
+        for key, raw in parts.items():
+            result[key] = self.callback_query(raw) if key == "callback_query" else self.message(raw)
+        return result
+
+
+def raw_parts(update):
+    """Исходный JSON частей обновления: TeleBot хранит его в .json сообщений и нажатий кнопок."""
+    parts = {}
+    for key in UPDATE_FIELDS:
+        part = getattr(update, key, None)
+        if part is not None and isinstance(getattr(part, "json", None), dict):
+            parts[key] = part.json
+    return parts
+
+
+class UpdateRecorder:
+    """
+    Запись входящих обновлений для последующего воспроизведения (benchmarks/replay.py).
+    Файл — gzip со строками JSON {"t": секунды от начала записи, "update": {...}};
+    обновления обезличиваются до записи (см. Anonymizer).
+    Дозапись в существующий файл добавляет новый gzip-поток: время в нём снова идёт с нуля,
+    а псевдонимы у каждого запуска бота свои.
+    """
+
+    def __init__(self, path, anonymizer=None):
+        self.path = path
+        self.anonymizer = anonymizer or Anonymizer()
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._flushed = self._started
+        self._update_ids = 0
+        self.recorded = 0
+
+    def record(self, updates):
+        # Под общей блокировкой: время в файле не должно идти назад (см. read_capture)
+        with self._lock:
+            if self._file is None:
+                return
+            now = time.monotonic()
+            for update in updates:
+                parts = raw_parts(update)
+                if not parts:
+                    continue
+                try:
+                    self._update_ids += 1
+                    line = json.dumps({"t": round(now - self._started, 3),
+                                       "update": self.anonymizer.update(self._update_ids, parts)},
+                                      ensure_ascii=False, separators=(",", ":"))
+                except (KeyError, TypeError, ValueError) as e:
+                    # Обновление неожиданной формы не должно мешать обработке
+                    logger.warning(f"Не удалось записать обновление {update.update_id}: {e}")
+                    continue
+                self._file.write(line + "\n")
+                self.recorded += 1
+            if now - self._flushed >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed = now
+
+    def wrap(self, process_updates):
+        """Функция обработки обновлений, которая сначала записывает их."""
+        def recorded(updates):
+            self.record(updates)
+            return process_updates(updates)
+        return recorded
+
+    def wrap_async(self, process_updates):
+        """То же для корутины AsyncTeleBot.process_new_updates."""
+        async def recorded(updates):
+            self.record(updates)
+            return await process_updates(updates)
+        return recorded
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        logger.info(f"Записано обновлений: {self.recorded} в {self.path}")
+
+
+def read_capture(path):
+    """Записанные обновления по порядку: пары (секунды от начала записи, JSON обновления)."""
+    offset = 0.0
+    last = 0.0
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            # В дозаписанном потоке время начинается заново — продолжаем общую шкалу
+            if entry["t"] < last:
+                offset += last
+            last = entry["t"]
+            yield offset + last, entry["update"]
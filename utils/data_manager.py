@@ -1,26 +1,221 @@
 # utils/data_manager.py
 
-import json
-import os
+import threading
+import config
 from config import DATA_FILE
+from utils.storage import create_storage
+from utils.storage.base import new_user, MEDIA_ADDED, MEDIA_LINKED, MEDIA_DUPLICATE
+from utils.storage.json_storage import read_document, write_document
+from utils.storage.text_store import TextStore
+from utils.search import record_terms
 
-def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {"users": {}, "shared_folders": {}}
-    with open(DATA_FILE, 'r', encoding='utf-8') as file:
-        return json.load(file)
+# Тип хранилища: "json" (один файл DATA_FILE), "journal" (снимок DATA_FILE и журнал мутаций),
+# "sharded" (файл на пользователя в SHARD_DIR) или "sqlite" (DATABASE_FILE)
+STORAGE_BACKEND = getattr(config, "STORAGE_BACKEND", "json")
+DATABASE_FILE = getattr(config, "DATABASE_FILE", "data.sqlite3")
+# Отложенная запись JSON: интервал сброса в секундах (0 — писать сразу) и порог числа изменений
+FLUSH_INTERVAL = getattr(config, "FLUSH_INTERVAL", 5.0)
+FLUSH_MAX_MUTATIONS = getattr(config, "FLUSH_MAX_MUTATIONS", 100)
+# Журнал: fsync после каждой записи и частота сворачивания журнала в снимок
+JOURNAL_FSYNC = getattr(config, "JOURNAL_FSYNC", False)
+COMPACT_INTERVAL = getattr(config, "COMPACT_INTERVAL", 300.0)
+COMPACT_MAX_MUTATIONS = getattr(config, "COMPACT_MAX_MUTATIONS", 10000)
+# Шарды: каталог и сколько пользователей держать в памяти
+SHARD_DIR = getattr(config, "SHARD_DIR", "data_shards")
+SHARD_CACHE_SIZE = getattr(config, "SHARD_CACHE_SIZE", 1000)
+# Снимок документа для "json" и "journal": формат ("json", "json-pretty", "msgpack") и сжатие
+# (None, "gzip", "zstd"); при чтении формат определяется автоматически
+SNAPSHOT_FORMAT = getattr(config, "SNAPSHOT_FORMAT", "json")
+SNAPSHOT_COMPRESSION = getattr(config, "SNAPSHOT_COMPRESSION", None)
+# Заметки длиннее TEXT_INLINE_LIMIT символов хранятся сжатыми в TEXT_STORE_DIR, а в папке
+# остаются ссылка и первые TEXT_PREVIEW_LENGTH символов
+TEXT_STORE_DIR = getattr(config, "TEXT_STORE_DIR", "text_blobs")
+TEXT_INLINE_LIMIT = getattr(config, "TEXT_INLINE_LIMIT", 512)
+TEXT_PREVIEW_LENGTH = getattr(config, "TEXT_PREVIEW_LENGTH", 100)
+
+_storage = None
+_storage_lock = threading.Lock()
+_text_store = None
+
+
+def get_storage():
+    global _storage
+    if _storage is not None:
+        return _storage
+    with _storage_lock:
+        if _storage is not None:
+            return _storage
+        if STORAGE_BACKEND == "sqlite":
+            _storage = create_storage(STORAGE_BACKEND, DATABASE_FILE)
+        elif STORAGE_BACKEND == "journal":
+            _storage = create_storage(STORAGE_BACKEND, DATA_FILE,
+                                      fsync=JOURNAL_FSYNC,
+                                      format=SNAPSHOT_FORMAT,
+                                      compression=SNAPSHOT_COMPRESSION,
+                                      flush_interval=COMPACT_INTERVAL,
+                                      flush_max_mutations=COMPACT_MAX_MUTATIONS)
+        elif STORAGE_BACKEND == "sharded":
+            _storage = create_storage(STORAGE_BACKEND, SHARD_DIR,
+                                      cache_size=SHARD_CACHE_SIZE,
+                                      flush_interval=FLUSH_INTERVAL,
+                                      flush_max_mutations=FLUSH_MAX_MUTATIONS)
+        else:
+            _storage = create_storage(STORAGE_BACKEND, DATA_FILE,
+                                      format=SNAPSHOT_FORMAT,
+                                      compression=SNAPSHOT_COMPRESSION,
+                                      flush_interval=FLUSH_INTERVAL,
+                                      flush_max_mutations=FLUSH_MAX_MUTATIONS)
+        return _storage
+
+
+def set_storage(storage):
+    """Подставляет готовое хранилище вместо заданного в config.py (бенчмарки, миграции)."""
+    global _storage
+    with _storage_lock:
+        _storage = storage
+
+
+def get_text_store():
+    global _text_store
+    if _text_store is None:
+        _text_store = TextStore(TEXT_STORE_DIR)
+    return _text_store
+
+
+def set_text_store(store):
+    """Подставляет хранилище текстов вместо TEXT_STORE_DIR (бенчмарки)."""
+    global _text_store
+    _text_store = store
+
+
+def externalize_text(record):
+    """Длинную заметку переносит в хранилище текстов; в записи остаются ключ и превью."""
+    content = record.get("content")
+    if record["type"] != "text" or content is None or len(content) <= TEXT_INLINE_LIMIT:
+        return record
+    external = {key: value for key, value in record.items() if key != "content"}
+    external["preview"] = content[:TEXT_PREVIEW_LENGTH]
+    external["text_key"] = get_text_store().put(content)
+    return external
+
+
+def load_text(record):
+    """Полный текст заметки: из записи или, для длинных, из хранилища текстов (KeyError, если его нет)."""
+    if "content" in record:
+        return record["content"]
+    return get_text_store().get(record["text_key"])
+
+
+def transaction(write=False):
+    """Объединяет операции обработчика в одну транзакцию хранилища; write — если в ней есть изменения."""
+    return get_storage().transaction(write)
+
+
+def ensure_user(user_id):
+    get_storage().ensure_user(user_id)
+
+
+def user_exists(user_id):
+    return get_storage().user_exists(user_id)
+
+
+def get_current_node(user_id):
+    """id текущей папки пользователя (пользователь создаётся при необходимости)."""
+    return get_storage().get_current_node(user_id)
+
+
+def set_current_node(user_id, node_id):
+    get_storage().set_current_node(user_id, node_id)
+
+
+def get_node(user_id, node_id):
+    """Папка по id: {"id", "parent", "name", "folders": {имя: id}, "files": [...]}; KeyError, если её нет."""
+    return get_storage().get_node(user_id, node_id)
+
+
+def create_folder(user_id, parent_id, name):
+    return get_storage().create_folder(user_id, parent_id, name)
+
+
+def add_file(user_id, node_id, record):
+    stored = externalize_text(record)
+    # Слова длинной заметки для поиска берутся из полного текста, пока он ещё в записи
+    terms = record_terms(record) if stored is not record else None
+    get_storage().add_file(user_id, node_id, stored, terms)
+
+
+def add_media(user_id, node_id, record, unique_id):
+    """Сохраняет медиа по file_unique_id; MEDIA_ADDED, MEDIA_LINKED или MEDIA_DUPLICATE (уже есть в папке)."""
+    return get_storage().add_media(user_id, node_id, record, unique_id)
+
+
+def find_file(user_id, short_id):
+    """Находит файл пользователя по short_id без обхода папок: {"node": id, "record": {...}} или None."""
+    return get_storage().find_file(user_id, short_id)
+
+
+def search_files(user_id, terms):
+    """short_id файлов пользователя, в которых есть все слова terms (см. utils.search.tokenize), от новых к старым."""
+    return get_storage().search(user_id, terms, load_text)
+
+
+def find_results(user_id, short_ids):
+    """Файлы по short_id с путями их папок: [{"node", "record", "path"}]; пропавшие пропускаются."""
+    results = []
+    with transaction():
+        for short_id in short_ids:
+            found = find_file(user_id, short_id)
+            if found:
+                results.append(dict(found, path=get_storage().folder_path(user_id, found["node"])))
+    return results
+
+
+def is_within(user_id, node_id, ancestor_id):
+    return get_storage().is_within(user_id, node_id, ancestor_id)
+
+
+def get_share(key):
+    return get_storage().get_share(key)
+
+
+def find_share(prefix):
+    """Публичная папка по началу ключа (из callback_data): {"key", "user_id", "node"} или None."""
+    return get_storage().find_share(prefix)
+
+
+def create_share(key, user_id, node_id):
+    get_storage().create_share(key, user_id, node_id)
+
+
+def storage_size():
+    """Размер данных хранилища на диске в байтах (None, если неизвестен)."""
+    return get_storage().size_on_disk()
+
+
+def flush_storage():
+    """Принудительно сбрасывает отложенные изменения на диск."""
+    if _storage is not None and hasattr(_storage, "flush"):
+        _storage.flush()
+
+
+def close_storage():
+    """Сбрасывает изменения и закрывает хранилище; вызывается при остановке бота."""
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
+
+
+# Работа с файлом данных целиком (используется при миграции)
+
+def load_data(path=DATA_FILE):
+    return read_document(path)
+
+
+def save_data(data, path=DATA_FILE):
+    write_document(path, data, SNAPSHOT_FORMAT, SNAPSHOT_COMPRESSION)
 
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
 
 def init_user(data, user_id):
     if user_id not in data["users"]:
-        data["users"][user_id] = {
-            "current_path": [],
-            "structure": {
-                "folders": {},
-                "files": []
-            },
-            "file_mappings": {}  # Добавляем поле для сопоставления short_id и file_id
-        }
\ No newline at end of file
+        data["users"][user_id] = new_user()
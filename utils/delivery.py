@@ -0,0 +1,140 @@
+# utils/delivery.py
+
+import logging
+from telebot.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+from utils.sender import priority, BULK
+from utils.data_manager import load_text
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Bot API
+MAX_ALBUM_SIZE = 10
+MAX_MESSAGE_LENGTH = 4096
+
+INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+# Фото и видео можно смешивать в одном альбоме, документы и аудио — только с однотипными
+ALBUM_GROUPS = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+
+
+def format_text(file):
+    # Текст длинной заметки читается из хранилища текстов только здесь, при отправке
+    try:
+        content = load_text(file)
+    except KeyError:
+        logger.error(f"Текст заметки {file.get('short_id')} не найден в хранилище текстов")
+        content = f"{file.get('preview', '')}… (полный текст недоступен)"
+    return f"Текст: {content}"
+
+
+def split_text(text, limit=MAX_MESSAGE_LENGTH):
+    """Режет слишком длинный текст на части не длиннее limit."""
+    return [text[i:i + limit] for i in range(0, len(text), limit)] or [""]
+
+
+def plan_delivery(files):
+    """
+    Разбивает записи папки на шаги отправки с сохранением порядка:
+    ("album", [записи], n) — подряд идущие медиа одной группы (до 10 штук),
+    ("text", текст, n) — подряд идущие тексты, склеенные в сообщения до 4096 символов,
+    ("file", запись, 1) — одиночное медиа или запись неизвестного типа.
+    n — сколько записей отправлено целиком после этого шага (часть длинной заметки — 0),
+    по нему фоновые задачи запоминают, с какой записи продолжать.
+    """
+    steps = []
+    album = []
+    album_group = None
+    texts = []
+
+    def flush_album():
+        nonlocal album, album_group
+        if len(album) == 1:
+            steps.append(("file", album[0], 1))
+        elif album:
+            steps.append(("album", album, len(album)))
+        album = []
+        album_group = None
+
+    def flush_texts():
+        nonlocal texts
+        message = ""
+        # Сколько заметок вошло в message целиком
+        done = 0
+        for text in texts:
+            parts = split_text(text)
+            for number, part in enumerate(parts, start=1):
+                if message and len(message) + 2 + len(part) <= MAX_MESSAGE_LENGTH:
+                    message = f"{message}\n\n{part}"
+                else:
+                    if message:
+                        steps.append(("text", message, done))
+                        done = 0
+                    message = part
+                if number == len(parts):
+                    done += 1
+        if message:
+            steps.append(("text", message, done))
+        texts = []
+
+    for file in files:
+        group = ALBUM_GROUPS.get(file["type"])
+        if file["type"] == "text":
+            flush_album()
+            texts.append(format_text(file))
+            continue
+        flush_texts()
+        if group is None:
+            flush_album()
+            steps.append(("file", file, 1))
+            continue
+        if group != album_group or len(album) == MAX_ALBUM_SIZE:
+            flush_album()
+            album_group = group
+        album.append(file)
+    flush_album()
+    flush_texts()
+    return steps
+
+
+def send_file(bot, chat_id, file):
+    """Отправляет одну запись подходящим методом Bot API."""
+    if file["type"] == "text":
+        for part in split_text(format_text(file)):
+            bot.send_message(chat_id, part)
+    elif file["type"] == "document":
+        bot.send_document(chat_id=chat_id, document=file["file_id"])
+    elif file["type"] == "photo":
+        bot.send_photo(chat_id=chat_id, photo=file["file_id"])
+    elif file["type"] == "video":
+        bot.send_video(chat_id=chat_id, video=file["file_id"])
+    elif file["type"] == "audio":
+        bot.send_audio(chat_id=chat_id, audio=file["file_id"])
+    else:
+        bot.send_message(chat_id, "Неизвестный тип файла.")
+
+
+def send_step(bot, chat_id, kind, payload):
+    """Выполняет один шаг из plan_delivery."""
+    if kind == "album":
+        media = [INPUT_MEDIA[file["type"]](media=file["file_id"]) for file in payload]
+        bot.send_media_group(chat_id, media)
+    elif kind == "text":
+        bot.send_message(chat_id, payload)
+    else:
+        send_file(bot, chat_id, payload)
+
+
+def deliver_files(bot, chat_id, files):
+    """Отправляет записи папки альбомами и склеенными текстами; возвращает число запросов к API."""
+    steps = plan_delivery(files)
+    # Выгрузка папки уступает очередь интерактивным ответам
+    with priority(BULK):
+        for kind, payload, done in steps:
+            send_step(bot, chat_id, kind, payload)
+    logger.debug(f"Отправлено записей: {len(files)}, запросов: {len(steps)}")
+    return len(steps)
@@ -0,0 +1,69 @@
+# utils/dispatch.py
+
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Поля Update, в которых есть чат
+CHAT_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post",
+               "my_chat_member", "chat_member", "chat_join_request")
+
+
+def chat_of_update(update):
+    """id чата, к которому относится обновление; None, если чата нет."""
+    for field in CHAT_FIELDS:
+        value = getattr(update, field, None)
+        if value is not None:
+            return value.chat.id
+    call = update.callback_query
+    if call is not None:
+        return call.message.chat.id if call.message else call.from_user.id
+    return None
+
+
+class ChatDispatcher:
+    """
+    Раздаёт обновления TeleBot пулу потоков по chat.id: обновления одного чата
+    обрабатывает один поток по порядку, разных чатов — параллельно.
+    Бот должен быть создан с threaded=False, чтобы обработчики выполнялись в потоке пула.
+    Очереди ограничены, поэтому при перегрузке polling ждёт, а не копит обновления в памяти.
+    """
+
+    def __init__(self, bot, workers=8, queue_size=1000):
+        self._process = bot.process_new_updates
+        self._queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self._threads = []
+        for number, updates in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(updates,), name=f"chat-worker-{number}")
+            thread.start()
+            self._threads.append(thread)
+        bot.process_new_updates = self.submit
+
+    def submit(self, updates):
+        for update in updates:
+            chat_id = chat_of_update(update)
+            index = hash(chat_id) % len(self._queues) if chat_id is not None else 0
+            self._queues[index].put(update)
+
+    def depth(self):
+        """Сколько обновлений ждёт в очередях потоков."""
+        return sum(updates.qsize() for updates in self._queues)
+
+    def _run(self, updates):
+        while True:
+            update = updates.get()
+            if update is None:
+                break
+            try:
+                self._process([update])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+
+    def close(self):
+        """Дожидается обработки уже полученных обновлений и останавливает потоки."""
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,223 @@
+# utils/export.py
+
+import io
+import logging
+import posixpath
+import re
+import tempfile
+import zipfile
+import config
+import requests
+from telebot import apihelper
+from utils.data_manager import get_node, load_text
+
+logger = logging.getLogger(__name__)
+
+# Бот может отправить документ до 50 МБ; тома архива с запасом меньше
+EXPORT_VOLUME_SIZE = getattr(config, "EXPORT_VOLUME_SIZE", 45 * 1024 * 1024)
+# Том собирается в памяти, пока не превысит столько байт, дальше — во временном файле
+EXPORT_SPOOL_SIZE = getattr(config, "EXPORT_SPOOL_SIZE", 4 * 1024 * 1024)
+# Файлы скачиваются и пишутся в архив кусками такого размера
+EXPORT_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_TIMEOUT = 60
+DEFAULT_FILE_URL = "https://api.telegram.org/file/bot{0}/{1}"
+
+# Запас на локальный и центральный заголовки записи ZIP (с полями zip64) сверх двух копий имени
+ZIP_ENTRY_OVERHEAD = 200
+ZIP_END_SIZE = 100
+
+# Расширение, если Telegram не сообщил путь файла с расширением
+DEFAULT_EXTENSIONS = {"photo": ".jpg", "video": ".mp4", "audio": ".mp3"}
+UNSAFE_CHARACTERS = re.compile(r'[\x00-\x1f/\\:*?"<>|]')
+
+
+def safe_name(name, default):
+    """Имя файла или папки, допустимое в архиве на любой ОС."""
+    name = UNSAFE_CHARACTERS.sub("_", name or "").strip(" .")
+    return name or default
+
+
+def walk_subtree(user_id, node_id):
+    """
+    (путь папки относительно node_id, записи папки) для node_id и всех вложенных папок.
+    Каждая папка читается своей транзакцией: данные пользователя не блокируются на время выгрузки.
+    """
+    stack = [(node_id, [])]
+    while stack:
+        node_id, path = stack.pop()
+        node = get_node(user_id, node_id)
+        yield path, node["files"]
+        # В обратном порядке, чтобы папки выгружались в порядке следования
+        for name, child_id in reversed(list(node["folders"].items())):
+            stack.append((child_id, path + [safe_name(name, "папка")]))
+
+
+def open_download(bot, file_id):
+    """
+    (размер и путь из getFile, ответ с телом файла). Адрес строится как в TeleBot.download_file,
+    но тело читается потоком, а не целиком в память.
+    """
+    info = bot.get_file(file_id)
+    url = (apihelper.FILE_URL or DEFAULT_FILE_URL).format(bot.token, info.file_path)
+    response = requests.get(url, stream=True, proxies=apihelper.proxy, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code != 200:
+        response.close()
+        raise apihelper.ApiHTTPException("Download file", response)
+    return info.file_size, info.file_path, response
+
+
+class VolumeFile(io.RawIOBase):
+    """
+    Готовый том для send_document. Запрос, повторённый после 429, должен отправить том целиком:
+    чтение целиком (requests) всегда идёт с начала, а чтение кусками (aiohttp) после конца
+    файла возвращается к началу.
+    """
+
+    def __init__(self, file, name):
+        super().__init__()
+        self.file = file
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self.file.seek(0)
+            return self.file.read()
+        data = self.file.read(size)
+        if not data:
+            self.file.seek(0)
+        return data
+
+
+class ZipVolumes:
+    """
+    Архив, разбитый на самостоятельные ZIP-тома не больше volume_size байт (по границам файлов).
+    Том собирается в SpooledTemporaryFile и передаётся в on_volume(VolumeFile) сразу после
+    заполнения, поэтому в памяти одновременно не больше одного тома и куска скачиваемого файла.
+    """
+
+    def __init__(self, base_name, on_volume, volume_size=EXPORT_VOLUME_SIZE, spool_size=EXPORT_SPOOL_SIZE):
+        self.base_name = base_name
+        self.on_volume = on_volume
+        self.volume_size = volume_size
+        self.spool_size = spool_size
+        self.volumes = 0
+        self.entries = 0
+        self._file = None
+        self._zip = None
+        self._central_size = 0
+
+    def _open(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        self._zip = zipfile.ZipFile(self._file, "w")
+        self._central_size = 0
+        self._names = set()
+
+    def _unique(self, name):
+        stem, extension = posixpath.splitext(name)
+        number = 1
+        while name in self._names:
+            number += 1
+            name = f"{stem} ({number}){extension}"
+        self._names.add(name)
+        return name
+
+    def _reserve(self, name, size):
+        """Начинает новый том, если запись размером size в текущий не помещается."""
+        needed = size + 2 * len(name.encode("utf-8")) + ZIP_ENTRY_OVERHEAD
+        if self._zip is not None and self._zip.filelist:
+            if self._file.tell() + self._central_size + needed + ZIP_END_SIZE > self.volume_size:
+                self._finish()
+        if self._zip is None:
+            self._open()
+        self._central_size += ZIP_ENTRY_OVERHEAD // 2 + len(name.encode("utf-8"))
+
+    def add(self, name, chunks, size, compress=True):
+        """Записывает в архив файл name из итератора кусков chunks; size — ожидаемый размер (0 — неизвестен)."""
+        self._reserve(name, size)
+        info = zipfile.ZipInfo(self._unique(name))
+        # Медиа и так сжаты: без сжатия они не тратят процессор
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        with self._zip.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+        self.entries += 1
+
+    def add_text(self, name, text):
+        data = text.encode("utf-8")
+        self.add(name, [data], len(data))
+
+    def _finish(self):
+        self._zip.close()
+        self.volumes += 1
+        name = f"{self.base_name}.zip" if self.volumes == 1 else f"{self.base_name}.part{self.volumes}.zip"
+        try:
+            self.on_volume(VolumeFile(self._file, name))
+        finally:
+            self._file.close()
+            self._file = None
+            self._zip = None
+
+    def close(self):
+        """Отдаёт последний том; возвращает число томов."""
+        if self._zip is not None and self._zip.filelist:
+            self._finish()
+        elif self._file is not None:
+            self._file.close()
+        return self.volumes
+
+
+def entry_name(record, file_path=None):
+    """Имя записи папки в архиве."""
+    short_id = record.get("short_id", "")
+    if record["type"] == "text":
+        return f"Текст {short_id}.txt"
+    extension = posixpath.splitext(file_path or "")[1] or DEFAULT_EXTENSIONS.get(record["type"], "")
+    if record["type"] == "document":
+        return safe_name(record.get("file_name"), f"Документ {short_id}{extension}")
+    return f"{record['type']} {short_id}{extension}"
+
+
+def export_folder(bot, chat_id, user_id, node_id, volume_size=EXPORT_VOLUME_SIZE, spool_size=EXPORT_SPOOL_SIZE):
+    """
+    Отправляет в chat_id папку node_id со всеми вложенными как ZIP: заметки — файлами .txt,
+    медиа скачиваются через getFile. Файлы, которые не удалось получить, перечисляются
+    в «Ошибки.txt» в конце архива. Возвращает {"volumes", "files", "failed"}.
+    """
+    root = get_node(user_id, node_id)
+    base_name = safe_name(root["name"], "Мои файлы")
+
+    def send_volume(volume):
+        bot.send_document(chat_id, volume, visible_file_name=volume.name)
+
+    archive = ZipVolumes(base_name, send_volume, volume_size, spool_size)
+    failed = []
+    for path, records in walk_subtree(user_id, node_id):
+        folder = posixpath.join(base_name, *path)
+        for record in records:
+            if record["type"] == "text":
+                try:
+                    text = load_text(record)
+                except KeyError:
+                    failed.append(posixpath.join(folder, entry_name(record)))
+                    text = record.get("preview", "")
+                archive.add_text(posixpath.join(folder, entry_name(record)), text)
+                continue
+            if not record.get("file_id"):
+                continue
+            try:
+                size, file_path, response = open_download(bot, record["file_id"])
+            except Exception as e:
+                logger.warning(f"Не удалось скачать {record.get('short_id')}: {e}")
+                failed.append(posixpath.join(folder, entry_name(record)))
+                continue
+            with response:
+                archive.add(posixpath.join(folder, entry_name(record, file_path)),
+                            response.iter_content(EXPORT_CHUNK_SIZE), size or 0, compress=False)
+    if failed:
+        archive.add_text(posixpath.join(base_name, "Ошибки.txt"),
+                         "Не удалось выгрузить:\n" + "\n".join(failed) + "\n")
+    volumes = archive.close()
+    return {"volumes": volumes, "files": archive.entries - (1 if failed else 0), "failed": len(failed)}
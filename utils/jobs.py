@@ -0,0 +1,213 @@
+# utils/jobs.py
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from telebot import types
+from utils import callback_codec as codec
+from utils.data_manager import get_node
+from utils.delivery import plan_delivery, send_step
+from utils.sender import priority, BULK
+from utils.storage.json_storage import replace_file
+
+logger = logging.getLogger(__name__)
+
+
+def folder_tree(user_id, node_id):
+    """id папки node_id и всех вложенных в порядке обхода в глубину."""
+    nodes = []
+    stack = [node_id]
+    while stack:
+        node_id = stack.pop()
+        nodes.append(node_id)
+        stack.extend(reversed(list(get_node(user_id, node_id)["folders"].values())))
+    return nodes
+
+
+def new_job(chat_id, owner_id, nodes):
+    """Задача отправки в chat_id файлов из папок nodes пользователя owner_id."""
+    # Отправляются файлы, которые были в папках на момент постановки задачи
+    limits = [len(get_node(owner_id, node_id)["files"]) for node_id in nodes]
+    return {
+        "id": uuid.uuid4().hex[:8],
+        "chat_id": chat_id,
+        "owner": owner_id,
+        "nodes": nodes,
+        "limits": limits,
+        # Позиция: папка nodes[node_index], запись files[file_index] в ней
+        "node_index": 0,
+        "file_index": 0,
+        "sent": 0,
+        "failed": 0,
+        "total": sum(limits),
+        "message_id": None,
+        "created": time.time(),
+    }
+
+
+class JobRunner:
+    """
+    Фоновые задачи массовой отправки (выгрузка папки, папки с подпапками).
+    Каждая задача хранится в своём файле directory/<id>.json и сохраняется после каждого
+    отправленного шага, поэтому после перезапуска бота продолжается с того же места.
+    Ход выполнения показывается в одном сообщении с кнопкой отмены, которое редактируется
+    не чаще раза в progress_interval секунд. Обработчики только ставят задачу в очередь
+    и сразу отвечают пользователю.
+    """
+
+    def __init__(self, bot, directory, workers=2, progress_interval=5.0):
+        self.bot = bot
+        self.directory = directory
+        self.progress_interval = progress_interval
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = [threading.Thread(target=self._work, name=f"jobs-{number}", daemon=True)
+                         for number in range(workers)]
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job):
+        replace_file(self._path(job["id"]), json.dumps(job, ensure_ascii=False))
+
+    def _remove(self, job):
+        with self._lock:
+            self._jobs.pop(job["id"], None)
+            self._cancelled.discard(job["id"])
+        try:
+            os.remove(self._path(job["id"]))
+        except FileNotFoundError:
+            pass
+
+    def start(self):
+        """Запускает обработчики и продолжает задачи, оставшиеся с прошлого запуска."""
+        jobs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as file:
+                    jobs.append(json.load(file))
+            except (OSError, ValueError) as e:
+                logger.error(f"Не удалось прочитать задачу {name}: {e}")
+        for job in sorted(jobs, key=lambda job: job["created"]):
+            logger.info(f"Продолжается задача {job['id']}: отправлено {job['sent']} из {job['total']}")
+            self._enqueue(job)
+        for thread in self._threads:
+            thread.start()
+
+    def _enqueue(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = job
+        self._queue.put(job["id"])
+
+    def submit(self, chat_id, owner_id, nodes):
+        """Ставит в очередь отправку файлов из папок nodes и показывает сообщение о ходе выполнения."""
+        job = new_job(chat_id, owner_id, nodes)
+        message = self.bot.send_message(chat_id, self._progress_text(job), reply_markup=self._cancel_markup(job))
+        job["message_id"] = message.message_id
+        self._save(job)
+        self._enqueue(job)
+        return job["id"]
+
+    def cancel(self, job_id, chat_id):
+        """Отменяет задачу чата chat_id; False, если такой задачи нет."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["chat_id"] != chat_id:
+                return False
+            self._cancelled.add(job_id)
+        return True
+
+    def pending(self):
+        """Сколько задач выполняется или ждёт в очереди."""
+        with self._lock:
+            return len(self._jobs)
+
+    def close(self, timeout=None):
+        """Останавливает обработчики после текущего шага; незаконченные задачи остаются на диске."""
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
+    # Выполнение
+
+    def _cancel_markup(self, job):
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("✖️ Отменить", callback_data=codec.encode(codec.JOB_CANCEL, job["id"])))
+        return markup
+
+    @staticmethod
+    def _progress_text(job):
+        return f"Отправка файлов: {job['sent']} из {job['total']}."
+
+    def _show(self, job, text, markup=None):
+        try:
+            self.bot.edit_message_text(text, job["chat_id"], job["message_id"], reply_markup=markup)
+        except Exception as e:
+            # Сообщение могли удалить; ход выполнения не так важен, как сама отправка
+            logger.warning(f"Не удалось обновить сообщение задачи {job['id']}: {e}")
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            try:
+                with priority(BULK):
+                    self._run(job)
+            except Exception as e:
+                logger.error(f"Ошибка задачи {job_id}: {e}")
+                self._show(job, f"Ошибка при отправке файлов: {str(e)}")
+                self._remove(job)
+
+    def _run(self, job):
+        shown = time.monotonic()
+        while job["node_index"] < len(job["nodes"]):
+            node_id = job["nodes"][job["node_index"]]
+            try:
+                files = get_node(job["owner"], node_id)["files"][job["file_index"]:job["limits"][job["node_index"]]]
+            except KeyError:
+                files = []
+            for kind, payload, done in plan_delivery(files):
+                if self._stopping.is_set():
+                    return
+                if job["id"] in self._cancelled:
+                    self._show(job, f"Отправка отменена: {job['sent']} из {job['total']}.")
+                    self._remove(job)
+                    return
+                try:
+                    send_step(self.bot, job["chat_id"], kind, payload)
+                    job["sent"] += done
+                except Exception as e:
+                    # Ошибка одного шага не останавливает задачу: шаг пропускается
+                    logger.error(f"Задача {job['id']}: ошибка при отправке: {e}")
+                    job["failed"] += done
+                job["file_index"] += done
+                self._save(job)
+                if time.monotonic() - shown >= self.progress_interval:
+                    shown = time.monotonic()
+                    self._show(job, self._progress_text(job), self._cancel_markup(job))
+            job["node_index"] += 1
+            job["file_index"] = 0
+            self._save(job)
+        text = f"Готово: отправлено {job['sent']} из {job['total']}."
+        if job["failed"]:
+            text += f" Не удалось отправить: {job['failed']}."
+        self._show(job, text)
+        self._remove(job)
@@ -1,66 +1,119 @@
 # utils/keyboards.py
 
 from telebot import types
-import uuid
+from collections import OrderedDict
+import config
+import threading
 import logging
+from utils import callback_codec as codec
 
 logger = logging.getLogger(__name__)
 
-def generate_callback_data(prefix, *args):
+# Сколько кнопок папок и файлов показывать на одной странице клавиатуры
+KEYBOARD_PAGE_SIZE = getattr(config, "KEYBOARD_PAGE_SIZE", 20)
+# Сколько готовых клавиатур держать в памяти
+KEYBOARD_CACHE_SIZE = getattr(config, "KEYBOARD_CACHE_SIZE", 1000)
+# Сколько результатов /find показывать на одной странице
+SEARCH_PAGE_SIZE = getattr(config, "SEARCH_PAGE_SIZE", 10)
+# Сколько символов заметки показывать на кнопке результата поиска
+SEARCH_LABEL_LENGTH = 30
+
+# Значок и название кнопки файла по типу записи
+FILE_LABELS = {
+    "text": ("📝", "Текст"),
+    "document": ("📄", "Документ"),
+    "photo": ("🖼️", "Фото"),
+    "video": ("🎬", "Видео"),
+    "audio": ("🎵", "Аудио"),
+}
+
+class RenderedMarkup(types.JsonSerializable):
+    """Готовая клавиатура: JSON собирается один раз и переиспользуется из кэша."""
+
+    def __init__(self, markup):
+        self.markup = markup
+        self._json = markup.to_json()
+
+    def to_json(self):
+        return self._json
+
+
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+
+def clear_markup_cache():
+    """Сбрасывает кэш готовых клавиатур (например, при смене хранилища)."""
+    with _render_cache_lock:
+        _render_cache.clear()
+
+
+def page_count(current):
+    items = len(current["folders"]) + len(current["files"])
+    return max(1, -(-items // KEYBOARD_PAGE_SIZE))
+
+
+def generate_markup(current, shared_key=None, page=0, owner_id=None, root_id=None):
     """
-    Генерирует безопасный callback_data, сохраняя допустимые символы.
-    Убираем ограничение длины, но следим за общим размером.
+    Клавиатура папки: страница из KEYBOARD_PAGE_SIZE папок и файлов с кнопками листания.
+    root_id — папка, выше которой подниматься нельзя (корень публичной папки).
+    С owner_id результат кэшируется по (владелец, папка, версия, страница, ключ доступа);
+    любое изменение папки повышает её версию, поэтому устаревшие клавиатуры в кэше не находятся.
     """
-    # Разрешённые символы: буквы, цифры, _, -
-    allowed_chars = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-")
-    safe_args = []
-    for arg in args:
-        safe_arg = ''.join(e for e in arg if e in allowed_chars)
-        safe_args.append(safe_arg)
-    callback = f"{prefix}:" + ":".join(safe_args)
-    
-    # Проверка длины callback_data
-    callback_length = len(callback.encode('utf-8'))
-    if callback_length > 64:
-        logger.error(f"callback_data длиной {callback_length} байт превышает 64 байта. Data: {callback}")
-        raise ValueError(f"callback_data длиной {callback_length} байт превышает 64 байта.")
-    
-    logger.debug(f"Generated callback_data: {callback} (Length: {callback_length} bytes)")
-    return callback
+    page = min(max(page, 0), page_count(current) - 1)
+    cache_key = None
+    if owner_id is not None:
+        cache_key = (owner_id, current["id"], current.get("version", 0), page, shared_key)
+        with _render_cache_lock:
+            markup = _render_cache.get(cache_key)
+            if markup is not None:
+                _render_cache.move_to_end(cache_key)
+                return markup
+
+    # root_id определяется ключом доступа, поэтому в ключ кэша не входит
+    markup = RenderedMarkup(render_markup(current, shared_key, page, root_id))
+    if cache_key is not None:
+        with _render_cache_lock:
+            _render_cache[cache_key] = markup
+            if len(_render_cache) > KEYBOARD_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+    return markup
+
 
-def generate_markup(current, path, shared_key=None):
+def render_markup(current, shared_key, page, root_id=None):
     markup = types.InlineKeyboardMarkup()
-    
-    # Кнопка "Вверх", если не в корневой папке
-    if path:
+    pages = page_count(current)
+    # В callback_data вместо полного ключа — его начало фиксированной длины
+    handle = codec.share_handle(shared_key) if shared_key else None
+
+    # Кнопка "Вверх", если не в корневой папке (для публичной — не в её корне). Кнопки публичной
+    # папки указывают её id: по ним не нужна сессия зрителя
+    if current["parent"] is not None and current["id"] != root_id:
         if shared_key:
-            callback_data = generate_callback_data("shared_up", shared_key)
+            callback_data = codec.encode(codec.SHARED_UP, handle, current["id"])
         else:
-            callback_data = "up"
+            callback_data = codec.encode(codec.UP)
         markup.add(types.InlineKeyboardButton("⬆️ Вверх", callback_data=callback_data))
 
-    # Кнопки папок
-    for folder in current["folders"]:
+    # На странице сначала папки, затем файлы
+    start = page * KEYBOARD_PAGE_SIZE
+    end = start + KEYBOARD_PAGE_SIZE
+    folders = list(current["folders"].items())
+
+    # Кнопки папок: в callback_data передаётся id узла, а не имя
+    for folder, node_id in folders[start:end]:
         if shared_key:
-            callback_data = generate_callback_data("shared_folder", shared_key, folder)
+            callback_data = codec.encode(codec.SHARED_FOLDER, handle, node_id)
         else:
-            callback_data = generate_callback_data("folder", folder)
+            callback_data = codec.encode(codec.FOLDER, node_id)
         markup.add(types.InlineKeyboardButton(f"📁 {folder}", callback_data=callback_data))
 
-    # Кнопки файлов
-    for idx, file in enumerate(current["files"], start=1):
-        if file["type"] == "text":
-            display_name = f"📝 Текст {idx}"
-        elif file["type"] == "document":
-            display_name = f"📄 Документ {idx}"
-        elif file["type"] == "photo":
-            display_name = f"🖼️ Фото {idx}"
-        elif file["type"] == "video":
-            display_name = f"🎬 Видео {idx}"
-        elif file["type"] == "audio":
-            display_name = f"🎵 Аудио {idx}"
-        else:
-            display_name = f"📁 Файл {idx}"
+    # Кнопки файлов; нумерация сквозная по всем страницам
+    first_file = max(0, start - len(folders))
+    last_file = max(0, end - len(folders))
+    for idx, file in enumerate(current["files"][first_file:last_file], start=first_file + 1):
+        icon, label = FILE_LABELS.get(file["type"], ("📁", "Файл"))
+        display_name = f"{icon} {label} {idx}"
 
         short_id = file.get("short_id")
         if not short_id:
@@ -68,16 +121,71 @@ def generate_markup(current, path, shared_key=None):
             continue  # Или обработать ошибку иначе
 
         if shared_key:
-            callback_data = generate_callback_data("shared_file", shared_key, short_id)
+            callback_data = codec.encode(codec.SHARED_FILE, handle, short_id)
         else:
-            callback_data = generate_callback_data("file", short_id)
+            callback_data = codec.encode(codec.FILE, short_id)
         markup.add(types.InlineKeyboardButton(display_name, callback_data=callback_data))
+
+    # Листание страниц
+    if pages > 1:
+        buttons = []
+        for target, label in ((page - 1, f"◀️ Стр. {page}"), (page + 1, f"Стр. {page + 2} ▶️")):
+            if not 0 <= target < pages:
+                continue
+            if shared_key:
+                callback_data = codec.encode(codec.SHARED_PAGE, handle, current["id"], target)
+            else:
+                callback_data = codec.encode(codec.PAGE, current["id"], target)
+            buttons.append(types.InlineKeyboardButton(label, callback_data=callback_data))
+        markup.row(*buttons)
     
     # Добавляем кнопку "Retrieve All"
     if shared_key:
-        callback_data = generate_callback_data("shared_retrieve_all", shared_key)
+        callback_data = codec.encode(codec.SHARED_RETRIEVE_ALL, handle, current["id"])
     else:
-        callback_data = "retrieve_all"
+        callback_data = codec.encode(codec.RETRIEVE_ALL)
     markup.add(types.InlineKeyboardButton("📤 Вернуть Все", callback_data=callback_data))
 
+    # Выгрузка папки вместе со всеми вложенными
+    if shared_key:
+        callback_data = codec.encode(codec.SHARED_RETRIEVE_TREE, handle, current["id"])
+    else:
+        callback_data = codec.encode(codec.RETRIEVE_TREE)
+    markup.add(types.InlineKeyboardButton("📦 Вернуть с подпапками", callback_data=callback_data))
+
+    return markup
+
+
+def search_page_count(hits):
+    return max(1, -(-len(hits) // SEARCH_PAGE_SIZE))
+
+
+def generate_search_markup(results, query, page, pages):
+    """
+    Клавиатура страницы результатов /find: кнопка на файл с путём его папки и листание.
+    results — [{"record", "path"}] этой страницы, query — нормализованный запрос для кнопок листания.
+    """
+    markup = types.InlineKeyboardMarkup()
+    for result in results:
+        record = result["record"]
+        icon, label = FILE_LABELS.get(record["type"], ("📁", "Файл"))
+        name = record.get("file_name") or record.get("content") or record.get("preview") or label
+        name = " ".join(name.split())[:SEARCH_LABEL_LENGTH]
+        path = "/" + "/".join(result["path"])
+        markup.add(types.InlineKeyboardButton(f"{icon} {name} — {path}",
+                                              callback_data=codec.encode(codec.FILE, record["short_id"])))
+
+    if pages > 1:
+        buttons = []
+        for target, label in ((page - 1, f"◀️ Стр. {page}"), (page + 1, f"Стр. {page + 2} ▶️")):
+            if not 0 <= target < pages:
+                continue
+            try:
+                callback_data = codec.encode(codec.SEARCH_PAGE, target, query)
+            except ValueError:
+                # Запрос не помещается в callback_data: листание недоступно
+                logger.warning(f"Запрос /find длиной {len(query)} символов не помещается в кнопки листания")
+                return markup
+            buttons.append(types.InlineKeyboardButton(label, callback_data=callback_data))
+        markup.row(*buttons)
     return markup
@@ -0,0 +1,93 @@
+# utils/log_setup.py
+
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+import config
+
+# Общий уровень и уровни отдельных модулей, например {"TeleBot": "INFO", "utils.storage": "WARNING"}
+LOG_LEVEL = getattr(config, "LOG_LEVEL", "DEBUG")
+LOG_LEVELS = getattr(config, "LOG_LEVELS", {})
+# Файл лога и ротация: по размеру (LOG_MAX_BYTES) или, если задан LOG_ROTATE_WHEN
+# ("midnight", "H", ...), по времени; хранится LOG_BACKUP_COUNT старых файлов
+LOG_FILE = getattr(config, "LOG_FILE", "bot.log")
+LOG_MAX_BYTES = getattr(config, "LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_ROTATE_WHEN = getattr(config, "LOG_ROTATE_WHEN", None)
+LOG_BACKUP_COUNT = getattr(config, "LOG_BACKUP_COUNT", 5)
+# Не больше стольких DEBUG-сообщений в секунду с одного места в коде (0 — без ограничения)
+LOG_DEBUG_RATE = getattr(config, "LOG_DEBUG_RATE", 10)
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DebugRateFilter(logging.Filter):
+    """
+    Пропускает не больше rate DEBUG-сообщений в секунду с каждого места вызова.
+    Число отброшенных сообщений дописывается к первому пропущенному после них.
+    Сообщения уровня INFO и выше проходят всегда.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        # (логгер, строка) -> [начало окна, сообщений в окне, отброшено]
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0]
+            if now - site[0] >= 1:
+                site[0], site[1] = now, 0
+            if site[1] >= self.rate:
+                site[2] += 1
+                return False
+            site[1] += 1
+            dropped, site[2] = site[2], 0
+        if dropped:
+            record.msg = f"{record.getMessage()} (пропущено похожих сообщений: {dropped})"
+            record.args = None
+        return True
+
+
+def setup_logging():
+    """
+    Настраивает корневой логгер: обработчики в потоках бота только ставят записи в очередь,
+    а в файл и консоль их пишет отдельный поток. Возвращает QueueListener — его нужно
+    остановить при выходе, чтобы дописать оставшиеся записи.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    if LOG_ROTATE_WHEN:
+        file_handler = TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN,
+                                                backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                           backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    if LOG_DEBUG_RATE:
+        queue_handler.addFilter(DebugRateFilter(LOG_DEBUG_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = QueueListener(records, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
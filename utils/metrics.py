@@ -0,0 +1,232 @@
+# utils/metrics.py
+
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток."""
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, values):
+        if len(values) != len(self.labels):
+            raise ValueError(f"Метрике {self.name} нужны метки {self.labels}")
+        return tuple(str(value) for value in values)
+
+    def samples(self):
+        """Строки (суффикс имени, значения меток, доп. метки, значение) для вывода."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("_total", key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """Значение задаётся set() или функцией, которая вызывается при каждом чтении метрик."""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self._functions = {}
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                value = function()
+            except Exception as e:
+                logger.error(f"Ошибка при чтении метрики {self.name}: {e}")
+                continue
+            if value is not None:
+                values[key] = value
+        return [("", key, (), value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", key, (("le", _format_value(bound)),), cumulative))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+# Метрики бота
+HANDLER_SECONDS = registry.register(Histogram(
+    "bot_handler_seconds", "Время обработки обновления обработчиком", ("handler",)))
+ROUTE_SECONDS = registry.register(Histogram(
+    "bot_callback_route_seconds", "Время обработки нажатия кнопки по маршрутам", ("route",)))
+STORAGE_SECONDS = registry.register(Histogram(
+    "bot_storage_seconds", "Время операций хранилища: load — чтение при старте, load_shard — "
+    "подгрузка шарда, flush — запись изменений на диск, transaction — транзакция целиком", ("operation",)))
+STORAGE_BYTES = registry.register(Gauge(
+    "bot_storage_bytes", "Размер файлов хранилища на диске"))
+API_REQUESTS = registry.register(Counter(
+    "bot_api_requests", "Запросы к Bot API по методам (включая повторы)", ("method",)))
+API_ERRORS = registry.register(Counter(
+    "bot_api_errors", "Ошибки Bot API по методам и кодам ответа (429 — превышение лимита)", ("method", "code")))
+QUEUE_DEPTH = registry.register(Gauge(
+    "bot_queue_depth", "Обновления, ожидающие обработки", ("queue",)))
+
+
+def timed_handler(handler):
+    """Замеряет время обработчика обновлений под его именем."""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        with HANDLER_SECONDS.time(handler.__name__):
+            return handler(*args, **kwargs)
+
+    return wrapper
+
+
+class MetricsServer:
+    """HTTP-сервер, отдающий registry по GET /metrics; работает в фоновом потоке."""
+
+    def __init__(self, registry=registry, host="127.0.0.1", port=9100):
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = server.registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,7 +1,111 @@
 # utils/navigation.py
 
-def navigate_to_path(structure, path):
-    current = structure
-    for folder in path:
-        current = current["folders"][folder]
-    return current
+import hashlib
+
+# Папки пользователя хранятся плоской таблицей узлов:
+# user["nodes"][str(id)] = {"id", "parent", "name", "folders": {имя: id}, "files": [...], "version"}
+# version растёт при каждом изменении содержимого папки (по нему кэшируются клавиатуры)
+ROOT_NODE = 0
+
+
+def new_node(node_id, parent, name):
+    return {"id": node_id, "parent": parent, "name": name, "folders": {}, "files": [], "version": 0}
+
+
+def touch_node(node):
+    node["version"] = node.get("version", 0) + 1
+
+
+def get_node(user, node_id):
+    return user["nodes"][str(node_id)]
+
+
+def is_within(user, node_id, ancestor_id):
+    """Лежит ли узел node_id внутри ancestor_id (или совпадает с ним)."""
+    while node_id is not None:
+        if node_id == ancestor_id:
+            return True
+        node_id = get_node(user, node_id)["parent"]
+    return False
+
+
+def folder_path(user, node_id):
+    """Имена папок от корня до node_id (корень не входит)."""
+    path = []
+    node = get_node(user, node_id)
+    while node["parent"] is not None:
+        path.append(node["name"])
+        node = get_node(user, node["parent"])
+    return path[::-1]
+
+
+def resolve_path(user, path):
+    """Узел по списку имён папок от корня (для данных старого формата); KeyError, если его нет."""
+    node_id = ROOT_NODE
+    for name in path:
+        node_id = get_node(user, node_id)["folders"][name]
+    return node_id
+
+
+def legacy_short_id(node_id, position, taken):
+    """
+    short_id для записи без него: зависит только от места записи в папке, поэтому при каждой
+    загрузке данных получается тот же, даже если данные ещё не пересохранены.
+    """
+    salt = 0
+    while True:
+        short_id = hashlib.sha1(f"{node_id}:{position}:{salt}".encode()).hexdigest()[:8]
+        if short_id not in taken:
+            return short_id
+        salt += 1
+
+
+def fill_short_ids(user):
+    """
+    Выдаёт short_id записям, у которых его нет: в данных старого формата он был только
+    у медиа, а заметки без него нельзя открыть кнопкой и найти через /find.
+    """
+    missing = [(node, position) for node in user["nodes"].values()
+               for position, record in enumerate(node["files"]) if not record.get("short_id")]
+    if not missing:
+        return user
+    taken = {record["short_id"] for node in user["nodes"].values()
+             for record in node["files"] if record.get("short_id")}
+    for node, position in sorted(missing, key=lambda item: (item[0]["id"], item[1])):
+        record = dict(node["files"][position])
+        record["short_id"] = legacy_short_id(node["id"], position, taken)
+        taken.add(record["short_id"])
+        node["files"][position] = record
+        if record.get("file_id"):
+            user.setdefault("file_mappings", {})[record["short_id"]] = record["file_id"]
+    return user
+
+
+def upgrade_user(user):
+    """
+    Переводит пользователя из вложенной structure/current_path в таблицу узлов
+    и выдаёт short_id записям старого формата.
+    """
+    if "structure" not in user:
+        return fill_short_ids(user)
+    nodes = {}
+    next_node = ROOT_NODE
+    stack = [(None, "", user["structure"])]
+    while stack:
+        parent, name, folder = stack.pop()
+        node = new_node(next_node, parent, name)
+        node["files"] = list(folder.get("files", []))
+        nodes[str(next_node)] = node
+        if parent is not None:
+            nodes[str(parent)]["folders"][name] = next_node
+        next_node += 1
+        # В обратном порядке, чтобы узлы нумеровались в порядке следования папок
+        for child_name, child in reversed(list(folder.get("folders", {}).items())):
+            stack.append((node["id"], child_name, child))
+    upgraded = {"current": ROOT_NODE, "nodes": nodes, "next_node": next_node,
+                "file_mappings": user.get("file_mappings", {})}
+    try:
+        upgraded["current"] = resolve_path(upgraded, user.get("current_path", []))
+    except KeyError:
+        pass
+    return fill_short_ids(upgraded)
@@ -0,0 +1,39 @@
+# utils/routing.py
+
+import logging
+import time
+import config
+from utils.metrics import ROUTE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Маршрут, обработанный дольше стольких секунд, попадает в лог как медленный
+SLOW_ROUTE_SECONDS = getattr(config, "SLOW_ROUTE_SECONDS", 1.0)
+
+
+class CallbackRouter:
+    """
+    Таблица маршрутов: код операции -> (имя маршрута, обработчик).
+    Время каждого вызова обработчика записывается в гистограмму под именем маршрута.
+    """
+
+    def __init__(self, histogram=ROUTE_SECONDS):
+        self._routes = {}
+        self.histogram = histogram
+
+    def add(self, op, name, handler):
+        if op in self._routes:
+            raise ValueError(f"Маршрут для операции {op} уже зарегистрирован")
+        self._routes[op] = (name, handler)
+
+    def dispatch(self, op, *args):
+        """Вызывает обработчик операции; KeyError, если маршрута нет."""
+        name, handler = self._routes[op]
+        started = time.perf_counter()
+        try:
+            return handler(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.histogram.observe(elapsed, name)
+            if elapsed >= SLOW_ROUTE_SECONDS:
+                logger.warning(f"Медленный маршрут {name}: {elapsed:.2f} с")
@@ -0,0 +1,86 @@
+# utils/search.py
+
+import re
+
+# Обратный индекс пользователя для /find: {слово: [short_id, ...]}, short_id в порядке
+# добавления записей. Индексируются текст заметок и имена документов. Хранится отдельно
+# от данных пользователя (utils/storage/search_index.py, в SQLite — таблица search_terms).
+WORD = re.compile(r"[^\W_]+")
+# Слова короче не индексируются: они встречаются почти везде и только раздувают индекс
+MIN_WORD_LENGTH = 2
+
+
+def tokenize(text):
+    """Уникальные слова текста в нижнем регистре (ё = е) в порядке появления."""
+    words = {}
+    for word in WORD.findall(text.lower().replace("ё", "е")):
+        if len(word) >= MIN_WORD_LENGTH:
+            words.setdefault(word, None)
+    return list(words)
+
+
+def record_terms(record, content=None):
+    """
+    Слова записи для индекса. content — полный текст заметки, если в записи его нет
+    (у длинных заметок в записи остаётся только превью).
+    """
+    if content is None:
+        content = record.get("content") or record.get("preview")
+    parts = [part for part in (content, record.get("file_name")) if part]
+    return tokenize(" ".join(parts))
+
+
+def index_record(index, short_id, terms):
+    for term in terms:
+        index.setdefault(term, []).append(short_id)
+
+
+def user_records(user):
+    """Записи всех папок пользователя в порядке id папок."""
+    return [record for node in sorted(user["nodes"].values(), key=lambda node: node["id"])
+            for record in node["files"]]
+
+
+def stored_terms(record, load_text=None):
+    """
+    Слова уже сохранённой записи. load_text(record) — полный текст длинной заметки
+    (KeyError, если его нет); без него длинные заметки индексируются по превью.
+    """
+    content = None
+    if load_text is not None and "content" not in record and record.get("text_key"):
+        try:
+            content = load_text(record)
+        except KeyError:
+            pass
+    return record_terms(record, content)
+
+
+def build_index(records, load_text=None):
+    """Индекс по записям (для данных, сохранённых до появления поиска)."""
+    index = {}
+    for record in records:
+        if record.get("short_id"):
+            index_record(index, record["short_id"], stored_terms(record, load_text))
+    return index
+
+
+def terms_by_record(index):
+    """Обратное отображение индекса: short_id -> слова."""
+    terms = {}
+    for term, short_ids in index.items():
+        for short_id in short_ids:
+            terms.setdefault(short_id, []).append(term)
+    return terms
+
+
+def lookup(index, terms):
+    """short_id записей, содержащих все слова terms, от новых к старым."""
+    postings = sorted((index.get(term, ()) for term in terms), key=len)
+    if not postings or not postings[0]:
+        return []
+    hits = postings[0]
+    # Пересечение начинается с самого короткого списка
+    for other in postings[1:]:
+        other = set(other)
+        hits = [short_id for short_id in hits if short_id in other]
+    return hits[::-1]
@@ -0,0 +1,228 @@
+# utils/sender.py
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from telebot.apihelper import ApiTelegramException
+from utils.metrics import API_REQUESTS, API_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: ответы на действия пользователя и массовая отправка
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Методы бота, которые отправляют или меняют сообщения и проходят через планировщик
+THROTTLED_PREFIXES = ("send_", "reply_to", "forward_message", "copy_message", "edit_message_",
+                      "delete_message", "answer_callback_query")
+# Позиция chat_id среди позиционных аргументов (по умолчанию первая)
+CHAT_ARG_INDEX = {"edit_message_text": 1, "edit_message_caption": 1, "edit_message_media": 1}
+
+GLOBAL_KEY = "*"
+
+_local = threading.local()
+
+
+@contextmanager
+def priority(level):
+    """Все отправки текущего потока внутри блока идут с приоритетом level."""
+    previous = getattr(_local, "priority", INTERACTIVE)
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    return getattr(_local, "priority", INTERACTIVE)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # До этого момента запросы запрещены (retry_after из ответа 429)
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now, amount=1):
+        """Сколько секунд ждать, пока в ведре наберётся amount токенов."""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def take(self, amount=1):
+        self.tokens -= amount
+
+
+def _chat_key(chat_id):
+    """Ключ чата для лимитов: id числом (Bot API принимает его и строкой) или "@имя" канала как есть."""
+    if chat_id is None:
+        return None
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return str(chat_id)
+
+
+class SendScheduler:
+    """
+    Общий планировщик исходящих запросов к Bot API.
+    Держит глобальное ведро токенов и по ведру на чат (в группах лимит строже).
+    Массовая отправка пропускает вперёд ожидающие интерактивные ответы и не трогает
+    последние bulk_reserve глобальных токенов, поэтому выгрузка большой папки одним
+    пользователем не тормозит ответы остальным. Ответ 429 выдерживается по retry_after.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1.0, chat_burst=3, group_rate=20 / 60,
+                 group_burst=3, bulk_reserve=5, max_retries=5, max_chats=10000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.bulk_reserve = min(bulk_reserve, max(global_rate - 1, 0))
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = OrderedDict()
+        self._cond = threading.Condition()
+        # Число ожидающих интерактивных запросов по чатам (GLOBAL_KEY — ждут глобальных токенов)
+        self._interactive = {}
+
+    def _chat_bucket(self, chat_id):
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # У групп и каналов id отрицательные, каналы можно указать и по "@имени"
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                # Давно молчавшие чаты забываем: их ведро всё равно было бы полным
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def acquire(self, chat_id, level=INTERACTIVE):
+        """Блокирует поток, пока запрос в chat_id не уложится в лимиты."""
+        interactive = level != BULK
+        chat_id = _chat_key(chat_id)
+        with self._cond:
+            waiting_key = None
+            try:
+                while True:
+                    now = time.monotonic()
+                    chat = self._chat_bucket(chat_id)
+                    if interactive:
+                        global_wait = self._global.delay(now)
+                        chat_wait = chat.delay(now) if chat is not None else 0.0
+                        wait = max(global_wait, chat_wait)
+                        # Пока интерактивный запрос ждёт, массовые в тот же чат (а если не хватает
+                        # глобальных токенов — все массовые) уступают ему очередь
+                        key = GLOBAL_KEY if global_wait > 0 else chat_id
+                        if wait > 0 and key != waiting_key:
+                            self._set_waiting(waiting_key, key)
+                            waiting_key = key
+                    elif self._interactive.get(GLOBAL_KEY) or self._interactive.get(chat_id):
+                        self._cond.wait()
+                        continue
+                    else:
+                        wait = self._global.delay(now, 1 + self.bulk_reserve)
+                        if chat is not None:
+                            wait = max(wait, chat.delay(now))
+                    if wait <= 0:
+                        self._global.take()
+                        if chat is not None:
+                            chat.take()
+                        return
+                    self._cond.wait(wait)
+            finally:
+                if waiting_key is not None:
+                    self._set_waiting(waiting_key, None)
+
+    def _set_waiting(self, old_key, new_key):
+        if old_key is not None:
+            self._interactive[old_key] -= 1
+            if not self._interactive[old_key]:
+                del self._interactive[old_key]
+            self._cond.notify_all()
+        if new_key is not None:
+            self._interactive[new_key] = self._interactive.get(new_key, 0) + 1
+
+    def block(self, chat_id, seconds):
+        """Запрещает запросы в чат (или все, если chat_id None) на seconds секунд."""
+        with self._cond:
+            bucket = self._chat_bucket(_chat_key(chat_id)) or self._global
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+
+    def call(self, chat_id, method, /, *args, **kwargs):
+        """Выполняет method в рамках лимитов, повторяя его после ответов 429."""
+        level = current_priority()
+        name = getattr(method, "__name__", "unknown")
+        attempt = 0
+        while True:
+            self.acquire(chat_id, level)
+            API_REQUESTS.inc(name)
+            try:
+                return method(*args, **kwargs)
+            except ApiTelegramException as e:
+                API_ERRORS.inc(name, e.error_code)
+                if e.error_code != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                logger.warning(f"Лимит Telegram для чата {chat_id}, повтор через {retry_after} с "
+                               f"(попытка {attempt}/{self.max_retries})")
+                self.block(chat_id, retry_after)
+            except Exception:
+                # Сетевые ошибки и прочие сбои без кода ответа Telegram
+                API_ERRORS.inc(name, "exception")
+                raise
+
+
+def _chat_id(name, args, kwargs):
+    if "chat_id" in kwargs:
+        return kwargs["chat_id"]
+    if name == "reply_to":
+        return args[0].chat.id if args else kwargs["message"].chat.id
+    if name == "answer_callback_query":
+        return None
+    index = CHAT_ARG_INDEX.get(name, 0)
+    return args[index] if len(args) > index else None
+
+
+class RateLimitedBot:
+    """
+    Обёртка над TeleBot: методы отправки идут через SendScheduler,
+    всё остальное (регистрация обработчиков, polling) — напрямую в бота.
+    """
+
+    def __init__(self, bot, scheduler):
+        self._bot = bot
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if not callable(attr) or not name.startswith(THROTTLED_PREFIXES):
+            return attr
+
+        def throttled(*args, **kwargs):
+            return self._scheduler.call(_chat_id(name, args, kwargs), attr, *args, **kwargs)
+
+        return throttled
@@ -0,0 +1,66 @@
+# utils/sessions.py
+
+import threading
+import time
+from collections import OrderedDict
+import config
+from utils.storage.base import SHARE_PREFIX_LENGTH
+
+# Сессия просмотра публичной папки: (чат зрителя, начало ключа) ->
+# {"key", "owner_id", "root_id", "node_id", "fresh", "expires"}. В ней запоминаются владелец
+# и папка, найденные по ключу, и текущая папка зрителя внутри публичной.
+# Через столько секунд без нажатий сессия забывается
+SHARED_SESSION_TTL = getattr(config, "SHARED_SESSION_TTL", 1800)
+# Сколько сессий держать в памяти; сверх этого вытесняются давно не использованные
+SHARED_SESSION_CACHE_SIZE = getattr(config, "SHARED_SESSION_CACHE_SIZE", 10000)
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def session_key(viewer_id, key):
+    """Ключ сессии; key — полный ключ папки или его начало из callback_data."""
+    return viewer_id, key[:SHARE_PREFIX_LENGTH]
+
+
+def get_session(viewer_id, key):
+    """Сессия зрителя viewer_id в папке key или None, если её нет или она истекла."""
+    now = time.monotonic()
+    cache_key = session_key(viewer_id, key)
+    with _sessions_lock:
+        session = _sessions.get(cache_key)
+        if session is None:
+            return None
+        if session["expires"] <= now:
+            del _sessions[cache_key]
+            return None
+        session["expires"] = now + SHARED_SESSION_TTL
+        _sessions.move_to_end(cache_key)
+        return session
+
+
+def open_session(viewer_id, shared, fresh=False):
+    """
+    Новая сессия в корне публичной папки shared ({"key", "user_id", "node"}).
+    fresh — сессия открыта нажатием кнопки, а не /access: где зритель был раньше, неизвестно.
+    """
+    now = time.monotonic()
+    session = {"key": shared["key"], "owner_id": shared["user_id"], "root_id": shared["node"],
+               "node_id": shared["node"], "fresh": fresh, "expires": now + SHARED_SESSION_TTL}
+    cache_key = session_key(viewer_id, shared["key"])
+    with _sessions_lock:
+        _sessions[cache_key] = session
+        _sessions.move_to_end(cache_key)
+        # Сначала истёкшие (они в начале: порядок — по последнему использованию), затем лишние
+        while _sessions:
+            oldest = next(iter(_sessions.values()))
+            if oldest["expires"] > now and len(_sessions) <= SHARED_SESSION_CACHE_SIZE:
+                break
+            _sessions.popitem(last=False)
+    return session
+
+
+def clear_sessions():
+    """Забывает все сессии (например, при смене хранилища)."""
+    with _sessions_lock:
+        _sessions.clear()
@@ -0,0 +1,21 @@
+# utils/storage/__init__.py
+
+from utils.storage.json_storage import JsonStorage
+from utils.storage.journal_storage import JournalStorage
+from utils.storage.sharded_storage import ShardedStorage
+from utils.storage.sqlite_storage import SqliteStorage
+
+BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+    "sharded": ShardedStorage,
+    "sqlite": SqliteStorage,
+}
+
+
+def create_storage(backend, path, **options):
+    try:
+        storage_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Неизвестный тип хранилища: {backend}")
+    return storage_class(path, **options)
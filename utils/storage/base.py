@@ -0,0 +1,713 @@
+# utils/storage/base.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utils.metrics import STORAGE_SECONDS
+from utils.navigation import ROOT_NODE, new_node, get_node, touch_node, is_within, resolve_path, upgrade_user, folder_path
+from utils.search import record_terms, stored_terms, index_record, build_index, user_records
+from utils.storage.locks import KeyLocks
+from utils.storage.search_index import SearchIndex
+
+# Ключ блокировки (и «грязного» набора) для общих данных, не относящихся к пользователю
+SHARED_KEY = "shared_folders"
+# По стольким первым символам ключа публичная папка находится через find_share
+SHARE_PREFIX_LENGTH = 16
+# Результат add_media: файл сохранён впервые, добавлена ссылка на уже сохранённый,
+# такой файл уже лежит в этой папке (ничего не записано)
+MEDIA_ADDED = "added"
+MEDIA_LINKED = "linked"
+MEDIA_DUPLICATE = "duplicate"
+
+
+def new_user():
+    return {
+        "current": ROOT_NODE,
+        "nodes": {str(ROOT_NODE): new_node(ROOT_NODE, None, "")},
+        "next_node": ROOT_NODE + 1,
+        "file_mappings": {},  # Сопоставление short_id и file_id
+        "blobs": {}  # file_unique_id -> {"type", "file_id", "refs"}: медиа, на которые ссылаются записи папок
+    }
+
+
+def empty_document():
+    return {"users": {}, "shared_folders": {}}
+
+
+def files_size(paths):
+    """Суммарный размер существующих файлов из paths в байтах."""
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def resolve_record(user, record):
+    """Запись папки с file_id: у ссылки на медиа он берётся из таблицы blobs пользователя."""
+    blob = record.get("blob")
+    if blob is None:
+        return record
+    return dict(record, file_id=user["blobs"][blob]["file_id"])
+
+
+def find_media(user, node, unique_id):
+    """Запись папки node со ссылкой на медиа unique_id или None."""
+    if unique_id not in user.get("blobs", {}):
+        return None
+    return next((record for record in node["files"] if record.get("blob") == unique_id), None)
+
+
+def upgrade_document(document):
+    """Переводит всех пользователей документа старого формата в таблицу узлов."""
+    for user_id, user in list(document["users"].items()):
+        document["users"][user_id] = upgrade_user(user)
+    return document
+
+
+class Storage:
+    """
+    Интерфейс хранилища. Каждый метод выполняется в транзакции;
+    вызовы внутри одного transaction() используют её же.
+    Папки адресуются целочисленными id узлов, уникальными в пределах владельца.
+    """
+
+    def transaction(self, write=False):
+        """
+        write — транзакция будет что-то менять. SQLite тогда сразу берёт блокировку записи,
+        а читающие транзакции ей не мешают; документные хранилища блокируют пользователей
+        по мере обращения и флаг не используют.
+        """
+        raise NotImplementedError
+
+    def ensure_user(self, user_id):
+        raise NotImplementedError
+
+    def user_exists(self, user_id):
+        raise NotImplementedError
+
+    def get_current_node(self, user_id):
+        raise NotImplementedError
+
+    def set_current_node(self, user_id, node_id):
+        raise NotImplementedError
+
+    def get_node(self, user_id, node_id):
+        """
+        Возвращает {"id", "parent", "name", "folders": {имя: id}, "files": [...], "version"};
+        KeyError, если узла нет.
+        """
+        raise NotImplementedError
+
+    def create_folder(self, user_id, parent_id, name):
+        """Создаёт подпапку и возвращает её id; None, если папка с таким именем уже существует."""
+        raise NotImplementedError
+
+    def add_file(self, user_id, node_id, record, terms=None):
+        """Добавляет запись в папку; terms — слова для поиска, если их нельзя взять из самой записи."""
+        raise NotImplementedError
+
+    def add_media(self, user_id, node_id, record, unique_id):
+        """
+        Сохраняет медиа (file_unique_id из Telegram) по ссылке: file_id записывается в таблицу
+        blobs пользователя один раз, в папку — запись с "blob" вместо "file_id".
+        Возвращает MEDIA_ADDED, MEDIA_LINKED (файл уже был в другой папке) или MEDIA_DUPLICATE.
+        """
+        raise NotImplementedError
+
+    def find_file(self, user_id, short_id):
+        """Возвращает {"node": id, "record": {...}} для файла пользователя или None."""
+        raise NotImplementedError
+
+    def search(self, user_id, terms, load_text=None):
+        """
+        short_id файлов пользователя, в которых есть все слова terms, от новых к старым.
+        load_text(record) — полный текст длинной заметки для построения индекса (см. utils.search.stored_terms).
+        """
+        raise NotImplementedError
+
+    def folder_path(self, user_id, node_id):
+        """Имена папок от корня до node_id (корень не входит); KeyError, если узла нет."""
+        raise NotImplementedError
+
+    def is_within(self, user_id, node_id, ancestor_id):
+        """Лежит ли узел node_id внутри ancestor_id (или совпадает с ним)."""
+        raise NotImplementedError
+
+    def get_share(self, key):
+        """Возвращает {"user_id", "node"} или None."""
+        raise NotImplementedError
+
+    def find_share(self, prefix):
+        """Публичная папка по первым SHARE_PREFIX_LENGTH символам ключа: {"key", "user_id", "node"} или None."""
+        raise NotImplementedError
+
+    def create_share(self, key, user_id, node_id):
+        raise NotImplementedError
+
+    def import_document(self, document):
+        """Загружает документ формата {"users": ..., "shared_folders": ...}."""
+        raise NotImplementedError
+
+    def size_on_disk(self):
+        """Размер данных хранилища на диске в байтах; None, если неизвестен."""
+        return None
+
+    def close(self):
+        pass
+
+
+# Применение мутаций к документу. Каждая мутация — небольшой словарь {"op": ..., ...}.
+
+def _op_user(document, op):
+    document["users"].setdefault(op["user"], new_user())
+
+
+def _op_import_user(document, op):
+    document["users"][op["user"]] = upgrade_user(op["data"])
+
+
+def _op_mkdir(document, op):
+    user = document["users"][op["user"]]
+    node_id = op["node"]
+    user["nodes"][str(node_id)] = new_node(node_id, op["parent"], op["name"])
+    parent = get_node(user, op["parent"])
+    parent["folders"][op["name"]] = node_id
+    touch_node(parent)
+    user["next_node"] = max(user["next_node"], node_id + 1)
+
+
+def op_terms(op):
+    """Слова записи мутации file/media для поиска."""
+    return op["terms"] if "terms" in op else record_terms(op["record"])
+
+
+def _index_op(user, op):
+    """
+    Добавляет запись мутации во встроенный поисковый индекс старого формата (user["search"]),
+    пока он не перенесён в SearchIndex.
+    """
+    short_id = op["record"].get("short_id")
+    if "search" in user and short_id:
+        index_record(user["search"], short_id, op_terms(op))
+
+
+def _op_file(document, op):
+    user = document["users"][op["user"]]
+    record = op["record"]
+    node = get_node(user, op["node"])
+    node["files"].append(record)
+    touch_node(node)
+    if record.get("short_id") and record.get("file_id"):
+        user["file_mappings"][record["short_id"]] = record["file_id"]
+    _index_op(user, op)
+
+
+def _op_media(document, op):
+    user = document["users"][op["user"]]
+    blob = user.setdefault("blobs", {}).setdefault(op["blob"], {"type": op["type"], "file_id": op["file_id"], "refs": 0})
+    blob["refs"] += 1
+    node = get_node(user, op["node"])
+    node["files"].append(op["record"])
+    touch_node(node)
+    _index_op(user, op)
+
+
+def _op_reindex(document, op):
+    # Индекс хранится отдельно (SearchIndex): мутация убирает встроенный индекс старого формата
+    document["users"][op["user"]].pop("search", None)
+
+
+def _op_cd(document, op):
+    document["users"][op["user"]]["current"] = op["node"]
+
+
+def _op_share(document, op):
+    document["shared_folders"][op["key"]] = {
+        "user_id": op["user"],
+        "node": op["node"]
+    }
+
+
+OPS = {
+    "user": _op_user,
+    "import_user": _op_import_user,
+    "mkdir": _op_mkdir,
+    "file": _op_file,
+    "media": _op_media,
+    "reindex": _op_reindex,
+    "cd": _op_cd,
+    "share": _op_share,
+}
+
+
+def _upgrade_op(document, op):
+    """Переводит мутацию старого формата (с путём из имён папок) в мутацию над узлами."""
+    op = dict(op)
+    user = document["users"][op["user"]]
+    node_id = resolve_path(user, op.pop("path"))
+    if op["op"] == "mkdir":
+        op.update(parent=node_id, node=user["next_node"])
+    elif op["op"] == "path":
+        op.update(op="cd", node=node_id)
+    else:
+        op["node"] = node_id
+    return op
+
+
+def apply_op(document, op):
+    if "path" in op:
+        op = _upgrade_op(document, op)
+    OPS[op["op"]](document, op)
+
+
+# Отмена мутаций при откате транзакции. Функция получает документ и мутацию до её применения
+# и возвращает функцию, которая вернёт затронутые данные в прежнее состояние.
+
+_MISSING = object()
+
+
+def _restore(mapping, key, previous):
+    if previous is _MISSING:
+        mapping.pop(key, None)
+    else:
+        mapping[key] = previous
+
+
+def _undo_index(user, op):
+    """Отмена добавления записи во встроенный поисковый индекс (см. _index_op)."""
+    short_id = op["record"].get("short_id")
+    if "search" not in user or not short_id:
+        return lambda: None
+    index = user["search"]
+    terms = op_terms(op)
+    lengths = {term: len(index.get(term, ())) for term in terms}
+
+    def undo():
+        for term, length in lengths.items():
+            if length:
+                del index[term][length:]
+            else:
+                index.pop(term, None)
+    return undo
+
+
+def _undo_node(node):
+    """Отмена добавления записей в папку: список файлов и версия возвращаются к прежним."""
+    length, version = len(node["files"]), node.get("version", 0)
+
+    def undo():
+        del node["files"][length:]
+        node["version"] = version
+    return undo
+
+
+def _undo_user(document, op):
+    previous = document["users"].get(op["user"], _MISSING)
+    return lambda: _restore(document["users"], op["user"], previous)
+
+
+def _undo_mkdir(document, op):
+    user = document["users"][op["user"]]
+    parent = get_node(user, op["parent"])
+    version, next_node = parent.get("version", 0), user["next_node"]
+
+    def undo():
+        user["nodes"].pop(str(op["node"]), None)
+        parent["folders"].pop(op["name"], None)
+        parent["version"] = version
+        user["next_node"] = next_node
+    return undo
+
+
+def _undo_file(document, op):
+    user = document["users"][op["user"]]
+    short_id = op["record"].get("short_id")
+    previous = user["file_mappings"].get(short_id, _MISSING)
+    undo_node = _undo_node(get_node(user, op["node"]))
+    undo_index = _undo_index(user, op)
+
+    def undo():
+        undo_index()
+        undo_node()
+        if short_id:
+            _restore(user["file_mappings"], short_id, previous)
+    return undo
+
+
+def _undo_media(document, op):
+    user = document["users"][op["user"]]
+    had_blobs = "blobs" in user
+    blob = user.get("blobs", {}).get(op["blob"])
+    refs = blob["refs"] if blob else None
+    undo_node = _undo_node(get_node(user, op["node"]))
+    undo_index = _undo_index(user, op)
+
+    def undo():
+        undo_index()
+        undo_node()
+        if not had_blobs:
+            user.pop("blobs", None)
+        elif blob is None:
+            user["blobs"].pop(op["blob"], None)
+        else:
+            blob["refs"] = refs
+    return undo
+
+
+def _undo_reindex(document, op):
+    user = document["users"][op["user"]]
+    previous = user.get("search", _MISSING)
+    return lambda: _restore(user, "search", previous)
+
+
+def _undo_cd(document, op):
+    user = document["users"][op["user"]]
+    previous = user["current"]
+    return lambda: user.__setitem__("current", previous)
+
+
+def _undo_share(document, op):
+    previous = document["shared_folders"].get(op["key"], _MISSING)
+    return lambda: _restore(document["shared_folders"], op["key"], previous)
+
+
+UNDO = {
+    "user": _undo_user,
+    "import_user": _undo_user,
+    "mkdir": _undo_mkdir,
+    "file": _undo_file,
+    "media": _undo_media,
+    "reindex": _undo_reindex,
+    "cd": _undo_cd,
+    "share": _undo_share,
+}
+
+
+class DocumentStorage(Storage):
+    """
+    Хранилище поверх документа {"users": ..., "shared_folders": ...}.
+    Наследники определяют, как документ читается (_begin) и как
+    сохраняются изменения транзакции (_commit).
+
+    Транзакция блокирует данные каждого пользователя, к которым обращается, до своего
+    завершения, поэтому транзакции разных пользователей выполняются параллельно.
+    Блокировку SHARED_KEY берут только изменения shared_folders и всегда последней:
+    записи публичных папок не меняются после создания и читаются без блокировки.
+    Если транзакция завершилась исключением, её мутации отменяются в обратном порядке,
+    как откат транзакции в SQLite.
+    Поисковые индексы хранятся отдельно от документа, в search_directory (см. SearchIndex).
+    """
+
+    def __init__(self, search_directory=None):
+        self._local = threading.local()
+        self._search = SearchIndex(search_directory)
+        self._key_locks = KeyLocks()
+        # Индекс short_id -> (id узла, запись) по пользователям; строится при первом обращении
+        self._indexes = {}
+        self._indexed_document = None
+        # Индекс начало ключа -> ключ публичной папки
+        self._share_index = None
+        self._share_indexed_document = None
+        self._share_index_lock = threading.Lock()
+
+    def _begin(self):
+        raise NotImplementedError
+
+    def _commit(self, document, ops):
+        raise NotImplementedError
+
+    def _rollback(self, document, ops):
+        pass
+
+    def _end(self, document):
+        pass
+
+    @contextmanager
+    def transaction(self, write=False):
+        document = getattr(self._local, "document", None)
+        if document is not None:
+            yield document
+            return
+        # Время транзакции включает ожидание блокировок и запись на диск, если она синхронная
+        started = time.perf_counter()
+        document = self._begin()
+        self._local.document = document
+        self._local.ops = []
+        self._local.undo = []
+        self._local.keys = []
+        try:
+            yield document
+            if self._local.ops:
+                self._commit(document, self._local.ops)
+        except BaseException:
+            self._undo(self._local.ops, self._local.undo)
+            self._rollback(document, self._local.ops)
+            raise
+        finally:
+            for key in reversed(self._local.keys):
+                self._key_locks.release(key)
+            self._local.document = None
+            self._local.ops = None
+            self._local.undo = None
+            self._local.keys = None
+            self._end(document)
+            STORAGE_SECONDS.observe(time.perf_counter() - started, "transaction")
+
+    def _lock_key(self, key):
+        """Блокирует ключ до конца текущей транзакции."""
+        if key not in self._local.keys:
+            self._key_locks.acquire(key)
+            self._local.keys.append(key)
+
+    def is_locked(self, key):
+        return self._key_locks.is_locked(key)
+
+    def _undo(self, ops, undo):
+        """Отменяет применённые мутации транзакции; блокировки их ключей ещё удерживаются."""
+        for restore in reversed(undo):
+            restore()
+        for op in ops:
+            if "user" in op:
+                self._indexes.pop(op["user"], None)
+            if op["op"] == "share":
+                with self._share_index_lock:
+                    self._share_indexed_document = None
+
+    def _mutate(self, op):
+        # Отмена записывается до применения: мутация, упавшая на середине, тоже откатывается
+        self._local.undo.append(UNDO[op["op"]](self._local.document, op))
+        apply_op(self._local.document, op)
+        self._local.ops.append(op)
+        self._local.undo.append(self._index_search(op))
+        if op["op"] in ("file", "media"):
+            index = self._indexes.get(op["user"])
+            short_id = op["record"].get("short_id")
+            if index is not None and short_id:
+                index[short_id] = (op["node"], op["record"])
+        elif op["op"] == "import_user":
+            self._indexes.pop(op["user"], None)
+        elif op["op"] == "share":
+            with self._share_index_lock:
+                if self._share_index is not None:
+                    self._share_index[op["key"][:SHARE_PREFIX_LENGTH]] = op["key"]
+
+    def _index_search(self, op, replay=False):
+        """Переносит мутацию в SearchIndex; возвращает функцию её отмены."""
+        user_id = op.get("user")
+        if op["op"] == "import_user":
+            state = self._search.state(user_id)
+            self._search.drop(user_id)
+            return lambda: self._search.restore(user_id, state)
+        short_id = op["record"].get("short_id") if op["op"] in ("file", "media") else None
+        if not short_id:
+            return lambda: None
+        terms = op_terms(op)
+        self._search.add(user_id, short_id, terms, replay)
+        return lambda: self._search.remove(user_id, short_id, terms)
+
+    def _file_index(self, document, user_id):
+        if document is not self._indexed_document:
+            self._indexes = {}
+            self._indexed_document = document
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = {}
+            for node in document["users"][user_id]["nodes"].values():
+                for record in node["files"]:
+                    if record.get("short_id"):
+                        index[record["short_id"]] = (node["id"], record)
+            self._indexes[user_id] = index
+        return index
+
+    def _build_search(self, user_id, load_text=None):
+        """
+        Строит поисковый индекс пользователя, у которого его ещё нет. Под блокировкой пользователя
+        только копируется список записей; слова разбираются без неё (если вызов не внутри
+        транзакции), а записи, добавленные за это время, дописываются в конце.
+        """
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            user = document["users"].get(user_id)
+            if user is None or self._search.exists(user_id):
+                return
+            if "search" in user:
+                # Встроенный индекс старого формата (или из migrate.py) переносится как есть
+                self._search.put(user_id, {term: list(short_ids) for term, short_ids in user["search"].items()})
+                self._mutate({"op": "reindex", "user": user_id})
+                return
+            records = user_records(user)
+        index = build_index(records, load_text)
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            user = document["users"].get(user_id)
+            if user is None or self._search.exists(user_id):
+                return
+            known = {record.get("short_id") for record in records}
+            for record in user_records(user):
+                if record.get("short_id") not in known:
+                    index_record(index, record["short_id"], stored_terms(record, load_text))
+            self._search.put(user_id, index)
+
+    def drop_index(self, user_id):
+        self._indexes.pop(user_id, None)
+        self._search.evict(user_id)
+
+    def _user(self, document, user_id):
+        self._lock_key(user_id)
+        if user_id not in document["users"]:
+            self._mutate({"op": "user", "user": user_id})
+        return document["users"][user_id]
+
+    def ensure_user(self, user_id):
+        with self.transaction() as document:
+            self._user(document, user_id)
+
+    def user_exists(self, user_id):
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            return user_id in document["users"]
+
+    def get_current_node(self, user_id):
+        with self.transaction() as document:
+            return self._user(document, user_id)["current"]
+
+    def set_current_node(self, user_id, node_id):
+        with self.transaction() as document:
+            self._user(document, user_id)
+            self._mutate({"op": "cd", "user": user_id, "node": node_id})
+
+    def get_node(self, user_id, node_id):
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            user = document["users"].get(user_id)
+            if user is None:
+                raise KeyError(user_id)
+            node = get_node(user, node_id)
+            # Копия, чтобы вызывающий код мог читать её и после конца транзакции
+            return dict(node, folders=dict(node["folders"]),
+                        files=[resolve_record(user, record) for record in node["files"]])
+
+    def create_folder(self, user_id, parent_id, name):
+        with self.transaction() as document:
+            user = self._user(document, user_id)
+            if name in get_node(user, parent_id)["folders"]:
+                return None
+            node_id = user["next_node"]
+            self._mutate({"op": "mkdir", "user": user_id, "parent": parent_id, "name": name, "node": node_id})
+            return node_id
+
+    def add_file(self, user_id, node_id, record, terms=None):
+        with self.transaction() as document:
+            user = self._user(document, user_id)
+            get_node(user, node_id)
+            op = {"op": "file", "user": user_id, "node": node_id, "record": record}
+            if terms is not None:
+                op["terms"] = terms
+            self._mutate(op)
+
+    def add_media(self, user_id, node_id, record, unique_id):
+        with self.transaction() as document:
+            user = self._user(document, user_id)
+            node = get_node(user, node_id)
+            if find_media(user, node, unique_id) is not None:
+                return MEDIA_DUPLICATE
+            linked = unique_id in user.get("blobs", {})
+            reference = {key: value for key, value in record.items() if key != "file_id"}
+            reference["blob"] = unique_id
+            self._mutate({"op": "media", "user": user_id, "node": node_id, "record": reference,
+                          "blob": unique_id, "type": record["type"], "file_id": record["file_id"]})
+            return MEDIA_LINKED if linked else MEDIA_ADDED
+
+    def find_file(self, user_id, short_id):
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            if user_id not in document["users"]:
+                return None
+            found = self._file_index(document, user_id).get(short_id)
+            if found is None:
+                return None
+            node_id, record = found
+            return {"node": node_id, "record": resolve_record(document["users"][user_id], record)}
+
+    def search(self, user_id, terms, load_text=None):
+        with self.transaction():
+            # Транзакция без блокировки пользователя: только чтобы документ был загружен
+            # (при загрузке журнала его хвост дописывается в индекс)
+            hits = self._search.lookup(user_id, terms)
+        if hits is None:
+            self._build_search(user_id, load_text)
+            hits = self._search.lookup(user_id, terms)
+        return hits or []
+
+    def folder_path(self, user_id, node_id):
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            user = document["users"].get(user_id)
+            if user is None:
+                raise KeyError(user_id)
+            return folder_path(user, node_id)
+
+    def is_within(self, user_id, node_id, ancestor_id):
+        with self.transaction() as document:
+            self._lock_key(user_id)
+            user = document["users"].get(user_id)
+            if user is None:
+                return False
+            try:
+                return is_within(user, node_id, ancestor_id)
+            except KeyError:
+                return False
+
+    def get_share(self, key):
+        with self.transaction() as document:
+            shared = document.get("shared_folders", {}).get(key)
+            if shared is None or "node" in shared:
+                return shared
+            # Запись старого формата хранит путь из имён папок
+            self._lock_key(shared["user_id"])
+            owner = document["users"].get(shared["user_id"])
+            try:
+                node_id = resolve_path(owner, shared["path"]) if owner else None
+            except KeyError:
+                node_id = None
+            return {"user_id": shared["user_id"], "node": node_id}
+
+    def find_share(self, prefix):
+        with self.transaction() as document:
+            with self._share_index_lock:
+                if document is not self._share_indexed_document:
+                    self._share_index = {key[:SHARE_PREFIX_LENGTH]: key for key in document.get("shared_folders", {})}
+                    self._share_indexed_document = document
+                key = self._share_index.get(prefix)
+            if key is None:
+                return None
+            shared = self.get_share(key)
+            return dict(shared, key=key) if shared else None
+
+    def create_share(self, key, user_id, node_id):
+        with self.transaction():
+            self._lock_key(SHARED_KEY)
+            self._mutate({"op": "share", "key": key, "user": user_id, "node": node_id})
+
+    def import_document(self, document):
+        """Импорт документа из JSON; пользователи, уже имеющиеся в хранилище, пропускаются."""
+        imported = 0
+        with self.transaction() as current:
+            for user_id, user in document.get("users", {}).items():
+                self._lock_key(user_id)
+                if user_id in current["users"]:
+                    continue
+                self._mutate({"op": "import_user", "user": user_id, "data": user})
+                imported += 1
+            self._lock_key(SHARED_KEY)
+            for key, shared in document.get("shared_folders", {}).items():
+                node_id = shared.get("node")
+                if node_id is None:
+                    # Запись старого формата: путь из имён папок
+                    owner = current["users"].get(shared["user_id"])
+                    try:
+                        node_id = resolve_path(owner, shared["path"]) if owner else None
+                    except KeyError:
+                        node_id = None
+                if node_id is None:
+                    continue
+                self._mutate({"op": "share", "key": key, "user": shared["user_id"], "node": node_id})
+        return imported
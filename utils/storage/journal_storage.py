@@ -0,0 +1,123 @@
+# utils/storage/journal_storage.py
+
+import json
+import logging
+import os
+import shutil
+import threading
+from utils.storage.base import apply_op, upgrade_document, files_size
+from utils.storage.json_storage import read_document, replace_file
+from utils.storage.snapshot import check_format, encode
+from utils.storage.write_behind import WriteBehindStorage
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = "journal_seq"
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+class JournalStorage(WriteBehindStorage):
+    """
+    Снимок (DATA_FILE) плюс журнал мутаций (DATA_FILE.journal).
+    Каждая транзакция дописывает в журнал по одной строке на мутацию, так что запись
+    стоит O(размера изменения). Фоновый поток периодически сворачивает журнал в новый снимок.
+    При старте читается снимок и проигрывается хвост журнала.
+    Формат снимка задают format и compression (см. utils/storage/snapshot.py), журнал — всегда JSON.
+    Поисковые индексы (DATA_FILE.search) записываются при сворачивании.
+    """
+
+    def __init__(self, path, fsync=False, format="json", compression=None, **options):
+        super().__init__(search_directory=f"{path}.search", **options)
+        check_format(format, compression)
+        self.path = path
+        self.format = format
+        self.compression = compression
+        self.journal_path = f"{path}.journal"
+        self.old_journal_path = f"{path}.journal.old"
+        self.fsync = fsync
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        self._seq = 0
+
+    def _replay(self, document, path, after_seq):
+        if not os.path.exists(path):
+            return 0
+        replayed = 0
+        with open(path, 'r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, start=1):
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после сбоя
+                    logger.warning(f"Пропущена повреждённая запись журнала {path}:{line_number}")
+                    continue
+                seq = op.pop("seq")
+                if seq <= after_seq:
+                    continue
+                apply_op(document, op)
+                # Индекс на диске соответствует снимку (или опережает его), хвост журнала дописывается
+                self._index_search(op, replay=True)
+                self._seq = seq
+                replayed += 1
+        return replayed
+
+    def _load(self):
+        document = upgrade_document(read_document(self.path))
+        self._seq = document.pop(SEQ_KEY, 0)
+        snapshot_seq = self._seq
+        replayed = self._replay(document, self.old_journal_path, snapshot_seq)
+        replayed += self._replay(document, self.journal_path, snapshot_seq)
+        if replayed:
+            logger.info(f"Из журнала восстановлено мутаций: {replayed}")
+            self._pending = replayed
+            self._dirty.add("journal")
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        if self._journal.tell() and not _ends_with_newline(self.journal_path):
+            # Новые записи не должны склеиться с оборванной строкой
+            self._journal.write("\n")
+        return document
+
+    def _commit(self, document, ops):
+        # Транзакции разных пользователей могут завершаться одновременно
+        with self._journal_lock:
+            lines = []
+            for op in ops:
+                self._seq += 1
+                lines.append(json.dumps({"seq": self._seq, **op}, ensure_ascii=False))
+            self._journal.write("\n".join(lines) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+        super()._commit(document, ops)
+
+    def _serialize(self, document, dirty):
+        # Новые мутации идут в свежий журнал, а снимок покрывает всё до текущего seq
+        self._journal.close()
+        if os.path.exists(self.old_journal_path):
+            # Прошлое сворачивание не завершилось: дописываем текущий журнал к старому
+            with open(self.old_journal_path, 'a', encoding='utf-8') as old_journal, \
+                    open(self.journal_path, 'r', encoding='utf-8') as journal:
+                shutil.copyfileobj(journal, old_journal)
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.old_journal_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return encode({**document, SEQ_KEY: self._seq}, self.format, self.compression)
+
+    def _write(self, payload):
+        replace_file(self.path, payload)
+        os.remove(self.old_journal_path)
+
+    def size_on_disk(self):
+        return files_size([self.path, self.journal_path, self.old_journal_path]) + self._search.size_on_disk()
+
+    def close(self):
+        super().close()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
@@ -0,0 +1,55 @@
+# utils/storage/json_storage.py
+
+import os
+from utils.storage.base import upgrade_document, files_size
+from utils.storage.snapshot import check_format, encode, read_snapshot
+from utils.storage.write_behind import WriteBehindStorage
+
+
+def read_document(path):
+    # Формат (JSON, msgpack) и сжатие определяются по содержимому файла
+    return read_snapshot(path)
+
+
+def write_document(path, document, format="json", compression=None):
+    replace_file(path, encode(document, format, compression))
+
+
+def replace_file(path, content):
+    # Запись во временный файл и атомарная замена, чтобы сбой не оставил файл обрезанным
+    tmp_path = f"{path}.tmp"
+    if isinstance(content, bytes):
+        with open(tmp_path, 'wb') as file:
+            file.write(content)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+    os.replace(tmp_path, path)
+
+
+class JsonStorage(WriteBehindStorage):
+    """
+    Весь документ в одном файле; файл читается один раз при старте.
+    format и compression задают, как пишется снимок (см. utils/storage/snapshot.py),
+    прочитать можно файл в любом из форматов.
+    """
+
+    def __init__(self, path, format="json", compression=None, **options):
+        super().__init__(search_directory=f"{path}.search", **options)
+        check_format(format, compression)
+        self.path = path
+        self.format = format
+        self.compression = compression
+
+    def _load(self):
+        return upgrade_document(read_document(self.path))
+
+    def _serialize(self, document, dirty):
+        # Файл один, поэтому сериализуется весь документ
+        return encode(document, self.format, self.compression)
+
+    def _write(self, payload):
+        replace_file(self.path, payload)
+
+    def size_on_disk(self):
+        return files_size([self.path]) + self._search.size_on_disk()
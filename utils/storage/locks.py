@@ -0,0 +1,74 @@
+# utils/storage/locks.py
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Много читателей или один писатель. Ожидающий писатель не пропускает новых читателей,
+    чтобы поток сохранения не голодал. Блокировка не реентерабельна.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class KeyLocks:
+    """Блокировка на каждый ключ (пользователя или общие данные); создаётся по требованию."""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        # ключ -> [блокировка, число владельцев и ожидающих]
+        self._locks = {}
+
+    def acquire(self, key):
+        with self._mutex:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def release(self, key):
+        with self._mutex:
+            entry = self._locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def is_locked(self, key):
+        """Занят ли ключ какой-либо транзакцией (или ожидается ею)."""
+        with self._mutex:
+            return key in self._locks
@@ -0,0 +1,144 @@
+# utils/storage/search_index.py
+
+import json
+import logging
+import os
+import threading
+from utils.search import index_record, lookup
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """
+    Поисковые индексы пользователей (см. utils/search.py) отдельно от их данных: по файлу
+    directory/<user_id>.json на пользователя, поэтому сохранение данных не переписывает индекс.
+    Индекс подгружается при первом обращении; изменённые пишутся при сбросе хранилища раньше
+    самих данных, так что индекс на диске не отстаёт от них (лишние short_id отбрасываются
+    при выдаче результатов). directory=None — индексы только в памяти.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        # user_id -> индекс или None (файла нет); отсутствие ключа — ещё не читали
+        self._indexes = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    def _get(self, user_id):
+        if user_id not in self._indexes:
+            index = None
+            if self.directory and os.path.exists(self._path(user_id)):
+                try:
+                    with open(self._path(user_id), encoding='utf-8') as file:
+                        index = json.load(file)
+                except (OSError, ValueError) as e:
+                    # Индекс можно построить заново из данных
+                    logger.warning(f"Не удалось прочитать поисковый индекс {user_id}: {e}")
+            self._indexes[user_id] = index
+        return self._indexes[user_id]
+
+    def lookup(self, user_id, terms):
+        """short_id по словам terms (см. utils.search.lookup) или None, если индекса ещё нет."""
+        with self._lock:
+            index = self._get(user_id)
+            return None if index is None else lookup(index, terms)
+
+    def exists(self, user_id):
+        with self._lock:
+            return self._get(user_id) is not None
+
+    def put(self, user_id, index):
+        with self._lock:
+            self._indexes[user_id] = index
+            self._dirty.add(user_id)
+
+    def add(self, user_id, short_id, terms, replay=False):
+        """
+        Добавляет запись в индекс, если он есть (иначе она попадёт в него при построении).
+        replay — запись из журнала: индекс на диске мог уже её содержать.
+        """
+        with self._lock:
+            index = self._get(user_id)
+            if index is None or not terms:
+                return
+            if replay and short_id in index.get(terms[0], ()):
+                return
+            index_record(index, short_id, terms)
+            self._dirty.add(user_id)
+
+    def remove(self, user_id, short_id, terms):
+        """Убирает запись, добавленную последней (откат транзакции)."""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            for term in terms:
+                postings = index.get(term)
+                if postings and postings[-1] == short_id:
+                    postings.pop()
+                    if not postings:
+                        del index[term]
+            self._dirty.add(user_id)
+
+    def state(self, user_id):
+        """Состояние индекса пользователя для restore() при откате."""
+        with self._lock:
+            index = self._get(user_id)
+            return index, user_id in self._dirty
+
+    def restore(self, user_id, state):
+        with self._lock:
+            self._indexes[user_id], dirty = state
+            if dirty:
+                self._dirty.add(user_id)
+
+    def drop(self, user_id):
+        """Удаляет индекс (данные пользователя заменены); файл удаляется при сбросе."""
+        with self._lock:
+            self._indexes[user_id] = None
+            self._dirty.add(user_id)
+
+    def evict(self, user_id):
+        """Выгружает из памяти индекс, изменения которого уже записаны."""
+        with self._lock:
+            if user_id not in self._dirty:
+                self._indexes.pop(user_id, None)
+
+    def has_changes(self):
+        return bool(self._dirty)
+
+    def serialize(self):
+        """Снимок изменённых индексов: {user_id: JSON или None — удалить файл}."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return {user_id: None if self._indexes.get(user_id) is None
+                    else json.dumps(self._indexes[user_id], ensure_ascii=False)
+                    for user_id in dirty}
+
+    def write(self, payload):
+        if not self.directory:
+            return
+        # json_storage сам импортирует base (а через него этот модуль), поэтому импорт здесь
+        from utils.storage.json_storage import replace_file
+        try:
+            for user_id, content in payload.items():
+                if content is not None:
+                    replace_file(self._path(user_id), content)
+                elif os.path.exists(self._path(user_id)):
+                    os.remove(self._path(user_id))
+        except BaseException:
+            with self._lock:
+                self._dirty.update(payload)
+            raise
+
+    def size_on_disk(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        with os.scandir(self.directory) as entries:
+            return sum(entry.stat().st_size for entry in entries if entry.is_file())
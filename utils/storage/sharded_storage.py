@@ -0,0 +1,149 @@
+# utils/storage/sharded_storage.py
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from utils.metrics import STORAGE_SECONDS
+from utils.navigation import upgrade_user
+from utils.storage.base import files_size
+from utils.storage.json_storage import replace_file
+from utils.storage.write_behind import WriteBehindStorage, SHARED_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class ShardCache:
+    """
+    Отображение user_id -> данные пользователя, которое подгружает шарды с диска
+    по требованию и держит в памяти не больше capacity пользователей.
+    Вытесняются только давно не использованные шарды, которые уже сохранены
+    и не заняты транзакциями (is_pinned возвращает False).
+    """
+
+    def __init__(self, directory, capacity, is_pinned, on_evict=None):
+        self.directory = directory
+        self.capacity = capacity
+        self.is_pinned = is_pinned
+        self.on_evict = on_evict
+        self._users = OrderedDict()
+        # Порядок LRU общий для всех потоков
+        self._mutex = threading.RLock()
+
+    def shard_path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    def _load(self, user_id):
+        with self._mutex:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+                return self._users[user_id]
+            path = self.shard_path(user_id)
+            if not os.path.exists(path):
+                return None
+            with STORAGE_SECONDS.time("load_shard"), open(path, 'r', encoding='utf-8') as file:
+                user = upgrade_user(json.load(file))
+            self._users[user_id] = user
+            self._evict()
+            return user
+
+    def _evict(self):
+        if len(self._users) <= self.capacity:
+            return
+        for user_id in list(self._users):
+            if len(self._users) <= self.capacity:
+                break
+            if not self.is_pinned(user_id):
+                del self._users[user_id]
+                if self.on_evict:
+                    self.on_evict(user_id)
+
+    def __contains__(self, user_id):
+        return self._load(user_id) is not None
+
+    def __getitem__(self, user_id):
+        user = self._load(user_id)
+        if user is None:
+            raise KeyError(user_id)
+        return user
+
+    def get(self, user_id, default=None):
+        user = self._load(user_id)
+        return default if user is None else user
+
+    def __setitem__(self, user_id, user):
+        with self._mutex:
+            self._users[user_id] = user
+            self._users.move_to_end(user_id)
+            self._evict()
+
+    def pop(self, user_id, default=None):
+        """Убирает пользователя из памяти (откат создания); шард на диске не трогает."""
+        with self._mutex:
+            return self._users.pop(user_id, default)
+
+    def setdefault(self, user_id, default):
+        with self._mutex:
+            user = self._load(user_id)
+            if user is None:
+                self[user_id] = user = default
+            return user
+
+    def cached(self, user_id):
+        """Данные пользователя из памяти без обращения к диску."""
+        return self._users.get(user_id)
+
+    def __len__(self):
+        return len(self._users)
+
+
+class ShardedStorage(WriteBehindStorage):
+    """
+    Каждый пользователь (таблица узлов, текущая папка, file_mappings) хранится в своём
+    файле users/<user_id>.json, публичные папки — в shared_folders.json. Шарды
+    подгружаются по требованию, поэтому память и ввод-вывод растут с числом
+    активных, а не всех зарегистрированных пользователей. Поисковые индексы лежат
+    в search/<user_id>.json и выгружаются из памяти вместе с шардом.
+    """
+
+    def __init__(self, directory, cache_size=1000, **options):
+        super().__init__(search_directory=os.path.join(directory, "search"), **options)
+        self.directory = directory
+        self.users_directory = os.path.join(directory, "users")
+        self.shared_path = os.path.join(directory, "shared_folders.json")
+        self.cache_size = cache_size
+
+    def _load(self):
+        os.makedirs(self.users_directory, exist_ok=True)
+        shared_folders = {}
+        if os.path.exists(self.shared_path):
+            with open(self.shared_path, 'r', encoding='utf-8') as file:
+                shared_folders = json.load(file)
+        users = ShardCache(self.users_directory, self.cache_size, self._is_pinned, self.drop_index)
+        return {"users": users, "shared_folders": shared_folders}
+
+    def _is_pinned(self, user_id):
+        return self.is_dirty(user_id) or self.is_locked(user_id)
+
+    def _serialize(self, document, dirty):
+        payload = {}
+        for key in dirty:
+            if key == SHARED_KEY:
+                payload[self.shared_path] = json.dumps(document["shared_folders"], ensure_ascii=False)
+            else:
+                user = document["users"].cached(key)
+                if user is not None:
+                    payload[document["users"].shard_path(key)] = json.dumps(user, ensure_ascii=False)
+        return payload
+
+    def _write(self, payload):
+        for path, content in payload.items():
+            replace_file(path, content)
+
+    def size_on_disk(self):
+        if not os.path.isdir(self.users_directory):
+            return files_size([self.shared_path])
+        with os.scandir(self.users_directory) as entries:
+            shards = sum(entry.stat().st_size for entry in entries if entry.is_file())
+        return shards + files_size([self.shared_path]) + self._search.size_on_disk()
@@ -0,0 +1,78 @@
+# utils/storage/snapshot.py
+
+import gzip
+import json
+import os
+from utils.storage.base import empty_document
+
+# Необязательные зависимости: msgpack для двоичного формата, zstandard для сжатия zstd
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Форматы снимка документа: "json" — JSON без отступов, "json-pretty" — с отступами
+# (как раньше, удобно читать глазами), "msgpack" — двоичный
+FORMATS = ("json", "json-pretty", "msgpack")
+# Сжатие: None, "gzip" (уровень 1, без зависимостей) или "zstd"
+COMPRESSIONS = (None, "gzip", "zstd")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+def check_format(format, compression):
+    """ValueError, если формат или сжатие неизвестны либо для них не установлен модуль."""
+    if format not in FORMATS:
+        raise ValueError(f"Неизвестный формат снимка: {format}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Неизвестное сжатие снимка: {compression}")
+    if format == "msgpack" and msgpack is None:
+        raise ValueError("Для формата msgpack нужен пакет msgpack (pip install msgpack)")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("Для сжатия zstd нужен пакет zstandard (pip install zstandard)")
+
+
+def encode(document, format="json", compression=None):
+    """Документ в байты снимка."""
+    if format == "msgpack":
+        data = msgpack.packb(document, use_bin_type=True)
+    elif format == "json-pretty":
+        data = json.dumps(document, ensure_ascii=False, indent=4).encode("utf-8")
+    else:
+        data = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def decode(data):
+    """Документ из байтов снимка; формат и сжатие определяются по содержимому."""
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    elif data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("Снимок сжат zstd, нужен пакет zstandard (pip install zstandard)")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    # JSON-документ начинается с "{" (возможно, после пробелов), словарь msgpack — с 0x80–0x8f, 0xde или 0xdf
+    if data.lstrip()[:1] == b"{":
+        return json.loads(data)
+    if msgpack is None:
+        raise ValueError("Снимок в формате msgpack, нужен пакет msgpack (pip install msgpack)")
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def read_snapshot(path):
+    """Документ из файла снимка; пустой документ, если файла нет."""
+    if not os.path.exists(path):
+        return empty_document()
+    with open(path, 'rb') as file:
+        return decode(file.read())
@@ -0,0 +1,473 @@
+# utils/storage/sqlite_storage.py
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from utils.navigation import ROOT_NODE, upgrade_user
+from utils.metrics import STORAGE_SECONDS
+from utils.storage.base import Storage, files_size, MEDIA_ADDED, MEDIA_LINKED, MEDIA_DUPLICATE
+from utils.search import record_terms, terms_by_record
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    current_folder INTEGER REFERENCES folders(id)
+);
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(user_id),
+    parent_id INTEGER REFERENCES folders(id),
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS folders_child ON folders(user_id, parent_id, name);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    type TEXT NOT NULL,
+    short_id TEXT,
+    file_id TEXT,
+    file_name TEXT,
+    content TEXT,
+    blob TEXT,
+    preview TEXT,
+    text_key TEXT
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files(folder_id);
+CREATE INDEX IF NOT EXISTS files_short_id ON files(short_id);
+CREATE TABLE IF NOT EXISTS file_mappings (
+    user_id TEXT NOT NULL REFERENCES users(user_id),
+    short_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, short_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    user_id TEXT NOT NULL REFERENCES users(user_id),
+    unique_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, unique_id)
+);
+CREATE TABLE IF NOT EXISTS search_terms (
+    user_id TEXT NOT NULL,
+    term TEXT NOT NULL,
+    file INTEGER NOT NULL REFERENCES files(id),
+    PRIMARY KEY (user_id, term, file)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS shared_folders (
+    key TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    folder_id INTEGER NOT NULL REFERENCES folders(id)
+);
+"""
+
+# Порядок полей совпадает с тем, как записи хранились в JSON
+FILE_COLUMNS = ("type", "file_id", "file_name", "content", "short_id", "blob", "preview", "text_key")
+
+# Записи файлов вместе с file_id медиа, на которое ссылается запись
+SELECT_FILES = ("SELECT files.*, blobs.file_id AS blob_file_id FROM files "
+                "LEFT JOIN blobs ON blobs.user_id = ? AND blobs.unique_id = files.blob ")
+
+
+def _row_to_record(row):
+    record = {column: row[column] for column in FILE_COLUMNS if row[column] is not None}
+    if row["blob"] is not None:
+        record["file_id"] = row["blob_file_id"]
+    return record
+
+
+class SqliteStorage(Storage):
+    """
+    Хранилище в SQLite: пользователи, узлы папок, файлы, file_mappings, blobs и shared_folders
+    лежат в отдельных таблицах, поэтому каждый обработчик читает и пишет только свои строки.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Соединения всех потоков, чтобы close() закрыл и те, что открыли рабочие потоки
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        connection = self._connection()
+        self._upgrade_schema(connection)
+        indexed = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_terms'").fetchone()
+        connection.executescript(SCHEMA)
+        self._add_columns(connection)
+        self._fill_short_ids(connection)
+        if not indexed:
+            self._build_search(connection)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Соединением пользуется только создавший его поток, но закрывает его close() из любого
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.add(connection)
+        return connection
+
+    @contextmanager
+    def transaction(self, write=False):
+        connection = self._connection()
+        if getattr(self._local, "depth", 0):
+            # Читающая транзакция уже видит снимок базы: запись в ней упала бы с "database is locked",
+            # не дождавшись блокировки, если другой поток успел что-то записать
+            if write and not self._local.write:
+                raise RuntimeError("Изменение внутри читающей транзакции: откройте её с write=True")
+            self._local.depth += 1
+            try:
+                yield connection
+            finally:
+                self._local.depth -= 1
+            return
+        self._local.depth = 1
+        self._local.write = write
+        started = time.perf_counter()
+        # Пишущая транзакция (IMMEDIATE) сразу берёт блокировку записи: параллельные записи из
+        # разных потоков ждут друг друга (timeout), а не падают с "database is locked" при переходе
+        # к записи. Читающие (отложенный BEGIN) в режиме WAL идут параллельно с ними и друг с другом
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = 0
+            STORAGE_SECONDS.observe(time.perf_counter() - started, "transaction")
+
+    def _upgrade_schema(self, connection):
+        """Переводит базу со старой схемой (пути из имён папок) на id узлов."""
+        columns = [row["name"] for row in connection.execute("PRAGMA table_info(users)")]
+        if "current_path" not in columns:
+            return
+        connection.execute("BEGIN")
+        try:
+            users = connection.execute("SELECT user_id, current_path FROM users").fetchall()
+            shares = connection.execute("SELECT key, user_id, path FROM shared_folders").fetchall()
+            connection.execute("DROP TABLE users")
+            connection.execute("DROP TABLE shared_folders")
+            for statement in SCHEMA.split(";"):
+                if "TABLE IF NOT EXISTS users" in statement or "TABLE IF NOT EXISTS shared_folders" in statement:
+                    connection.execute(statement)
+            for row in users:
+                try:
+                    folder_id = self._folder_by_path(connection, row["user_id"], json.loads(row["current_path"]))
+                except KeyError:
+                    folder_id = None
+                connection.execute("INSERT INTO users (user_id, current_folder) VALUES (?, ?)",
+                                   (row["user_id"], folder_id))
+            for row in shares:
+                try:
+                    folder_id = self._folder_by_path(connection, row["user_id"], json.loads(row["path"]))
+                except KeyError:
+                    continue
+                connection.execute("INSERT INTO shared_folders (key, user_id, folder_id) VALUES (?, ?, ?)",
+                                   (row["key"], row["user_id"], folder_id))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _add_columns(self, connection):
+        """Добавляет столбцы, появившиеся после создания базы."""
+        columns = [row["name"] for row in connection.execute("PRAGMA table_info(folders)")]
+        if "version" not in columns:
+            connection.execute("ALTER TABLE folders ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        columns = [row["name"] for row in connection.execute("PRAGMA table_info(files)")]
+        for column in ("blob", "preview", "text_key"):
+            if column not in columns:
+                connection.execute(f"ALTER TABLE files ADD COLUMN {column} TEXT")
+
+    def _fill_short_ids(self, connection):
+        """
+        Выдаёт short_id записям, перенесённым без него (заметки из данных старого формата),
+        и добавляет их в поисковый индекс.
+        """
+        with self.transaction(write=True):
+            rows = connection.execute(
+                "SELECT files.id, folders.user_id, file_id, content, preview, file_name FROM files "
+                "JOIN folders ON folders.id = files.folder_id WHERE short_id IS NULL").fetchall()
+            for row in rows:
+                short_id = uuid.uuid4().hex[:8]
+                connection.execute("UPDATE files SET short_id = ? WHERE id = ?", (short_id, row["id"]))
+                if row["file_id"]:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO file_mappings (user_id, short_id, file_id) VALUES (?, ?, ?)",
+                        (row["user_id"], short_id, row["file_id"]))
+                record = {column: row[column] for column in ("content", "preview", "file_name") if row[column]}
+                self._index_file(connection, row["user_id"], row["id"], record_terms(record))
+            if rows:
+                logger.info(f"Выдано short_id записям без него: {len(rows)}")
+
+    def _build_search(self, connection):
+        """Заполняет поисковый индекс по файлам, сохранённым до его появления."""
+        with self.transaction(write=True):
+            rows = connection.execute(
+                "SELECT files.id, folders.user_id, content, preview, file_name FROM files "
+                "JOIN folders ON folders.id = files.folder_id WHERE short_id IS NOT NULL").fetchall()
+            for row in rows:
+                record = {column: row[column] for column in ("content", "preview", "file_name") if row[column]}
+                self._index_file(connection, row["user_id"], row["id"], record_terms(record))
+
+    def _index_file(self, connection, user_id, file_row, terms):
+        connection.executemany("INSERT OR IGNORE INTO search_terms (user_id, term, file) VALUES (?, ?, ?)",
+                               [(user_id, term, file_row) for term in terms])
+
+    def _root_id(self, connection, user_id):
+        row = connection.execute(
+            "SELECT id FROM folders WHERE user_id = ? AND parent_id IS NULL", (user_id,)).fetchone()
+        if row is None:
+            raise KeyError(user_id)
+        return row["id"]
+
+    def _folder_by_path(self, connection, user_id, path):
+        folder_id = self._root_id(connection, user_id)
+        for name in path:
+            row = connection.execute(
+                "SELECT id FROM folders WHERE user_id = ? AND parent_id = ? AND name = ?",
+                (user_id, folder_id, name)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            folder_id = row["id"]
+        return folder_id
+
+    def _ensure_user(self, connection, user_id):
+        cursor = connection.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+        if cursor.rowcount:
+            connection.execute("INSERT INTO folders (user_id, parent_id, name) VALUES (?, NULL, '')", (user_id,))
+
+    def ensure_user(self, user_id):
+        # Существующий пользователь проверяется без блокировки записи
+        if self.user_exists(user_id):
+            return
+        with self.transaction(write=True) as connection:
+            self._ensure_user(connection, user_id)
+
+    def user_exists(self, user_id):
+        with self.transaction() as connection:
+            row = connection.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            return row is not None
+
+    def get_current_node(self, user_id):
+        with self.transaction() as connection:
+            row = connection.execute("SELECT current_folder FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            # Новый пользователь создаётся в отдельной пишущей транзакции; внутри читающей это
+            # ошибка, поэтому обработчики вызывают ensure_user до неё
+            self.ensure_user(user_id)
+        with self.transaction() as connection:
+            if row is not None and row["current_folder"] is not None:
+                return row["current_folder"]
+            return self._root_id(connection, user_id)
+
+    def set_current_node(self, user_id, node_id):
+        with self.transaction(write=True) as connection:
+            self._ensure_user(connection, user_id)
+            connection.execute("UPDATE users SET current_folder = ? WHERE user_id = ?", (node_id, user_id))
+
+    def get_node(self, user_id, node_id):
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT id, parent_id, name, version FROM folders WHERE id = ? AND user_id = ?",
+                (node_id, user_id)).fetchone()
+            if row is None:
+                raise KeyError(node_id)
+            folders = {child["name"]: child["id"] for child in connection.execute(
+                "SELECT id, name FROM folders WHERE parent_id = ? ORDER BY id", (node_id,))}
+            files = [_row_to_record(file) for file in connection.execute(
+                SELECT_FILES + "WHERE folder_id = ? ORDER BY files.id", (user_id, node_id))]
+            return {"id": row["id"], "parent": row["parent_id"], "name": row["name"],
+                    "folders": folders, "files": files, "version": row["version"]}
+
+    def create_folder(self, user_id, parent_id, name):
+        with self.transaction(write=True) as connection:
+            self._ensure_user(connection, user_id)
+            self.get_node(user_id, parent_id)
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO folders (user_id, parent_id, name) VALUES (?, ?, ?)",
+                (user_id, parent_id, name))
+            if not cursor.rowcount:
+                return None
+            folder_id = cursor.lastrowid
+            connection.execute("UPDATE folders SET version = version + 1 WHERE id = ?", (parent_id,))
+            return folder_id
+
+    def _insert_file(self, connection, user_id, folder_id, record, terms=None):
+        cursor = connection.execute(
+            "INSERT INTO files (folder_id, type, short_id, file_id, file_name, content, blob, preview, text_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (folder_id, record["type"], record.get("short_id"), record.get("file_id"),
+             record.get("file_name"), record.get("content"), record.get("blob"),
+             record.get("preview"), record.get("text_key")))
+        if record.get("short_id"):
+            self._index_file(connection, user_id, cursor.lastrowid,
+                             record_terms(record) if terms is None else terms)
+
+    def add_file(self, user_id, node_id, record, terms=None):
+        with self.transaction(write=True) as connection:
+            self._ensure_user(connection, user_id)
+            self.get_node(user_id, node_id)
+            self._insert_file(connection, user_id, node_id, record, terms)
+            connection.execute("UPDATE folders SET version = version + 1 WHERE id = ?", (node_id,))
+            if record.get("short_id") and record.get("file_id"):
+                connection.execute(
+                    "INSERT OR REPLACE INTO file_mappings (user_id, short_id, file_id) VALUES (?, ?, ?)",
+                    (user_id, record["short_id"], record["file_id"]))
+
+    def add_media(self, user_id, node_id, record, unique_id):
+        with self.transaction(write=True) as connection:
+            self._ensure_user(connection, user_id)
+            self.get_node(user_id, node_id)
+            row = connection.execute("SELECT 1 FROM blobs WHERE user_id = ? AND unique_id = ?",
+                                     (user_id, unique_id)).fetchone()
+            if row is not None and connection.execute(
+                    "SELECT 1 FROM files WHERE folder_id = ? AND blob = ?", (node_id, unique_id)).fetchone():
+                return MEDIA_DUPLICATE
+            connection.execute(
+                "INSERT OR IGNORE INTO blobs (user_id, unique_id, type, file_id) VALUES (?, ?, ?, ?)",
+                (user_id, unique_id, record["type"], record["file_id"]))
+            connection.execute("UPDATE blobs SET refs = refs + 1 WHERE user_id = ? AND unique_id = ?",
+                               (user_id, unique_id))
+            reference = {key: value for key, value in record.items() if key != "file_id"}
+            self._insert_file(connection, user_id, node_id, dict(reference, blob=unique_id))
+            connection.execute("UPDATE folders SET version = version + 1 WHERE id = ?", (node_id,))
+            return MEDIA_LINKED if row is not None else MEDIA_ADDED
+
+    def find_file(self, user_id, short_id):
+        with self.transaction() as connection:
+            row = connection.execute(
+                SELECT_FILES + "JOIN folders ON folders.id = files.folder_id "
+                "WHERE files.short_id = ? AND folders.user_id = ?", (user_id, short_id, user_id)).fetchone()
+            if row is None:
+                return None
+            return {"node": row["folder_id"], "record": _row_to_record(row)}
+
+    def search(self, user_id, terms, load_text=None):
+        if not terms:
+            return []
+        with self.transaction() as connection:
+            matches = " INTERSECT ".join(["SELECT file FROM search_terms WHERE user_id = ? AND term = ?"] * len(terms))
+            rows = connection.execute(
+                f"SELECT short_id FROM files WHERE id IN ({matches}) ORDER BY id DESC",
+                [value for term in terms for value in (user_id, term)]).fetchall()
+            return [row["short_id"] for row in rows]
+
+    def folder_path(self, user_id, node_id):
+        with self.transaction() as connection:
+            rows = connection.execute("""
+                WITH RECURSIVE chain(id, parent_id, name, depth) AS (
+                    SELECT id, parent_id, name, 0 FROM folders WHERE id = ? AND user_id = ?
+                    UNION ALL
+                    SELECT folders.id, folders.parent_id, folders.name, chain.depth + 1
+                    FROM folders JOIN chain ON folders.id = chain.parent_id
+                )
+                SELECT name, parent_id FROM chain ORDER BY depth DESC
+            """, (node_id, user_id)).fetchall()
+            if not rows:
+                raise KeyError(node_id)
+            return [row["name"] for row in rows if row["parent_id"] is not None]
+
+    def is_within(self, user_id, node_id, ancestor_id):
+        with self.transaction() as connection:
+            row = connection.execute("""
+                WITH RECURSIVE chain(id, parent_id) AS (
+                    SELECT id, parent_id FROM folders WHERE id = ? AND user_id = ?
+                    UNION ALL
+                    SELECT folders.id, folders.parent_id FROM folders JOIN chain ON folders.id = chain.parent_id
+                )
+                SELECT 1 FROM chain WHERE id = ?
+            """, (node_id, user_id, ancestor_id)).fetchone()
+            return row is not None
+
+    def get_share(self, key):
+        with self.transaction() as connection:
+            row = connection.execute("SELECT user_id, folder_id FROM shared_folders WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            return {"user_id": row["user_id"], "node": row["folder_id"]}
+
+    def find_share(self, prefix):
+        with self.transaction() as connection:
+            # Диапазон по первичному ключу вместо LIKE, чтобы использовался индекс
+            row = connection.execute(
+                "SELECT key, user_id, folder_id FROM shared_folders WHERE key >= ? AND key < ? LIMIT 1",
+                (prefix, prefix + chr(0x10FFFF))).fetchone()
+            if row is None:
+                return None
+            return {"key": row["key"], "user_id": row["user_id"], "node": row["folder_id"]}
+
+    def create_share(self, key, user_id, node_id):
+        with self.transaction(write=True) as connection:
+            connection.execute("INSERT OR REPLACE INTO shared_folders (key, user_id, folder_id) VALUES (?, ?, ?)",
+                               (key, user_id, node_id))
+
+    def import_document(self, document):
+        """Импорт документа из JSON; пользователи, уже имеющиеся в базе, пропускаются."""
+        imported = 0
+        # id узлов документа -> id строк folders для импортированных пользователей
+        node_maps = {}
+        with self.transaction(write=True) as connection:
+            for user_id, user in document.get("users", {}).items():
+                if self.user_exists(user_id):
+                    continue
+                user = upgrade_user(user)
+                self._ensure_user(connection, user_id)
+                node_map = {ROOT_NODE: self._root_id(connection, user_id)}
+                # Слова из индекса документа: для длинных заметок в записи остаётся только превью
+                terms = terms_by_record(user.get("search", {}))
+                for node in sorted(user["nodes"].values(), key=lambda node: node["id"]):
+                    if node["parent"] is not None:
+                        cursor = connection.execute(
+                            "INSERT INTO folders (user_id, parent_id, name) VALUES (?, ?, ?)",
+                            (user_id, node_map[node["parent"]], node["name"]))
+                        node_map[node["id"]] = cursor.lastrowid
+                    for record in node["files"]:
+                        self._insert_file(connection, user_id, node_map[node["id"]], record,
+                                          terms.get(record.get("short_id")))
+                connection.execute("UPDATE users SET current_folder = ? WHERE user_id = ?",
+                                   (node_map.get(user["current"]), user_id))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO file_mappings (user_id, short_id, file_id) VALUES (?, ?, ?)",
+                    [(user_id, short_id, file_id) for short_id, file_id in user.get("file_mappings", {}).items()])
+                connection.executemany(
+                    "INSERT OR REPLACE INTO blobs (user_id, unique_id, type, file_id, refs) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, unique_id, blob["type"], blob["file_id"], blob["refs"])
+                     for unique_id, blob in user.get("blobs", {}).items()])
+                node_maps[user_id] = node_map
+                imported += 1
+            for key, shared in document.get("shared_folders", {}).items():
+                owner_id = shared["user_id"]
+                try:
+                    if "node" in shared:
+                        folder_id = node_maps[owner_id][shared["node"]]
+                    else:
+                        folder_id = self._folder_by_path(connection, owner_id, shared["path"])
+                except KeyError:
+                    continue
+                self.create_share(key, owner_id, folder_id)
+        return imported
+
+    def size_on_disk(self):
+        return files_size([self.path, f"{self.path}-wal", f"{self.path}-shm"])
+
+    def close(self):
+        """Закрывает соединения всех потоков; вызывается, когда обработчики уже остановлены."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            connection.close()
+        self._local.connection = None
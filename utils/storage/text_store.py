@@ -0,0 +1,44 @@
+# utils/storage/text_store.py
+
+import hashlib
+import os
+import threading
+import zlib
+from utils.metrics import STORAGE_SECONDS
+
+
+class TextStore:
+    """
+    Сжатые тексты длинных заметок вне дерева папок: каталог directory/<2 символа>/<sha256>.z.
+    Ключ — хэш текста, поэтому одинаковые заметки хранятся один раз, а файл после записи
+    не меняется (транзакции хранилища откатывать его не нужно, лишний файл безвреден).
+    """
+
+    def __init__(self, directory, level=6):
+        self.directory = directory
+        self.level = level
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.z")
+
+    def put(self, text):
+        """Сохраняет текст и возвращает его ключ."""
+        data = text.encode("utf-8")
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(zlib.compress(data, self.level))
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key):
+        """Текст по ключу; KeyError, если его нет."""
+        with STORAGE_SECONDS.time("load_text"):
+            try:
+                with open(self._path(key), 'rb') as file:
+                    return zlib.decompress(file.read()).decode("utf-8")
+            except FileNotFoundError:
+                raise KeyError(key)
@@ -0,0 +1,141 @@
+# utils/storage/write_behind.py
+
+import logging
+import threading
+import time
+from utils.metrics import STORAGE_SECONDS
+from utils.storage.base import DocumentStorage, SHARED_KEY
+from utils.storage.locks import ReadWriteLock
+
+logger = logging.getLogger(__name__)
+
+
+def dirty_key(op):
+    if op["op"] == "share":
+        return SHARED_KEY
+    return op["user"]
+
+
+class WriteBehindStorage(DocumentStorage):
+    """
+    Документ живёт в памяти всё время работы процесса. Транзакции лишь отмечают
+    изменённых пользователей как «грязных»; фоновый поток сбрасывает их пачкой
+    раз в flush_interval секунд или после flush_max_mutations изменений.
+    flush_interval <= 0 включает немедленную запись после каждой транзакции.
+    Транзакции держат документ на чтение (данные пользователей защищены их собственными
+    блокировками), сохранение — на запись, так что снимок не застаёт транзакцию посередине.
+    Изменённые поисковые индексы записываются тем же сбросом, перед данными.
+    """
+
+    def __init__(self, flush_interval=5.0, flush_max_mutations=100, search_directory=None):
+        super().__init__(search_directory)
+        self.flush_interval = flush_interval
+        self.flush_max_mutations = flush_max_mutations
+        self._lock = ReadWriteLock()
+        self._state_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._document = None
+        self._dirty = set()
+        self._flushing = set()
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _serialize(self, document, dirty):
+        """Снимок изменённых данных; вызывается под блокировкой."""
+        raise NotImplementedError
+
+    def _write(self, payload):
+        """Запись снимка на диск; вызывается без блокировки документа."""
+        raise NotImplementedError
+
+    def _begin(self):
+        if self._document is None:
+            with self._lock.write():
+                if self._document is None:
+                    with STORAGE_SECONDS.time("load"):
+                        self._document = self._load()
+        self._lock.acquire_read()
+        return self._document
+
+    def _end(self, document):
+        self._lock.release_read()
+        if getattr(self._local, "flush_now", False):
+            self._local.flush_now = False
+            self.flush()
+
+    def _mutate(self, op):
+        # Отмечаем ключ сразу, чтобы кэш не вытеснил изменённые данные до конца транзакции
+        self._dirty.add(dirty_key(op))
+        super()._mutate(op)
+
+    def is_dirty(self, key):
+        """Есть ли у ключа изменения, ещё не записанные на диск."""
+        return key in self._dirty or key in self._flushing
+
+    def _commit(self, document, ops):
+        with self._state_lock:
+            self._pending += len(ops)
+            pending = self._pending
+        if self.flush_interval <= 0:
+            # Сохранение ждёт окончания всех транзакций, поэтому выполняется после текущей
+            self._local.flush_now = True
+            return
+        self._start_flusher()
+        if pending >= self.flush_max_mutations:
+            self._wakeup.set()
+
+    def _start_flusher(self):
+        with self._state_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name="storage-flusher", daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении данных: {e}")
+
+    def flush(self):
+        """Сбрасывает все накопленные изменения на диск (не из транзакции)."""
+        if getattr(self._local, "document", None) is not None:
+            raise RuntimeError("flush() внутри транзакции привёл бы к взаимоблокировке")
+        with self._flush_lock:
+            started = time.perf_counter()
+            with self._lock.write():
+                if not self._dirty and not self._search.has_changes():
+                    return
+                dirty, self._dirty = self._dirty, set()
+                self._flushing = dirty
+                self._pending = 0
+                payload = self._serialize(self._document, dirty) if dirty else None
+                search_payload = self._search.serialize()
+            try:
+                # Индекс пишется первым: после сбоя он может опережать данные, но не отставать
+                self._search.write(search_payload)
+                if payload is not None:
+                    self._write(payload)
+            except BaseException:
+                with self._lock.write():
+                    self._dirty.update(dirty)
+                raise
+            finally:
+                self._flushing = set()
+            STORAGE_SECONDS.observe(time.perf_counter() - started, "flush")
+            logger.debug(f"Сохранено изменений для {len(dirty)} ключей")
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
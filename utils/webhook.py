@@ -0,0 +1,118 @@
+# utils/webhook.py
+
+import hmac
+import json
+import logging
+import queue
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    HTTP-сервер для приёма обновлений от Telegram.
+    Запрос проверяется по секретному токену и кладётся в ограниченную очередь, откуда
+    поток-раздатчик передаёт обновления в process_updates (обычно bot.process_new_updates).
+    При переполненной очереди сервер отвечает 503, и Telegram повторит доставку позже.
+    """
+
+    def __init__(self, process_updates, secret_token, host="0.0.0.0", port=8443, path="/webhook",
+                 queue_size=1000, certificate=None, private_key=None):
+        self.process_updates = process_updates
+        self.secret_token = secret_token
+        self.path = path
+        self._queue = queue.Queue(queue_size)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        if certificate:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certificate, private_key)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self._feeder = threading.Thread(target=self._feed, name="webhook-feeder")
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                # Без верной длины тело не прочитать: rfile.read(-1) ждал бы закрытия соединения
+                if length < 0:
+                    status = 400
+                else:
+                    status = server.accept(self.path, self.headers, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # Строка на каждый запрос: не форматируем её, если DEBUG выключен
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def accept(self, path, headers, body):
+        """Проверяет запрос и ставит обновление в очередь; возвращает HTTP-статус ответа."""
+        if path != self.path:
+            return 404
+        # Сравниваются байты: compare_digest не принимает строки не из ASCII
+        token = headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret_token.encode("utf-8")):
+            logger.warning("Запрос к webhook с неверным секретным токеном")
+            return 403
+        try:
+            update = types.Update.de_json(json.loads(body))
+        except (KeyError, TypeError, ValueError) as e:
+            # Не JSON, не объект или без обязательных полей (update_id)
+            logger.warning(f"Неверное обновление в запросе к webhook: {e!r}")
+            return 400
+        if update is None:
+            # null в теле: None в очереди остановил бы раздатчик
+            return 400
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            logger.warning("Очередь webhook переполнена, обновление отклонено")
+            return 503
+        return 200
+
+    def depth(self):
+        """Сколько принятых обновлений ждёт обработки."""
+        return self._queue.qsize()
+
+    def _feed(self):
+        while True:
+            update = self._queue.get()
+            if update is None:
+                break
+            try:
+                self.process_updates([update])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+
+    def serve_forever(self):
+        """Обслуживает запросы до вызова shutdown() из другого потока."""
+        self._feeder.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._queue.put(None)
+            self._feeder.join()
+
+    def shutdown(self):
+        self._server.shutdown()